@@ -1,16 +1,112 @@
+import time
+
+# cold start timing, reported by /health
+IMPORT_STARTED = time.perf_counter()
+
 from flask import Flask, render_template, jsonify, request, Response
 from chess.game import Game
 from chess.pieces import *
+from chess.bitboard import Position, squareTuple
+from chess.engine import Limit
+from chess.workers import EnginePool
+from chess.book import OpeningBook, bookMove
+from chess.tablebase import Tablebases, RESULT_NAMES
+from chess.sessions import GameStore
+from chess.storage import GameDatabase
+from chess.positions import PositionIndex
+from chess.events import EventBroker
+from chess.hints import HintCache
 from chess.errors import *
-import chess.tests as tests
+import argparse
+import functools
+import io
+import os
+import sys
+import threading
 import unittest
 
-# run tests on app startup
-testSuite = unittest.TestLoader().loadTestsFromModule(tests)
-unittest.TextTestRunner(verbosity=1).run(testSuite)
+IMPORT_SECONDS = time.perf_counter() - IMPORT_STARTED
 
 app = Flask(__name__)
-game = None
+# live games by game id, idle games expire and the least recently used game is dropped at the cap
+MAX_GAMES = int(os.environ.get("CHESS_MAX_GAMES", 1000))
+GAME_TTL_SECONDS = int(os.environ.get("CHESS_GAME_TTL", 30 * 60))
+# games are also written to SQLite after every change, so they survive eviction and restarts
+DATABASE_PATH = os.environ.get("CHESS_DATABASE", "games.db")
+# every saved game is indexed by position in a file of its own, for finding the games reaching a position
+# (python -m chess.positions build games.db positions.db indexes games saved before the index existed)
+POSITIONS_PATH = os.environ.get("CHESS_POSITIONS", "positions.db")
+# seconds the computer opponent may think per request
+ENGINE_TIME_LIMIT = 0.5
+# memory budget of each engine process's transposition table, kept between requests
+ENGINE_TABLE_MEGABYTES = 16
+# engine searches run in worker processes, a search only holds the thread of its own request, so with a
+# threaded server (app.run(threaded=True), gunicorn --worker-class gthread) other requests are served meanwhile
+ENGINE_PROCESSES = int(os.environ.get("CHESS_ENGINE_PROCESSES", os.cpu_count() or 1))
+# optional endgame tables (python -m chess.tablebase generate --pieces 3), the engine scores the
+# positions they cover without searching
+TABLEBASE_PATH = os.environ.get("CHESS_TABLEBASES", "tablebases")
+# optional opening book (python -m chess.book build games.pgn book.bin), memory mapped so every
+# worker process shares one copy, book moves are played without searching
+BOOK_PATH = os.environ.get("CHESS_BOOK", "book.bin")
+
+# services holding files and processes, None until startServices runs (on the first request unless
+# it was called before), so importing this module opens no files and starts no processes
+SERVICES = ("positions", "games", "tablebases", "engine", "book")
+positions = None
+games = None
+tablebases = None
+engine = None
+book = None
+servicesLock = threading.Lock()
+# seconds startServices took, reported by /health
+SERVICES_SECONDS = None
+
+
+# opens the game database, position index, endgame tables and opening book and creates the engine pool
+# tablebasePath and bookPath are optional, None (or a missing path) leaves them out
+def startServices(
+    databasePath=DATABASE_PATH, positionsPath=POSITIONS_PATH, engineProcesses=ENGINE_PROCESSES,
+    tablebasePath=TABLEBASE_PATH, bookPath=BOOK_PATH,
+):
+    global positions, games, tablebases, engine, book, SERVICES_SECONDS
+    start = time.perf_counter()
+    positions = PositionIndex(positionsPath)
+    games = GameStore(MAX_GAMES, GAME_TTL_SECONDS, database=GameDatabase(databasePath, positions=positions))
+    tablebases = Tablebases(tablebasePath) if tablebasePath and os.path.isdir(tablebasePath) else None
+    engine = EnginePool(engineProcesses, ENGINE_TABLE_MEGABYTES, tablebasePath if tablebases else None)
+    book = OpeningBook(bookPath) if bookPath and os.path.exists(bookPath) else None
+    SERVICES_SECONDS = time.perf_counter() - start
+
+
+# shuts the engine pool down and closes the files opened by startServices
+def stopServices():
+    global positions, games, tablebases, engine, book
+    if engine is not None:
+        engine.shutdown()
+    if games is not None:
+        games.database.close()
+    if positions is not None:
+        positions.close()
+    if tablebases is not None:
+        tablebases.close()
+    if book is not None:
+        book.close()
+    positions = games = tablebases = engine = book = None
+
+
+@app.before_request
+def ensureServices():
+    if games is None:
+        with servicesLock:
+            if games is None:
+                startServices()
+
+
+# open event streams by game id, boards are pushed to the page instead of polled
+events = EventBroker()
+# legal move hints by position key, so a click is a dict lookup until the position changes
+hints = HintCache()
 
 
 def get_gameDict(game):
@@ -20,24 +116,74 @@ def get_gameDict(game):
     return gameDict
 
 
-# default route
+# square of the king in check, or "" when the side to move is not in check
+def get_checkSquare(game):
+    # check status and king square come from the position's attack maps
+    if game.position.inCheck(game.position.side):
+        return Square.tupleToString(squareTuple(game.position.kingSquare(game.position.side)))
+    return ""
+
+
+# everything the page shows, sent when an event stream opens
+def get_gameState(game):
+    return {
+        "board": get_gameDict(game),
+        "check": get_checkSquare(game),
+        "outcome": game.outcome,
+        "drawOffered": game.drawOffered,
+        "turn": game.turn,
+    }
+
+
+# pushes the squares a move changed (including castling rooks and en passant captures) to the game's streams
+def publish_move(gameId, game, before):
+    after = get_gameDict(game)
+    changed = {square: icon for square, icon in after.items() if before.get(square) != icon}
+    cleared = [square for square in before if square not in after]
+    events.publish(gameId, "move", {
+        "set": changed,
+        "clear": cleared,
+        "check": get_checkSquare(game),
+        "outcome": game.outcome,
+        "drawOffered": game.drawOffered,
+        "san": game.moveHistory[-1] if game.moveHistory else "",
+    })
+
+
+@app.errorhandler(GameNotFoundError)
+def game_not_found(error):
+    return jsonify({"error": error.message}), 404
+
+
+# default route, resumes ?game=<id> if it is still live and starts a new game otherwise
 @app.route("/")
 def index():
-    global game
-    game = Game(Game.defaultBoard())
-    return render_template("index.html")
+    gameId = request.args.get("game")
+    if gameId is None or gameId not in games:
+        gameId = games.add(Game(Game.defaultBoard()))
+    return render_template("index.html", gameId=gameId)
+
+
+# holds the game's lock for the whole request, for routes that change the game
+def locksGame(view):
+    @functools.wraps(view)
+    def lockedView(gameId):
+        with games.gameLock(gameId):
+            return view(gameId)
+    return lockedView
 
 
 # on square click
-@app.route("/square-clicked", methods=["POST"])
-def process_click():
+@app.route("/game/<gameId>/square-clicked", methods=["POST"])
+@locksGame
+def process_click(gameId):
+    game = games.get(gameId)
     # get data from POST request
     data = request.get_json()
 
     returnData = {"circle": [], "highlight": "", "move": False, "check" : ""}
-    # return which squares to add a circle to or highlight
-    squareLocation = Square.stringtoTuple(data["id"])
-    square = game.board.get(squareLocation)
+    # legal targets of every piece of the side to move, built once per position
+    positionHints = hints.get(game)
 
     # if clicked square is highlighted square
     if data["id"] == data["highlightedSquare"]:
@@ -50,85 +196,230 @@ def process_click():
             hSquare = data["highlightedSquare"]
         elif data["checkHighlightedSquare"] != "":
             hSquare = data["checkHighlightedSquare"]
-        hLocation = Square.stringtoTuple(hSquare)
         # if click is a move
-        print(game.board.get(hLocation).availableMoves(
-            game.board, hLocation[0], hLocation[1]
-        ))
-        if squareLocation in game.board.get(hLocation).availableMoves(
-            game.board, hLocation[0], hLocation[1]
-        ):
+        if data["id"] in positionHints.get(hSquare, []):
             returnData["move"] = True
+            before = get_gameDict(game)
             game.move(
                 Square.stringToDict(hSquare),
                 Square.stringToDict(data["id"]),
             )
-            if Board.scanForCheck(game.board)[game.turn]:
-                for location, piece in game.board.items():
-                    if type(piece) == King and piece.color == game.turn:
-                        print(Square.tupleToString(location))
-                        returnData["check"] = Square.tupleToString(location)
+            # a move declines any open draw offer
+            game.drawOffered = False
+            games.save(gameId)
+            returnData["check"] = get_checkSquare(game)
+            publish_move(gameId, game, before)
             return returnData
 
     # if click is on another friendly piece
+    square = game.board.get(Square.stringtoTuple(data["id"]))
     if square is not None and square.color == game.turn:
-        print("entered")
-        circleList = []
-        for move in square.availableMoves(
-            game.board, squareLocation[0], squareLocation[1]
-        ):
-            if Board.scanForCheck(
-                    Board.executeMove(
-                        Square.tupleToDict(squareLocation),
-                        Square.tupleToDict(move),
-                        game.board.copy(),
-                    )
-                )[game.turn] == False:
-                circleList.append(Square.tupleToString(move))
-        returnData["circle"] = circleList
-        returnData["highlight"] = Square.tupleToString(squareLocation)
+        returnData["circle"] = positionHints.get(data["id"], [])
+        returnData["highlight"] = data["id"]
         return returnData
 
     # if the square is not a move and it is not another friendly piece
-    if square is None or square.color != game.turn:
-        return returnData
+    return returnData
+
+
+# computer plays a move for the side to move
+@app.route("/game/<gameId>/computer-move", methods=["POST"])
+def computer_move(gameId):
+    returnData = {"move": False, "check": "", "from": "", "to": "", "san": "", "book": False}
+    with games.gameLock(gameId):
+        game = games.get(gameId)
+        if game.outcome is not None:
+            return returnData
+        result = bookMove(game, book)
+        if result is None:
+            key = game.position.key
+            search = engine.submit(game, Limit(time=ENGINE_TIME_LIMIT))
+
+    # the game is unlocked while the engine thinks, so resigning or offering a draw is not held up
+    searched = None if result is not None else search.result()
+    with games.gameLock(gameId):
+        if result is None:
+            result = engine.describe(game, key, searched)
+        # the game moved on while the engine was thinking
+        if result is None:
+            return returnData
+        before = get_gameDict(game)
+        game.move(result["a"], result["b"], result["promotionPiece"])
+        game.drawOffered = False
+        games.save(gameId)
+        returnData["move"] = True
+        returnData["from"] = Square.dictToString(result["a"])
+        returnData["to"] = Square.dictToString(result["b"])
+        returnData["san"] = result["san"]
+        returnData["book"] = result.get("book", False)
+        returnData["check"] = get_checkSquare(game)
+        publish_move(gameId, game, before)
+    return returnData
+
+
+# engine evaluation of the current position without playing the move
+@app.route("/game/<gameId>/analysis", methods=["GET"])
+def analysis(gameId):
+    with games.gameLock(gameId):
+        game = games.get(gameId)
+        if game.outcome is not None:
+            return {"outcome": game.outcome}
+        # in book, the book moves are the analysis
+        bookMoves = [] if book is None else game.bookMoves(book)
+        if bookMoves:
+            return {"book": [{"san": san, "weight": weight, "games": count} for san, weight, count in bookMoves]}
+        key = game.position.key
+        search = engine.submit(game, Limit(time=ENGINE_TIME_LIMIT))
 
+    searched = search.result()
+    with games.gameLock(gameId):
+        result = engine.describe(game, key, searched)
+        if result is None:
+            return {"error": "position changed during analysis"}, 409
+        # exact result with perfect play when the endgame tables cover the position
+        probe = None if tablebases is None else tablebases.probe(game.position)
+    returnData = {key: result[key] for key in ("san", "score", "depth", "nodes", "time")}
+    if probe is not None:
+        outcome, dtm = probe
+        returnData["tablebase"] = {"result": RESULT_NAMES[outcome], "dtm": dtm}
     return returnData
 
 
-@app.route("/get-board", methods=["GET"])
-def get_board():
-    return get_gameDict(game)
+# server-sent events for a game, the full state first and then every change as it happens
+# each open stream holds a server thread until it ends (see chess.events.MAX_STREAM_SECONDS)
+@app.route("/game/<gameId>/events", methods=["GET"])
+def game_events(gameId):
+    # subscribed under the game's lock before the state is read, moves publish under the same lock so
+    # every move is either in the initial board or streamed after it
+    with games.gameLock(gameId):
+        game = games.get(gameId)
+        subscriber = events.subscribe(gameId)
+        initial = [("board", get_gameState(game))]
+    return Response(
+        events.stream(gameId, initial, subscriber),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-@app.route("/get-outcome", methods=["GET"])
-def get_outcome():
-    return jsonify(game.outcome)
 
-@app.route("/new-game", methods=["GET"])
-def new_game():
-    global game
+# games that reached a position, ?fen=<fen> or the current position of ?game=<id>
+@app.route("/positions", methods=["GET"])
+def find_positions():
+    limit = request.args.get("limit", 100, type=int)
+    if "game" in request.args:
+        item = games.get(request.args["game"])
+    else:
+        try:
+            item = Position.fromFen(request.args.get("fen", ""))
+        except (ValueError, KeyError, IndexError):
+            return {"error": "invalid FEN"}, 400
+    found = positions.find(item, limit)
+    return {
+        "count": positions.count(item),
+        "games": [{"gameId": gameId, "ply": ply} for gameId, ply in found],
+    }
+
+
+@app.route("/game/<gameId>/get-board", methods=["GET"])
+def get_board(gameId):
+    return get_gameDict(games.get(gameId))
+
+@app.route("/game/<gameId>/get-outcome", methods=["GET"])
+def get_outcome(gameId):
+    return jsonify(games.get(gameId).outcome)
+
+# replaces the game with a new one under a new id
+@app.route("/game/<gameId>/new-game", methods=["GET"])
+def new_game(gameId):
+    games.remove(gameId)
     game = Game(Game.defaultBoard())
-    return get_board()
+    return {"gameId": games.add(game), "board": get_gameDict(game)}
 
-@app.route("/resign", methods=["POST"])
-def resign():
+@app.route("/game/<gameId>/resign", methods=["POST"])
+@locksGame
+def resign(gameId):
+    game = games.get(gameId)
     game.resign()
+    games.save(gameId)
+    events.publish(gameId, "outcome", {"outcome": game.outcome})
     return Response(status=204)
 
-@app.route("/offer-draw", methods=["GET"])
-def offerDraw():
+@app.route("/game/<gameId>/offer-draw", methods=["GET"])
+@locksGame
+def offerDraw(gameId):
+    game = games.get(gameId)
     game.offerDraw()
+    games.save(gameId)
+    events.publish(gameId, "draw", {"drawOffered": game.drawOffered, "outcome": game.outcome})
     return jsonify({"drawOffered" : game.drawOffered})
 
-@app.route("/reset-draw", methods=["GET"])
-def resetDraw():
+@app.route("/game/<gameId>/reset-draw", methods=["GET"])
+@locksGame
+def resetDraw(gameId):
+    game = games.get(gameId)
     game.drawOffered = False
+    events.publish(gameId, "draw", {"drawOffered": False, "outcome": game.outcome})
     return ""
 
 
-@app.route("/flip-board", methods=["GET"])
-def flipBoard():
+@app.route("/game/<gameId>/flip-board", methods=["GET"])
+def flipBoard(gameId):
     pass
 
+# runs the chess.tests suite, the tests are only imported when asked for
+def run_self_test(stream=None):
+    start = time.perf_counter()
+    testSuite = unittest.TestLoader().loadTestsFromName("chess.tests")
+    result = unittest.TextTestRunner(stream=stream or io.StringIO(), verbosity=1).run(testSuite)
+    return {
+        "ok": result.wasSuccessful(),
+        "tests": result.testsRun,
+        "failures": len(result.failures),
+        "errors": len(result.errors),
+        "seconds": time.perf_counter() - start,
+    }
+
+
+# liveness and cold start timing, ?self-test=1 also runs the test suite (takes a few seconds)
+@app.route("/health", methods=["GET"])
+def health():
+    returnData = {
+        "status": "ok",
+        "startup": {
+            "importSeconds": IMPORT_SECONDS,
+            "startupSeconds": STARTUP_SECONDS,
+            "servicesSeconds": SERVICES_SECONDS,
+        },
+        "uptimeSeconds": time.perf_counter() - IMPORT_STARTED,
+        "games": games.stats(),
+        "hints": hints.stats(),
+        "engine": engine.stats(),
+        "book": None if book is None else book.stats(),
+        "tablebases": None if tablebases is None else tablebases.stats(),
+        "events": events.stats(),
+        "positions": positions.stats(),
+    }
+    if request.args.get("self-test"):
+        returnData["selfTest"] = run_self_test()
+        if not returnData["selfTest"]["ok"]:
+            returnData["status"] = "failing"
+            return returnData, 500
+    return returnData
+
+
+# seconds from the first line of this module until the app is ready to serve
+STARTUP_SECONDS = time.perf_counter() - IMPORT_STARTED
+
 if __name__ == "__main__":
-    app.run(debug=True)
+    parser = argparse.ArgumentParser(description="Chess web app")
+    parser.add_argument("--self-test", action="store_true", help="run the test suite and exit")
+    parser.add_argument("--test-on-start", action="store_true", help="run the test suite before serving")
+    args = parser.parse_args()
+    print(f"imported in {IMPORT_SECONDS:.3f}s, ready in {STARTUP_SECONDS:.3f}s")
+    if args.self_test or args.test_on_start:
+        selfTest = run_self_test(sys.stderr)
+        if args.self_test:
+            sys.exit(0 if selfTest["ok"] else 1)
+    startServices()
+    print(f"services started in {SERVICES_SECONDS:.3f}s")
+    app.run(debug=True, threaded=True)
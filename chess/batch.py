@@ -0,0 +1,232 @@
+from chess.bitboard import Position, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, EMPTY
+from chess.bitboard import DIRECTIONS, WHITE
+from chess.engine import SQUARE_VALUES, ENDGAME_KING_VALUES, PIECE_VALUES, ENDGAME_MATERIAL
+from chess.game import Game
+import numpy as np
+
+# Positions are scored this many at a time to bound the memory of the intermediate arrays
+CHUNK_SIZE = 32768
+
+# Centipawns per pseudo legal move, indexed by piece type
+MOBILITY_WEIGHTS = np.array([0, 4, 5, 2, 1, 0], dtype=np.int32)
+# Middlegame king safety, a bonus per own pawn in front of the king and a penalty per
+# attacked square around it
+SHIELD_BONUS = 10
+KING_ZONE_PENALTY = 8
+
+TERMS = ("material", "squares", "mobility", "kingSafety")
+
+# Piece code 12 is an empty square, so a mailbox row can index the tables directly
+EMPTY_CODE = 12
+
+
+def _pieceTables():
+    squareValues = np.zeros((13, 64), dtype=np.int32)
+    material = np.zeros(12, dtype=np.int32)
+    for piece in range(12):
+        side, ptype = divmod(piece, 6)
+        sign = 1 if side == 0 else -1
+        material[piece] = sign * PIECE_VALUES[ptype]
+        # Kings are scored by game phase separately
+        if ptype != KING:
+            squareValues[piece] = np.array(SQUARE_VALUES[piece]) - material[piece]
+    return material, squareValues
+
+
+MATERIAL_VALUES, SQUARE_TABLE = _pieceTables()
+PHASE_VALUES = np.array(
+    [PIECE_VALUES[piece % 6] if piece % 6 not in (PAWN, KING) else 0 for piece in range(12)], dtype=np.int32
+)
+MIDDLEGAME_KING_TABLE = np.array([SQUARE_VALUES[KING], SQUARE_VALUES[6 + KING]], dtype=np.int32)
+ENDGAME_KING_TABLE = np.array(ENDGAME_KING_VALUES, dtype=np.int32)
+
+NOT_FILE_A = np.uint64(0xFEFEFEFEFEFEFEFE)
+NOT_FILE_H = np.uint64(0x7F7F7F7F7F7F7F7F)
+NOT_FILES_AB = np.uint64(0xFCFCFCFCFCFCFCFC)
+NOT_FILES_GH = np.uint64(0x3F3F3F3F3F3F3F3F)
+
+
+# Moves every bit of an (N,) uint64 array of bitboards by (rows, cols), bits leaving the board are dropped
+def shift(bitboards, rows, cols):
+    amount = rows * 8 + cols
+    if amount > 0:
+        bitboards = bitboards << np.uint64(amount)
+    elif amount < 0:
+        bitboards = bitboards >> np.uint64(-amount)
+    if cols == 1:
+        bitboards = bitboards & NOT_FILE_A
+    elif cols == 2:
+        bitboards = bitboards & NOT_FILES_AB
+    elif cols == -1:
+        bitboards = bitboards & NOT_FILE_H
+    elif cols == -2:
+        bitboards = bitboards & NOT_FILES_GH
+    return bitboards
+
+
+if hasattr(np, "bitwise_count"):
+    def popcount(bitboards):
+        return np.bitwise_count(bitboards).astype(np.int32)
+else:
+    BYTE_COUNTS = np.array([bin(byte).count("1") for byte in range(256)], dtype=np.int32)
+
+    def popcount(bitboards):
+        return BYTE_COUNTS[bitboards.view(np.uint8).reshape(-1, 8)].sum(axis=1, dtype=np.int32)
+
+
+KNIGHT_STEPS = [(2, 1), (-2, 1), (2, -1), (-2, -1), (1, 2), (-1, 2), (1, -2), (-1, -2)]
+KING_STEPS = [(1, 0), (1, 1), (1, -1), (0, 1), (0, -1), (-1, 0), (-1, 1), (-1, -1)]
+ROOK_DIRECTIONS = [(dr, dc) for dr, dc in DIRECTIONS if dr == 0 or dc == 0]
+BISHOP_DIRECTIONS = [(dr, dc) for dr, dc in DIRECTIONS if dr != 0 and dc != 0]
+
+
+# Accepts a Position, a Game, a FEN string or a dict board (white to move)
+def toPosition(item):
+    if isinstance(item, Position):
+        return item
+    if isinstance(item, Game):
+        return item.position
+    if isinstance(item, str):
+        return Position.fromFen(item)
+    return Position.fromBoard(item)
+
+
+# Packs positions into an (N, 64) int8 array of piece codes (-1 empty, a1 first) and an (N,) int8
+# array of the side to move (0 white, 1 black)
+def packPositions(items):
+    positions = [toPosition(item) for item in items]
+    mailboxes = np.array([position.mailbox for position in positions], dtype=np.int8).reshape(-1, 64)
+    sides = np.array([position.side for position in positions], dtype=np.int8)
+    return mailboxes, sides
+
+
+# Packs dict boards ({(row, col): Piece}) straight into piece codes, turn is "white" or "black"
+def packBoards(boards, turn=WHITE):
+    return packPositions(Position.fromBoard(board, turn) for board in boards)
+
+
+# One hot (N, 12, 64) planes of the packed piece codes
+def toPlanes(mailboxes):
+    return (mailboxes[:, None, :] == np.arange(12, dtype=np.int8)[None, :, None])
+
+
+# (N, 12) uint64 bitboards of the packed piece codes, bit 0 is a1 like Position.bitboards
+def toBitboards(mailboxes):
+    bits = np.packbits(toPlanes(mailboxes), axis=-1, bitorder="little")
+    return np.ascontiguousarray(bits).view("<u8").reshape(len(mailboxes), 12).astype(np.uint64)
+
+
+# Sum of the pseudo legal moves of every piece in pieces along the given directions, and the squares
+# they attack, rays of different pieces never meet at the same step so popcounts add up per piece
+def _slide(pieces, empty, notOwn, directions):
+    count = np.zeros(len(pieces), dtype=np.int32)
+    attacked = np.zeros(len(pieces), dtype=np.uint64)
+    for dr, dc in directions:
+        frontier = pieces
+        for _ in range(7):
+            frontier = shift(frontier, dr, dc)
+            if not frontier.any():
+                break
+            attacked |= frontier
+            count += popcount(frontier & notOwn)
+            frontier = frontier & empty
+    return count, attacked
+
+
+# Scores one chunk, all terms are in centipawns from white's point of view
+def _evaluateChunk(mailboxes):
+    codes = np.where(mailboxes == EMPTY, EMPTY_CODE, mailboxes).astype(np.intp)
+    bitboards = toBitboards(mailboxes)
+    counts = popcount(bitboards.reshape(-1)).reshape(-1, 12)
+    terms = {
+        "material": counts @ MATERIAL_VALUES,
+        "squares": SQUARE_TABLE[codes, np.arange(64)].sum(axis=1, dtype=np.int32),
+    }
+    # Non pawn material of both sides decides the game phase
+    endgame = counts @ PHASE_VALUES <= ENDGAME_MATERIAL
+
+    occupied = np.bitwise_or.reduce(bitboards, axis=1)
+    empty = ~occupied
+    mobility = np.zeros(len(mailboxes), dtype=np.int32)
+    attacks = []
+    for side in (0, 1):
+        base = side * 6
+        notOwn = ~np.bitwise_or.reduce(bitboards[:, base:base + 6], axis=1)
+        sideMobility = np.zeros(len(mailboxes), dtype=np.int32)
+        sideAttacks = np.zeros(len(mailboxes), dtype=np.uint64)
+
+        knights = bitboards[:, base + KNIGHT]
+        for dr, dc in KNIGHT_STEPS:
+            targets = shift(knights, dr, dc)
+            sideAttacks |= targets
+            sideMobility += MOBILITY_WEIGHTS[KNIGHT] * popcount(targets & notOwn)
+        forward = 1 if side == 0 else -1
+        pawns = bitboards[:, base + PAWN]
+        sideAttacks |= shift(pawns, forward, 1) | shift(pawns, forward, -1)
+        kings = bitboards[:, base + KING]
+        for dr, dc in KING_STEPS:
+            sideAttacks |= shift(kings, dr, dc)
+
+        queens = bitboards[:, base + QUEEN]
+        for ptype, directions in ((BISHOP, BISHOP_DIRECTIONS), (ROOK, ROOK_DIRECTIONS)):
+            for pieces, weight in ((bitboards[:, base + ptype], MOBILITY_WEIGHTS[ptype]),
+                                   (queens, MOBILITY_WEIGHTS[QUEEN])):
+                moves, attacked = _slide(pieces, empty, notOwn, directions)
+                sideMobility += weight * moves
+                sideAttacks |= attacked
+
+        mobility += sideMobility if side == 0 else -sideMobility
+        attacks.append(sideAttacks)
+
+    safety = np.zeros(len(mailboxes), dtype=np.int32)
+    kingSquares = np.zeros(len(mailboxes), dtype=np.int32)
+    for side in (0, 1):
+        kings = bitboards[:, side * 6 + KING]
+        forward = 1 if side == 0 else -1
+        # One and two ranks in front of the king, on its file and the files next to it
+        front = shift(kings, forward, 0)
+        front = front | shift(front, 0, 1) | shift(front, 0, -1)
+        front = front | shift(front, forward, 0)
+        shield = popcount(front & bitboards[:, side * 6 + PAWN])
+        zone = kings
+        for dr, dc in KING_STEPS:
+            zone = zone | shift(kings, dr, dc)
+        pressure = popcount(zone & attacks[side ^ 1])
+        sideSafety = np.where(endgame, 0, SHIELD_BONUS * shield - KING_ZONE_PENALTY * pressure)
+        safety += sideSafety if side == 0 else -sideSafety
+
+        # Kings use the endgame table once the non pawn material is gone
+        kingSquare = np.argmax(codes == side * 6 + KING, axis=1)
+        hasKing = counts[:, side * 6 + KING] > 0
+        kingValues = np.where(
+            endgame, ENDGAME_KING_TABLE[side][kingSquare], MIDDLEGAME_KING_TABLE[side][kingSquare]
+        )
+        kingSquares += np.where(hasKing, kingValues, 0)
+
+    terms["squares"] += kingSquares
+    terms["mobility"] = mobility
+    terms["kingSafety"] = safety.astype(np.int32)
+    return terms
+
+
+# Scores every term of packed positions, returns {term: (N,) int32 array}, from white's point of view
+# material plus squares is exactly engine.evaluate, mobility and king safety are estimates on top
+def evaluateTerms(mailboxes):
+    mailboxes = np.asarray(mailboxes, dtype=np.int8).reshape(-1, 64)
+    chunks = [_evaluateChunk(mailboxes[start:start + CHUNK_SIZE])
+              for start in range(0, len(mailboxes), CHUNK_SIZE)]
+    if not chunks:
+        return {term: np.zeros(0, dtype=np.int32) for term in TERMS}
+    return {term: np.concatenate([chunk[term] for chunk in chunks]) for term in TERMS}
+
+
+# Total score of packed positions from the side to move's point of view, like engine.evaluate
+def evaluateBatch(mailboxes, sides):
+    terms = evaluateTerms(mailboxes)
+    total = sum(terms[term] for term in TERMS)
+    return np.where(np.asarray(sides) == 0, total, -total).astype(np.int32)
+
+
+# Scores Positions, Games, FEN strings or dict boards in one call
+def evaluatePositions(items):
+    return evaluateBatch(*packPositions(items))
@@ -0,0 +1,768 @@
+from chess.pieces import Pawn, Rook, Knight, Bishop, Queen, King
+from chess.pieces import WHITE, BLACK
+import itertools
+import random
+
+COLORS = (WHITE, BLACK)
+COLOR_INDEX = {WHITE: 0, BLACK: 1}
+
+# Piece types, a piece code on the mailbox is color * 6 + type
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(6)
+EMPTY = -1
+PIECE_TYPES = {Pawn: PAWN, Knight: KNIGHT, Bishop: BISHOP, Rook: ROOK, Queen: QUEEN, King: KING}
+PIECE_CLASSES = {ptype: cls for cls, ptype in PIECE_TYPES.items()}
+
+FILES = "abcdefgh"
+PIECE_LETTERS = "pnbrqk"
+# FEN letters to piece codes, upper case is white
+FEN_PIECES = {letter: ptype for ptype, letter in enumerate(PIECE_LETTERS)}
+FEN_PIECES.update({letter.upper(): ptype for ptype, letter in enumerate(PIECE_LETTERS)})
+FEN_PIECES = {letter: (6 if letter.islower() else 0) + ptype for letter, ptype in FEN_PIECES.items()}
+FEN_LETTERS = {code: letter for letter, code in FEN_PIECES.items()}
+FEN_SQUARES = {"-": -1}
+FEN_SQUARES.update({FILES[sq & 7] + str((sq >> 3) + 1): sq for sq in range(64)})
+STARTING_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+# Castling rights bits
+WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE = 1, 2, 4, 8
+
+
+# Squares are indexed 0..63 as row * 8 + col, so a1 is 0 and h8 is 63
+def squareIndex(r, c):
+    return r * 8 + c
+
+
+def squareTuple(sq):
+    return (sq >> 3, sq & 7)
+
+
+# Moves are encoded as from | to << 6 | promotion type << 12 (0 if no promotion)
+def encodeMove(fromSq, toSq, promotion=0):
+    return fromSq | (toSq << 6) | (promotion << 12)
+
+
+def moveFrom(move):
+    return move & 63
+
+
+def moveTo(move):
+    return (move >> 6) & 63
+
+
+def movePromotion(move):
+    return move >> 12
+
+
+# Returns the move in coordinate notation, e.g. "e2e4" or "e7e8q"
+def moveToString(move):
+    fromSq, toSq, promotion = move & 63, (move >> 6) & 63, move >> 12
+    string = FILES[fromSq & 7] + str((fromSq >> 3) + 1) + FILES[toSq & 7] + str((toSq >> 3) + 1)
+    if promotion:
+        string += PIECE_LETTERS[promotion]
+    return string
+
+
+def squares(bitboard):
+    while bitboard:
+        lsb = bitboard & -bitboard
+        yield lsb.bit_length() - 1
+        bitboard ^= lsb
+
+
+def _stepTable(steps):
+    table = []
+    for sq in range(64):
+        r, c = squareTuple(sq)
+        mask = 0
+        for dr, dc in steps:
+            if 0 <= r + dr < 8 and 0 <= c + dc < 8:
+                mask |= 1 << squareIndex(r + dr, c + dc)
+        table.append(mask)
+    return table
+
+
+KNIGHT_ATTACKS = _stepTable([(2, 1), (-2, 1), (2, -1), (-2, -1), (1, 2), (-1, 2), (1, -2), (-1, -2)])
+KING_ATTACKS = _stepTable([(1, 0), (1, 1), (1, -1), (0, 1), (0, -1), (-1, 0), (-1, 1), (-1, -1)])
+PAWN_ATTACKS = [_stepTable([(1, -1), (1, 1)]), _stepTable([(-1, -1), (-1, 1)])]
+
+# Ray directions, the first four increase the square index and the last four decrease it
+DIRECTIONS = [(1, 0), (0, 1), (1, 1), (1, -1), (-1, 0), (0, -1), (-1, -1), (-1, 1)]
+ROOK_DIRECTIONS = (0, 1, 4, 5)
+BISHOP_DIRECTIONS = (2, 3, 6, 7)
+
+
+def _rayTable(dr, dc):
+    table = []
+    for sq in range(64):
+        r, c = squareTuple(sq)
+        mask = 0
+        r, c = r + dr, c + dc
+        while 0 <= r < 8 and 0 <= c < 8:
+            mask |= 1 << squareIndex(r, c)
+            r, c = r + dr, c + dc
+        table.append(mask)
+    return table
+
+
+RAYS = [_rayTable(dr, dc) for dr, dc in DIRECTIONS]
+FULL = (1 << 64) - 1
+NOT_FILE_A = FULL ^ 0x0101010101010101
+NOT_FILE_H = FULL ^ 0x8080808080808080
+
+
+# Squares strictly between two squares on a shared rank, file or diagonal (0 otherwise)
+def _betweenTable():
+    table = [[0] * 64 for _ in range(64)]
+    for sq in range(64):
+        for d in range(8):
+            for target in squares(RAYS[d][sq]):
+                table[sq][target] = RAYS[d][sq] ^ RAYS[d][target] ^ (1 << target)
+    return table
+
+
+# Returns the attacked squares along the given directions, stopping at (and including) the first blocker
+def slidingAttacks(sq, occupied, directions):
+    attacks = 0
+    for d in directions:
+        ray = RAYS[d][sq]
+        blockers = ray & occupied
+        if blockers:
+            if d < 4:
+                blocker = (blockers & -blockers).bit_length() - 1
+            else:
+                blocker = blockers.bit_length() - 1
+            ray ^= RAYS[d][blocker]
+        attacks |= ray
+    return attacks
+
+
+def rookAttacks(sq, occupied):
+    return slidingAttacks(sq, occupied, ROOK_DIRECTIONS)
+
+
+def bishopAttacks(sq, occupied):
+    return slidingAttacks(sq, occupied, BISHOP_DIRECTIONS)
+
+
+BETWEEN = _betweenTable()
+
+# Castling fields to rights bits, covering every ordering a FEN writer could use
+FEN_CASTLING = {"-": 0}
+for _rights in range(1, 16):
+    _letters = [char for char, right in zip("KQkq", (1, 2, 4, 8)) if _rights & right]
+    for _ordering in itertools.permutations(_letters):
+        FEN_CASTLING["".join(_ordering)] = _rights
+
+# Castling rights that survive a move touching each square
+CASTLING_MASK = [15] * 64
+CASTLING_MASK[squareIndex(0, 4)] = 15 & ~(WHITE_KINGSIDE | WHITE_QUEENSIDE)
+CASTLING_MASK[squareIndex(0, 0)] = 15 & ~WHITE_QUEENSIDE
+CASTLING_MASK[squareIndex(0, 7)] = 15 & ~WHITE_KINGSIDE
+CASTLING_MASK[squareIndex(7, 4)] = 15 & ~(BLACK_KINGSIDE | BLACK_QUEENSIDE)
+CASTLING_MASK[squareIndex(7, 0)] = 15 & ~BLACK_QUEENSIDE
+CASTLING_MASK[squareIndex(7, 7)] = 15 & ~BLACK_KINGSIDE
+
+# Zobrist keys, seeded so position keys stay stable across processes and runs
+_zobristRandom = random.Random(20230917)
+ZOBRIST_PIECES = [[_zobristRandom.getrandbits(64) for _ in range(64)] for _ in range(12)]
+ZOBRIST_CASTLING = [_zobristRandom.getrandbits(64) for _ in range(16)]
+ZOBRIST_EN_PASSANT = [_zobristRandom.getrandbits(64) for _ in range(8)]
+ZOBRIST_SIDE = _zobristRandom.getrandbits(64)
+
+# Cache of parsed FEN ranks: rank string -> (mailbox cells, [(piece, rank bits)], key per row)
+_FEN_RANKS = {}
+_FEN_RANKS_LIMIT = 200000
+
+
+def _parseFenRank(rank):
+    cells = []
+    bits = {}
+    for char in rank:
+        if char.isdigit():
+            cells += [EMPTY] * int(char)
+        elif char in FEN_PIECES:
+            piece = FEN_PIECES[char]
+            bits[piece] = bits.get(piece, 0) | 1 << len(cells)
+            cells.append(piece)
+        else:
+            raise ValueError(f'Invalid FEN rank: "{rank}"')
+    if len(cells) != 8:
+        raise ValueError(f'Invalid FEN rank: "{rank}"')
+    rankKeys = []
+    for row in range(8):
+        key = 0
+        for col, piece in enumerate(cells):
+            if piece != EMPTY:
+                key ^= ZOBRIST_PIECES[piece][row * 8 + col]
+        rankKeys.append(key)
+    parsed = (cells, list(bits.items()), rankKeys)
+    if len(_FEN_RANKS) < _FEN_RANKS_LIMIT:
+        _FEN_RANKS[rank] = parsed
+    return parsed
+
+
+class Position:
+    def __init__(self) -> None:
+        # One bitboard per color and piece type, indexed by piece code
+        self.bitboards = [0] * 12
+        self.occupancy = [0, 0]
+        self.mailbox = [EMPTY] * 64
+        self.side = 0
+        self.castling = 0
+        self.epSquare = -1
+        self.halfmoveClock = 0
+        self.fullmoveNumber = 1
+        # Zobrist key covering pieces, side to move, castling rights and en passant file
+        self.key = ZOBRIST_CASTLING[0]
+        # Squares attacked by each side, computed on first use after a move (None until then) and
+        # restored by unmake_move, nodes that never look at a side's attacks never pay for them
+        self.attackMaps = [None, None]
+        # Undo records pushed by make_move and popped by unmake_move
+        self.history = []
+
+    @property
+    def turn(self):
+        return COLORS[self.side]
+
+    @property
+    def occupied(self):
+        return self.occupancy[0] | self.occupancy[1]
+
+    def copy(self):
+        position = Position.__new__(Position)
+        position.bitboards = self.bitboards.copy()
+        position.occupancy = self.occupancy.copy()
+        position.mailbox = self.mailbox.copy()
+        position.side = self.side
+        position.castling = self.castling
+        position.epSquare = self.epSquare
+        position.halfmoveClock = self.halfmoveClock
+        position.fullmoveNumber = self.fullmoveNumber
+        position.key = self.key
+        position.attackMaps = self.attackMaps.copy()
+        position.history = self.history.copy()
+        return position
+
+    def putPiece(self, piece, sq):
+        bit = 1 << sq
+        self.bitboards[piece] |= bit
+        self.occupancy[piece // 6] |= bit
+        self.mailbox[sq] = piece
+        self.key ^= ZOBRIST_PIECES[piece][sq]
+
+    def removePiece(self, sq):
+        piece = self.mailbox[sq]
+        bit = 1 << sq
+        self.bitboards[piece] ^= bit
+        self.occupancy[piece // 6] ^= bit
+        self.mailbox[sq] = EMPTY
+        self.key ^= ZOBRIST_PIECES[piece][sq]
+        return piece
+
+    # Recomputes the Zobrist key from scratch, make_move keeps self.key up to date incrementally
+    def computeKey(self):
+        key = ZOBRIST_CASTLING[self.castling]
+        for sq, piece in enumerate(self.mailbox):
+            if piece != EMPTY:
+                key ^= ZOBRIST_PIECES[piece][sq]
+        if self.epSquare != -1:
+            key ^= ZOBRIST_EN_PASSANT[self.epSquare & 7]
+        if self.side == 1:
+            key ^= ZOBRIST_SIDE
+        return key
+
+    # Builds a position from a FEN string
+    # Rank strings are parsed once and cached, since analysis sets repeat them heavily
+    @staticmethod
+    def fromFen(fen):
+        fields = fen.split()
+        ranks = fields[0].split("/")
+        if len(ranks) != 8:
+            raise ValueError(f'Invalid FEN: "{fen}"')
+        position = Position.__new__(Position)
+        bitboards = [0] * 12
+        mailbox = []
+        key = 0
+        for row in range(8):
+            parsed = _FEN_RANKS.get(ranks[7 - row])
+            if parsed is None:
+                parsed = _parseFenRank(ranks[7 - row])
+            cells, rankBitboards, rankKeys = parsed
+            mailbox += cells
+            shift = row * 8
+            for piece, bits in rankBitboards:
+                bitboards[piece] |= bits << shift
+            key ^= rankKeys[row]
+
+        position.bitboards = bitboards
+        position.mailbox = mailbox
+        position.occupancy = [
+            bitboards[0] | bitboards[1] | bitboards[2] | bitboards[3] | bitboards[4] | bitboards[5],
+            bitboards[6] | bitboards[7] | bitboards[8] | bitboards[9] | bitboards[10] | bitboards[11],
+        ]
+        count = len(fields)
+        position.side = 1 if count > 1 and fields[1] == "b" else 0
+        position.castling = FEN_CASTLING[fields[2]] if count > 2 else 0
+        epSquare = FEN_SQUARES[fields[3]] if count > 3 else -1
+        # Kept only when a pawn of the side to move can capture there, like make_move records it,
+        # so the key of a FEN matches the key of the same position reached by moves
+        if epSquare != -1 and not PAWN_ATTACKS[position.side ^ 1][epSquare] & bitboards[position.side * 6 + PAWN]:
+            epSquare = -1
+        position.epSquare = epSquare
+        position.halfmoveClock = int(fields[4]) if count > 4 else 0
+        position.fullmoveNumber = int(fields[5]) if count > 5 else 1
+
+        key ^= ZOBRIST_CASTLING[position.castling]
+        if position.epSquare != -1:
+            key ^= ZOBRIST_EN_PASSANT[position.epSquare & 7]
+        if position.side:
+            key ^= ZOBRIST_SIDE
+        position.key = key
+        position.history = []
+        position.updateAttacks()
+        return position
+
+    # Returns the FEN string of the position
+    def toFen(self):
+        rows = []
+        mailbox = self.mailbox
+        for row in range(7, -1, -1):
+            rowString = ""
+            empty = 0
+            for piece in mailbox[row * 8 : row * 8 + 8]:
+                if piece == EMPTY:
+                    empty += 1
+                    continue
+                if empty:
+                    rowString += str(empty)
+                    empty = 0
+                rowString += FEN_LETTERS[piece]
+            if empty:
+                rowString += str(empty)
+            rows.append(rowString)
+        castling = "".join(
+            char for char, right in zip("KQkq", (1, 2, 4, 8)) if self.castling & right
+        )
+        epSquare = "-" if self.epSquare == -1 else FILES[self.epSquare & 7] + str((self.epSquare >> 3) + 1)
+        return " ".join(
+            [
+                "/".join(rows),
+                "w" if self.side == 0 else "b",
+                castling or "-",
+                epSquare,
+                str(self.halfmoveClock),
+                str(self.fullmoveNumber),
+            ]
+        )
+
+    # Builds a position from a dict board in the format {(row, col): Piece}
+    # Castling rights default to every king and rook still on its home square, en passant to none
+    @staticmethod
+    def fromBoard(board, turn=WHITE, castling=None, epSquare=-1):
+        position = Position()
+        position.side = COLOR_INDEX[turn]
+        for (r, c), piece in board.items():
+            position.putPiece(
+                COLOR_INDEX[piece.color] * 6 + PIECE_TYPES[type(piece)], squareIndex(r, c)
+            )
+
+        if castling is None:
+            castling = 0
+            for color, row, kingside, queenside in [
+                (WHITE, 0, WHITE_KINGSIDE, WHITE_QUEENSIDE),
+                (BLACK, 7, BLACK_KINGSIDE, BLACK_QUEENSIDE),
+            ]:
+                if board.get((row, 4)) is not King(color):
+                    continue
+                for col, right in [(7, kingside), (0, queenside)]:
+                    if board.get((row, col)) is Rook(color):
+                        castling |= right
+        position.castling = castling
+        position.epSquare = epSquare
+        position.key = position.computeKey()
+        position.updateAttacks()
+        return position
+
+    # Converts the position into a dict board of the shared piece instances
+    # Castling rights and the en passant square stay with the position
+    def toBoard(self):
+        board = {}
+        for sq, piece in enumerate(self.mailbox):
+            if piece != EMPTY:
+                board[squareTuple(sq)] = PIECE_CLASSES[piece % 6](COLORS[piece // 6])
+        return board
+
+    def kingSquare(self, side):
+        king = self.bitboards[side * 6 + KING]
+        if not king:
+            return -1
+        return king.bit_length() - 1
+
+    # Returns every square attacked by side
+    def attacksBy(self, side, occupied=None):
+        if occupied is None:
+            occupied = self.occupancy[0] | self.occupancy[1]
+        bitboards = self.bitboards
+        base = side * 6
+        pawns = bitboards[base + PAWN]
+        if side == 0:
+            attacks = ((pawns << 7) & NOT_FILE_H | (pawns << 9) & NOT_FILE_A) & FULL
+        else:
+            attacks = (pawns >> 9) & NOT_FILE_H | (pawns >> 7) & NOT_FILE_A
+        for sq in squares(bitboards[base + KNIGHT]):
+            attacks |= KNIGHT_ATTACKS[sq]
+        for sq in squares(bitboards[base + KING]):
+            attacks |= KING_ATTACKS[sq]
+        queens = bitboards[base + QUEEN]
+        for sq in squares(bitboards[base + BISHOP] | queens):
+            attacks |= bishopAttacks(sq, occupied)
+        for sq in squares(bitboards[base + ROOK] | queens):
+            attacks |= rookAttacks(sq, occupied)
+        return attacks
+
+    # Drops the attack maps after the pieces changed, they are recomputed when next used
+    def updateAttacks(self):
+        self.attackMaps = [None, None]
+
+    # Squares attacked by side, cached until the position changes
+    def attackMap(self, side):
+        attacks = self.attackMaps[side]
+        if attacks is None:
+            attacks = self.attackMaps[side] = self.attacksBy(side)
+        return attacks
+
+    @property
+    def attacks(self):
+        return [self.attackMap(0), self.attackMap(1)]
+
+    # Checks if square sq is attacked by any piece belonging to side
+    # Uses the attack maps unless a different occupancy is given (for x-ray checks)
+    def isSquareAttacked(self, sq, side, occupied=None):
+        if occupied is None:
+            return self.attackMap(side) >> sq & 1 == 1
+        bitboards = self.bitboards
+        base = side * 6
+        if PAWN_ATTACKS[side ^ 1][sq] & bitboards[base + PAWN]:
+            return True
+        if KNIGHT_ATTACKS[sq] & bitboards[base + KNIGHT]:
+            return True
+        if KING_ATTACKS[sq] & bitboards[base + KING]:
+            return True
+        queens = bitboards[base + QUEEN]
+        bishops = bitboards[base + BISHOP] | queens
+        if bishops and bishopAttacks(sq, occupied) & bishops:
+            return True
+        rooks = bitboards[base + ROOK] | queens
+        if rooks and rookAttacks(sq, occupied) & rooks:
+            return True
+        return False
+
+    # Positions without a king (used in testing) are never in check
+    def inCheck(self, side):
+        return self.attackMap(side ^ 1) & self.bitboards[side * 6 + KING] != 0
+
+    # Returns a dictionary that determines each colors check status
+    def checkStatus(self):
+        return {WHITE: self.inCheck(0), BLACK: self.inCheck(1)}
+
+    # Returns a bitboard of the pieces belonging to side that attack square sq
+    def attackersOf(self, sq, side, occupied=None):
+        if occupied is None:
+            occupied = self.occupancy[0] | self.occupancy[1]
+        bitboards = self.bitboards
+        base = side * 6
+        queens = bitboards[base + QUEEN]
+        return (
+            (PAWN_ATTACKS[side ^ 1][sq] & bitboards[base + PAWN])
+            | (KNIGHT_ATTACKS[sq] & bitboards[base + KNIGHT])
+            | (KING_ATTACKS[sq] & bitboards[base + KING])
+            | (bishopAttacks(sq, occupied) & (bitboards[base + BISHOP] | queens))
+            | (rookAttacks(sq, occupied) & (bitboards[base + ROOK] | queens))
+        )
+
+    # Returns {square: mask} for pieces of side pinned to their king, the mask is the line they may move along
+    def pinMasks(self, side):
+        pins = {}
+        king = self.kingSquare(side)
+        if king == -1:
+            return pins
+        own = self.occupancy[side]
+        occupied = self.occupancy[0] | self.occupancy[1]
+        base = (side ^ 1) * 6
+        queens = self.bitboards[base + QUEEN]
+        rooks = self.bitboards[base + ROOK] | queens
+        bishops = self.bitboards[base + BISHOP] | queens
+        for d in range(8):
+            ray = RAYS[d][king]
+            sliders = (rooks if d in ROOK_DIRECTIONS else bishops) & ray
+            if not sliders:
+                continue
+            blockers = ray & occupied
+            if d < 4:
+                first = (blockers & -blockers).bit_length() - 1
+            else:
+                first = blockers.bit_length() - 1
+            if not own >> first & 1:
+                continue
+            blockers ^= 1 << first
+            if not blockers:
+                continue
+            if d < 4:
+                second = (blockers & -blockers).bit_length() - 1
+            else:
+                second = blockers.bit_length() - 1
+            if sliders >> second & 1:
+                pins[first] = ray ^ RAYS[d][second]
+        return pins
+
+    # Returns moves for the side to move that may still leave its own king in check
+    def pseudoLegalMoves(self):
+        return self.generateMoves()
+
+    # Generates moves for the side to move
+    # Non king moves are limited to targetMask, pinned pieces to their pin line and king steps to kingMask
+    def generateMoves(self, targetMask=FULL, pinMasks=None, kingMask=FULL, verifyEnPassant=False):
+        moves = []
+        side = self.side
+        base = side * 6
+        bitboards = self.bitboards
+        own = self.occupancy[side]
+        enemy = self.occupancy[side ^ 1]
+        occupied = own | enemy
+        empty = ~occupied
+        if pinMasks is None:
+            pinMasks = {}
+
+        # Pawns
+        forward = 8 if side == 0 else -8
+        startRow, lastRow = (1, 7) if side == 0 else (6, 0)
+        epBit = 0 if self.epSquare == -1 else 1 << self.epSquare
+        for sq in squares(bitboards[base + PAWN]):
+            destinations = PAWN_ATTACKS[side][sq] & enemy
+            one = sq + forward
+            if 0 <= one < 64 and empty >> one & 1:
+                destinations |= 1 << one
+                two = one + forward
+                if sq >> 3 == startRow and empty >> two & 1:
+                    destinations |= 1 << two
+            pin = pinMasks.get(sq, FULL)
+            destinations &= targetMask & pin
+            for to in squares(destinations):
+                if to >> 3 == lastRow:
+                    for promotion in (QUEEN, ROOK, BISHOP, KNIGHT):
+                        moves.append(sq | (to << 6) | (promotion << 12))
+                else:
+                    moves.append(sq | (to << 6))
+            # En passant can expose the king along the rank, so it is verified by playing it
+            if PAWN_ATTACKS[side][sq] & epBit & pin:
+                move = sq | (self.epSquare << 6)
+                if verifyEnPassant:
+                    self.make_move(move)
+                    exposed = self.inCheck(side)
+                    self.unmake_move()
+                    if exposed:
+                        continue
+                moves.append(move)
+
+        # Pieces
+        notOwn = ~own & targetMask
+        for sq in squares(bitboards[base + KNIGHT]):
+            if sq in pinMasks:
+                continue
+            for to in squares(KNIGHT_ATTACKS[sq] & notOwn):
+                moves.append(sq | (to << 6))
+        for sq in squares(bitboards[base + BISHOP]):
+            for to in squares(bishopAttacks(sq, occupied) & notOwn & pinMasks.get(sq, FULL)):
+                moves.append(sq | (to << 6))
+        for sq in squares(bitboards[base + ROOK]):
+            for to in squares(rookAttacks(sq, occupied) & notOwn & pinMasks.get(sq, FULL)):
+                moves.append(sq | (to << 6))
+        for sq in squares(bitboards[base + QUEEN]):
+            for to in squares(
+                (rookAttacks(sq, occupied) | bishopAttacks(sq, occupied))
+                & notOwn
+                & pinMasks.get(sq, FULL)
+            ):
+                moves.append(sq | (to << 6))
+        for sq in squares(bitboards[base + KING]):
+            for to in squares(KING_ATTACKS[sq] & ~own & kingMask):
+                moves.append(sq | (to << 6))
+        moves.extend(self.castlingMoves())
+        return moves
+
+    # Castling through, out of or into check is never generated
+    def castlingMoves(self):
+        moves = []
+        side = self.side
+        rights = self.castling & (3 if side == 0 else 12)
+        if not rights:
+            return moves
+        king = 4 if side == 0 else 60
+        attacked = self.attackMap(side ^ 1)
+        if self.mailbox[king] != side * 6 + KING or attacked >> king & 1:
+            return moves
+        occupied = self.occupancy[0] | self.occupancy[1]
+        kingside = WHITE_KINGSIDE if side == 0 else BLACK_KINGSIDE
+        queenside = WHITE_QUEENSIDE if side == 0 else BLACK_QUEENSIDE
+        if (
+            rights & kingside
+            and not occupied & (0b11 << (king + 1))
+            and not attacked & (0b11 << (king + 1))
+        ):
+            moves.append(king | ((king + 2) << 6))
+        if (
+            rights & queenside
+            and not occupied & (0b111 << (king - 3))
+            and not attacked & (0b11 << (king - 2))
+        ):
+            moves.append(king | ((king - 2) << 6))
+        return moves
+
+    # Plays a move on the position in place, pushing an undo record onto self.history
+    # The record is (move, captured piece, captured square, castling, en passant square, halfmove clock, key,
+    # attack maps)
+    def make_move(self, move):
+        fromSq, toSq, promotion = move & 63, (move >> 6) & 63, move >> 12
+        side = self.side
+        key = self.key
+        piece = self.removePiece(fromSq)
+        ptype = piece % 6
+        captured = self.mailbox[toSq]
+        capturedSq = toSq
+        epSquare = -1
+
+        if ptype == PAWN:
+            if toSq == self.epSquare:
+                capturedSq = toSq - 8 if side == 0 else toSq + 8
+                captured = self.mailbox[capturedSq]
+            elif toSq - fromSq in (16, -16):
+                # Only record en passant when an enemy pawn can actually capture
+                middle = (fromSq + toSq) // 2
+                if PAWN_ATTACKS[side][middle] & self.bitboards[(side ^ 1) * 6 + PAWN]:
+                    epSquare = middle
+        self.history.append(
+            (move, captured, capturedSq, self.castling, self.epSquare, self.halfmoveClock, key, self.attackMaps)
+        )
+
+        if captured != EMPTY:
+            self.removePiece(capturedSq)
+        if ptype == PAWN or captured != EMPTY:
+            self.halfmoveClock = 0
+        else:
+            self.halfmoveClock += 1
+
+        if promotion:
+            piece = side * 6 + promotion
+        elif ptype == KING and toSq - fromSq in (2, -2):
+            rookFrom, rookTo = (toSq + 1, toSq - 1) if toSq > fromSq else (toSq - 2, toSq + 1)
+            self.putPiece(self.removePiece(rookFrom), rookTo)
+        self.putPiece(piece, toSq)
+
+        castling = self.castling & CASTLING_MASK[fromSq] & CASTLING_MASK[toSq]
+        key = self.key ^ ZOBRIST_SIDE ^ ZOBRIST_CASTLING[self.castling] ^ ZOBRIST_CASTLING[castling]
+        if self.epSquare != -1:
+            key ^= ZOBRIST_EN_PASSANT[self.epSquare & 7]
+        if epSquare != -1:
+            key ^= ZOBRIST_EN_PASSANT[epSquare & 7]
+        self.key = key
+        self.castling = castling
+        self.epSquare = epSquare
+        if side == 1:
+            self.fullmoveNumber += 1
+        self.side = side ^ 1
+        self.attackMaps = [None, None]
+
+    # Reverts the last move played with make_move
+    def unmake_move(self):
+        move, captured, capturedSq, castling, epSquare, halfmoveClock, key, attackMaps = (
+            self.history.pop()
+        )
+        fromSq, toSq = move & 63, (move >> 6) & 63
+        side = self.side ^ 1
+        self.side = side
+        if side == 1:
+            self.fullmoveNumber -= 1
+
+        piece = self.removePiece(toSq)
+        if move >> 12:
+            piece = side * 6 + PAWN
+        elif piece % 6 == KING and toSq - fromSq in (2, -2):
+            rookFrom, rookTo = (toSq + 1, toSq - 1) if toSq > fromSq else (toSq - 2, toSq + 1)
+            self.putPiece(self.removePiece(rookTo), rookFrom)
+        self.putPiece(piece, fromSq)
+        if captured != EMPTY:
+            self.putPiece(captured, capturedSq)
+
+        self.castling = castling
+        self.epSquare = epSquare
+        self.halfmoveClock = halfmoveClock
+        self.key = key
+        self.attackMaps = attackMaps
+
+    # Finds the move between two squares, defaulting promotions to a queen
+    # Searches the pseudo legal moves unless a list of moves is given
+    def findMove(self, fromSq, toSq, promotion=None, moves=None):
+        if moves is None:
+            moves = self.pseudoLegalMoves()
+        candidates = [
+            move
+            for move in moves
+            if move & 63 == fromSq and (move >> 6) & 63 == toSq
+        ]
+        if not candidates:
+            return None
+        for move in candidates:
+            if move >> 12 in (0, promotion or QUEEN):
+                return move
+        return candidates[0]
+
+    # Same rules as Board.insufficientMaterial, using piece counts
+    def insufficientMaterial(self):
+        bitboards = self.bitboards
+        if (self.occupancy[0] | self.occupancy[1]).bit_count() == 2:
+            return True
+        for side in (0, 1):
+            base = side * 6
+            if bitboards[base + PAWN] | bitboards[base + ROOK] | bitboards[base + QUEEN]:
+                return False
+        for side in (0, 1):
+            base = side * 6
+            bishops = bitboards[base + BISHOP].bit_count()
+            minors = bishops + bitboards[base + KNIGHT].bit_count()
+            if minors > 2 or bishops == 2:
+                return False
+        return True
+
+
+# Returns only the legal moves for the side to move
+# Checkers and pins are computed once, so no move has to be played to test it (except en passant)
+def generate_legal_moves(position):
+    side = position.side
+    king = position.kingSquare(side)
+    # Positions without a king (used in testing) have no check to escape
+    if king == -1:
+        return position.generateMoves()
+
+    enemy = side ^ 1
+    occupied = position.occupancy[0] | position.occupancy[1]
+    checkers = position.attackersOf(king, enemy, occupied)
+
+    kingMask = KING_ATTACKS[king] & ~position.occupancy[side] & ~position.attackMap(enemy)
+    # Sliders see through the king, so it cannot step back along a checking line
+    if checkers:
+        withoutKing = occupied ^ (1 << king)
+        for to in squares(kingMask):
+            if position.isSquareAttacked(to, enemy, withoutKing):
+                kingMask ^= 1 << to
+
+    if checkers & (checkers - 1):
+        # Double check, only the king can move
+        targetMask = 0
+    elif checkers:
+        # Single check, capture the checker or block the line
+        checker = checkers.bit_length() - 1
+        targetMask = checkers | BETWEEN[king][checker]
+    else:
+        targetMask = FULL
+
+    return position.generateMoves(targetMask, position.pinMasks(side), kingMask, True)
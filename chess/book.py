@@ -0,0 +1,196 @@
+from chess.bitboard import Position, generate_legal_moves, STARTING_FEN
+from chess.engine import describeSearch
+from chess.pgn import readGames
+from chess.san import sanMap, normalizeSan, moveToSan
+from collections import defaultdict
+import argparse
+import mmap
+import os
+import random
+import struct
+import time
+
+# Entries are (Zobrist key, move, weight, games), big endian and sorted by key like Polyglot books,
+# but keyed by this package's Zobrist keys and move encoding
+ENTRY = struct.Struct(">QHHI")
+KEY = struct.Struct(">Q")
+MAX_WEIGHT = 0xFFFF
+MAX_COUNT = 0xFFFFFFFF
+DEFAULT_BOOK_PLIES = 20
+
+# Points of a move for the side that played it, by game result and side (white, black)
+RESULT_POINTS = {"1-0": (2, 0), "0-1": (0, 2), "1/2-1/2": (1, 1)}
+
+
+# Counts every (position key, move) pair in the first plies of each game
+# Returns {key: {move: [weight, games]}}, a move's weight is 2 per win and 1 per draw for the side that played it
+def collectBookMoves(source, plies=DEFAULT_BOOK_PLIES):
+    moves = defaultdict(lambda: defaultdict(lambda: [0, 0]))
+    for headers, sanMoves, result in readGames(source):
+        points = RESULT_POINTS.get(result)
+        if points is None:
+            continue
+        try:
+            position = Position.fromFen(headers.get("FEN", STARTING_FEN))
+        except (ValueError, KeyError, IndexError):
+            continue
+        for san in sanMoves[:plies]:
+            move = sanMap(position, generate_legal_moves(position)).get(normalizeSan(san))
+            if move is None:
+                break
+            entry = moves[position.key][move]
+            entry[0] += points[position.side]
+            entry[1] += 1
+            position.make_move(move)
+    return moves
+
+
+# Writes a book file from collected moves, keeping moves seen in at least minCount games that scored
+# Weights above 16 bits are scaled down per position so their proportions are kept
+def writeBook(moves, path, minCount=1):
+    entries = []
+    for key, counts in moves.items():
+        kept = [(move, weight, games) for move, (weight, games) in counts.items() if games >= minCount and weight]
+        if not kept:
+            continue
+        scale = max(1, max(weight for move, weight, games in kept) / MAX_WEIGHT)
+        for move, weight, games in kept:
+            entries.append((key, move, max(1, int(weight / scale)), min(games, MAX_COUNT)))
+    entries.sort(key=lambda entry: (entry[0], -entry[2], entry[1]))
+
+    # Written next to the target and renamed, so readers never map a half written book
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as file:
+        for entry in entries:
+            file.write(ENTRY.pack(*entry))
+    os.replace(temporary, path)
+    return len(entries)
+
+
+def buildBook(source, path, plies=DEFAULT_BOOK_PLIES, minCount=1):
+    return writeBook(collectBookMoves(source, plies), path, minCount)
+
+
+# Read only view of a book file, looked up by binary search over the memory mapped entries
+# The operating system shares the mapped pages, so every process opening the same book reads one copy
+# and opening a book costs nothing however large it is
+class OpeningBook:
+    def __init__(self, path) -> None:
+        self.path = path
+        self.file = open(path, "rb")
+        size = os.fstat(self.file.fileno()).st_size
+        if size % ENTRY.size:
+            self.file.close()
+            raise ValueError(f"{path} is not a book file, its size is not a multiple of {ENTRY.size} bytes")
+        # Empty files cannot be mapped
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self.entries = size // ENTRY.size
+        self.random = random.Random()
+        self.hits = 0
+        self.misses = 0
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    def __len__(self):
+        return self.entries
+
+    # Index of the first entry with the key or a larger one
+    def lowerBound(self, key):
+        low, high = 0, self.entries
+        while low < high:
+            middle = (low + high) // 2
+            if KEY.unpack_from(self.data, middle * ENTRY.size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    # (move, weight, games) stored for a key, highest weight first
+    def entriesFor(self, key):
+        result = []
+        index = self.lowerBound(key)
+        while index < self.entries:
+            entryKey, move, weight, games = ENTRY.unpack_from(self.data, index * ENTRY.size)
+            if entryKey != key:
+                break
+            result.append((move, weight, games))
+            index += 1
+        return result
+
+    # Book moves that are legal in the position, so a key collision can never play an illegal move
+    def moves(self, position, legalMoves=None):
+        entries = self.entriesFor(position.key)
+        if not entries:
+            self.misses += 1
+            return []
+        legal = set(generate_legal_moves(position) if legalMoves is None else legalMoves)
+        entries = [entry for entry in entries if entry[0] in legal]
+        if entries:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return entries
+
+    # Picks a book move at random in proportion to the weights, or the heaviest one, None when out of book
+    def choose(self, position, legalMoves=None, best=False):
+        entries = self.moves(position, legalMoves)
+        if not entries:
+            return None
+        if best:
+            return entries[0][0]
+        return self.random.choices([move for move, weight, games in entries],
+                                   [weight for move, weight, games in entries])[0]
+
+    def stats(self):
+        return {"entries": self.entries, "hits": self.hits, "misses": self.misses}
+
+
+# A book move for the game in the same form as engine.best_move, or None when the position is out of book
+def bookMove(game, book, best=False):
+    if book is None or game.outcome is not None:
+        return None
+    start = time.perf_counter()
+    move = book.choose(game.position, game.legalMoves, best)
+    if move is None:
+        return None
+    return describeSearch(game, {"move": move, "book": True, "time": time.perf_counter() - start})
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Build or probe an opening book")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="build a book from a PGN file")
+    build.add_argument("pgn", help="PGN file to read")
+    build.add_argument("book", help="book file to write")
+    build.add_argument("--plies", type=int, default=DEFAULT_BOOK_PLIES, help="plies of each game to include")
+    build.add_argument("--min-count", type=int, default=1, help="games a move must appear in")
+    probe = commands.add_parser("probe", help="list the book moves of a position")
+    probe.add_argument("book", help="book file to read")
+    probe.add_argument("--fen", default=STARTING_FEN)
+    args = parser.parse_args(args)
+
+    start = time.perf_counter()
+    if args.command == "build":
+        entries = buildBook(args.pgn, args.book, args.plies, args.min_count)
+        print(f"entries {entries}  bytes {entries * ENTRY.size}  time {time.perf_counter() - start:.2f}s")
+        return 0
+
+    position = Position.fromFen(args.fen)
+    legalMoves = generate_legal_moves(position)
+    with OpeningBook(args.book) as book:
+        for move, weight, games in book.moves(position, legalMoves):
+            print(f"{moveToSan(position, move, legalMoves):<8} weight {weight:>6}  games {games}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,372 @@
+from chess.bitboard import KNIGHT, BISHOP, ROOK, QUEEN, KING
+from chess.bitboard import moveFrom, moveTo, movePromotion, squareTuple, squares, generate_legal_moves
+from chess.pieces import Square
+from chess.san import PROMOTION_CLASSES, moveToSan
+from chess.transposition import TranspositionTable, EXACT, LOWER, UPPER
+from chess.ordering import MoveOrderer, isCapture
+from chess.errors import GameOverError, SearchTimeoutError
+from chess.tablebase import MAX_PIECES, WIN, LOSS
+import time
+
+MATE = 100000
+# Scores beyond this are mates, the distance to mate is MATE - abs(score)
+MATE_BOUND = MATE - 1000
+INFINITY = MATE + 1
+MAX_DEPTH = 64
+# How many nodes are searched between checks of the clock
+CHECK_INTERVAL = 256
+
+PIECE_VALUES = [100, 320, 330, 500, 900, 0]
+
+# Piece square tables as seen from white, rank 8 first
+PAWN_TABLE = [
+     0,  0,  0,  0,  0,  0,  0,  0,
+    50, 50, 50, 50, 50, 50, 50, 50,
+    10, 10, 20, 30, 30, 20, 10, 10,
+     5,  5, 10, 25, 25, 10,  5,  5,
+     0,  0,  0, 20, 20,  0,  0,  0,
+     5, -5,-10,  0,  0,-10, -5,  5,
+     5, 10, 10,-20,-20, 10, 10,  5,
+     0,  0,  0,  0,  0,  0,  0,  0,
+]
+KNIGHT_TABLE = [
+    -50,-40,-30,-30,-30,-30,-40,-50,
+    -40,-20,  0,  0,  0,  0,-20,-40,
+    -30,  0, 10, 15, 15, 10,  0,-30,
+    -30,  5, 15, 20, 20, 15,  5,-30,
+    -30,  0, 15, 20, 20, 15,  0,-30,
+    -30,  5, 10, 15, 15, 10,  5,-30,
+    -40,-20,  0,  5,  5,  0,-20,-40,
+    -50,-40,-30,-30,-30,-30,-40,-50,
+]
+BISHOP_TABLE = [
+    -20,-10,-10,-10,-10,-10,-10,-20,
+    -10,  0,  0,  0,  0,  0,  0,-10,
+    -10,  0,  5, 10, 10,  5,  0,-10,
+    -10,  5,  5, 10, 10,  5,  5,-10,
+    -10,  0, 10, 10, 10, 10,  0,-10,
+    -10, 10, 10, 10, 10, 10, 10,-10,
+    -10,  5,  0,  0,  0,  0,  5,-10,
+    -20,-10,-10,-10,-10,-10,-10,-20,
+]
+ROOK_TABLE = [
+     0,  0,  0,  0,  0,  0,  0,  0,
+     5, 10, 10, 10, 10, 10, 10,  5,
+    -5,  0,  0,  0,  0,  0,  0, -5,
+    -5,  0,  0,  0,  0,  0,  0, -5,
+    -5,  0,  0,  0,  0,  0,  0, -5,
+    -5,  0,  0,  0,  0,  0,  0, -5,
+    -5,  0,  0,  0,  0,  0,  0, -5,
+     0,  0,  0,  5,  5,  0,  0,  0,
+]
+QUEEN_TABLE = [
+    -20,-10,-10, -5, -5,-10,-10,-20,
+    -10,  0,  0,  0,  0,  0,  0,-10,
+    -10,  0,  5,  5,  5,  5,  0,-10,
+     -5,  0,  5,  5,  5,  5,  0, -5,
+      0,  0,  5,  5,  5,  5,  0, -5,
+    -10,  5,  5,  5,  5,  5,  0,-10,
+    -10,  0,  5,  0,  0,  0,  0,-10,
+    -20,-10,-10, -5, -5,-10,-10,-20,
+]
+KING_TABLE = [
+    -30,-40,-40,-50,-50,-40,-40,-30,
+    -30,-40,-40,-50,-50,-40,-40,-30,
+    -30,-40,-40,-50,-50,-40,-40,-30,
+    -30,-40,-40,-50,-50,-40,-40,-30,
+    -20,-30,-30,-40,-40,-30,-30,-20,
+    -10,-20,-20,-20,-20,-20,-20,-10,
+     20, 20,  0,  0,  0,  0, 20, 20,
+     20, 30, 10,  0,  0, 10, 30, 20,
+]
+KING_ENDGAME_TABLE = [
+    -50,-40,-30,-20,-20,-30,-40,-50,
+    -30,-20,-10,  0,  0,-10,-20,-30,
+    -30,-10, 20, 30, 30, 20,-10,-30,
+    -30,-10, 30, 40, 40, 30,-10,-30,
+    -30,-10, 30, 40, 40, 30,-10,-30,
+    -30,-10, 20, 30, 30, 20,-10,-30,
+    -30,-30,  0,  0,  0,  0,-30,-30,
+    -50,-30,-30,-30,-30,-30,-30,-50,
+]
+# Non pawn material (both sides) at or below which the king moves to the centre
+ENDGAME_MATERIAL = 2 * (PIECE_VALUES[ROOK] + PIECE_VALUES[BISHOP])
+
+
+# Builds value + table bonus for every piece code and square, as seen from white
+def _squareValues(tables):
+    values = []
+    for side in (0, 1):
+        for ptype, table in enumerate(tables):
+            sign = 1 if side == 0 else -1
+            # The tables are drawn rank 8 first, so white squares are flipped and black squares read as is
+            values.append([
+                sign * (PIECE_VALUES[ptype] + table[sq ^ 56 if side == 0 else sq])
+                for sq in range(64)
+            ])
+    return values
+
+
+SQUARE_VALUES = _squareValues(
+    [PAWN_TABLE, KNIGHT_TABLE, BISHOP_TABLE, ROOK_TABLE, QUEEN_TABLE, KING_TABLE]
+)
+ENDGAME_KING_VALUES = [
+    [sign * KING_ENDGAME_TABLE[sq ^ 56 if side == 0 else sq] for sq in range(64)]
+    for side, sign in ((0, 1), (1, -1))
+]
+
+
+# Static evaluation in centipawns from the point of view of the side to move
+def evaluate(position):
+    bitboards = position.bitboards
+    score = 0
+    for piece in range(12):
+        if piece % 6 == KING:
+            continue
+        values = SQUARE_VALUES[piece]
+        for sq in squares(bitboards[piece]):
+            score += values[sq]
+
+    material = 0
+    for side in (0, 1):
+        base = side * 6
+        for ptype in (KNIGHT, BISHOP, ROOK, QUEEN):
+            material += bitboards[base + ptype].bit_count() * PIECE_VALUES[ptype]
+    for side in (0, 1):
+        king = position.kingSquare(side)
+        if king != -1:
+            if material <= ENDGAME_MATERIAL:
+                score += ENDGAME_KING_VALUES[side][king]
+            else:
+                score += SQUARE_VALUES[side * 6 + KING][king]
+    return score if position.side == 0 else -score
+
+
+# Budget for one search, any combination of depth, nodes and seconds (None means unlimited)
+class Limit:
+    def __init__(self, depth=None, nodes=None, time=None) -> None:
+        self.depth = depth
+        self.nodes = nodes
+        self.time = time
+
+    # Accepts a Limit, a number of seconds or None (one second)
+    @staticmethod
+    def parse(limit):
+        if limit is None:
+            return Limit(time=1.0)
+        if isinstance(limit, Limit):
+            return limit
+        return Limit(time=float(limit))
+
+
+# Mate scores are stored relative to the node they were found at and read back relative to the root
+def scoreToTable(score, ply):
+    if score >= MATE_BOUND:
+        return score + ply
+    if score <= -MATE_BOUND:
+        return score - ply
+    return score
+
+
+def scoreFromTable(score, ply):
+    if score >= MATE_BOUND:
+        return score - ply
+    if score <= -MATE_BOUND:
+        return score + ply
+    return score
+
+
+# Negamax alpha-beta search with iterative deepening and quiescence search
+# Results are shared through the transposition table and the move orderer's history,
+# pass the same table and orderer to keep them between searches
+class Searcher:
+    def __init__(self, limit=None, seenKeys=(), table=None, orderer=None, tablebases=None) -> None:
+        self.limit = Limit.parse(limit)
+        self.table = TranspositionTable() if table is None else table
+        self.orderer = MoveOrderer() if orderer is None else orderer
+        # Keys of earlier game positions, reaching one of them again is scored as a draw
+        self.seenKeys = set(seenKeys)
+        # Endgame tables (chess.tablebase.Tablebases), positions they cover are scored without searching
+        self.tablebases = tablebases
+        self.tablebaseHits = 0
+        self.path = set()
+        self.nodes = 0
+        self.deadline = None
+        self.nextCheck = CHECK_INTERVAL
+        self.rootBest = None
+        self.iterationBest = None
+
+    # Raises SearchTimeoutError once the node or time budget is spent
+    def checkLimits(self):
+        if self.limit.nodes is not None and self.nodes >= self.limit.nodes:
+            raise SearchTimeoutError(self.nodes)
+        if self.nodes >= self.nextCheck:
+            self.nextCheck = self.nodes + CHECK_INTERVAL
+            if self.deadline is not None and time.perf_counter() >= self.deadline:
+                raise SearchTimeoutError(self.nodes)
+
+    def quiescence(self, position, alpha, beta, ply):
+        self.nodes += 1
+        self.checkLimits()
+        inCheck = position.inCheck(position.side)
+        moves = generate_legal_moves(position)
+        if not moves:
+            return -MATE + ply if inCheck else 0
+
+        if not inCheck:
+            # Stand pat, the side to move can usually do at least as well as the static score
+            standPat = evaluate(position)
+            if standPat >= beta:
+                return standPat
+            alpha = max(alpha, standPat)
+            moves = [move for move in moves if move >> 12 or isCapture(position, move)]
+
+        for move in self.orderer.order(position, moves, ply):
+            position.make_move(move)
+            score = -self.quiescence(position, -beta, -alpha, ply + 1)
+            position.unmake_move()
+            if score >= beta:
+                return score
+            alpha = max(alpha, score)
+        return alpha
+
+    def negamax(self, position, depth, alpha, beta, ply):
+        if ply > 0 and (
+            position.halfmoveClock >= 100
+            or position.key in self.path
+            or position.key in self.seenKeys
+        ):
+            return 0
+        if ply > 0 and self.tablebases is not None and position.occupied.bit_count() <= MAX_PIECES:
+            probe = self.tablebases.probe(position)
+            if probe is not None:
+                self.tablebaseHits += 1
+                result, dtm = probe
+                if result == WIN:
+                    return MATE - ply - dtm
+                if result == LOSS:
+                    return -MATE + ply + dtm
+                return 0
+        if depth <= 0:
+            return self.quiescence(position, alpha, beta, ply)
+
+        self.nodes += 1
+        self.checkLimits()
+        key = position.key
+        entry = self.table.probe(key)
+        tableMove = None
+        if entry is not None:
+            tableMove, tableDepth, bound, tableScore = entry
+            tableScore = scoreFromTable(tableScore, ply)
+            if ply > 0 and tableDepth >= depth and (
+                bound == EXACT
+                or (bound == LOWER and tableScore >= beta)
+                or (bound == UPPER and tableScore <= alpha)
+            ):
+                return tableScore
+
+        moves = generate_legal_moves(position)
+        if not moves:
+            return -MATE + ply if position.inCheck(position.side) else 0
+
+        first = self.rootBest if ply == 0 else tableMove
+        originalAlpha = alpha
+        best, bestMove = -INFINITY, None
+        self.path.add(key)
+        try:
+            for index, move in enumerate(self.orderer.order(position, moves, ply, first)):
+                position.make_move(move)
+                try:
+                    score = -self.negamax(position, depth - 1, -beta, -alpha, ply + 1)
+                finally:
+                    position.unmake_move()
+                if score > best:
+                    best, bestMove = score, move
+                    if ply == 0:
+                        self.iterationBest = move
+                if score > alpha:
+                    alpha = score
+                if alpha >= beta:
+                    self.orderer.cutoff(position, move, ply, depth, index)
+                    break
+        finally:
+            self.path.discard(key)
+
+        if best <= originalAlpha:
+            bound = UPPER
+        elif best >= beta:
+            bound = LOWER
+        else:
+            bound = EXACT
+        self.table.store(key, depth, bound, scoreToTable(best, ply), bestMove)
+        return best
+
+    # Searches the position to increasing depths until the limit is reached
+    # Returns (move, score, depth) for the deepest search that produced a move
+    def search(self, position):
+        if self.limit.time is not None:
+            self.deadline = time.perf_counter() + self.limit.time
+        maxDepth = self.limit.depth or MAX_DEPTH
+        self.orderer.newSearch()
+        moves = generate_legal_moves(position)
+        if not moves:
+            return None, 0, 0
+
+        self.rootBest, score, completed = moves[0], 0, 0
+        for depth in range(1, maxDepth + 1):
+            self.iterationBest = None
+            try:
+                iterationScore = self.negamax(position, depth, -INFINITY, INFINITY, 0)
+            except SearchTimeoutError:
+                # The previous best move is searched first, so a move found before stopping is at least as good
+                if self.iterationBest is not None:
+                    self.rootBest = self.iterationBest
+                break
+            self.rootBest, score, completed = self.iterationBest, iterationScore, depth
+            # Nothing left to find once a forced mate is on the board, and a single reply needs no search
+            if abs(score) >= MATE_BOUND or len(moves) == 1:
+                break
+        return self.rootBest, score, completed
+
+
+# Searches a position without a game, seenKeys are the keys of earlier positions for repetition draws
+# Returns the best move as an int with the search statistics, the move is None when there is no legal move
+def searchPosition(position, seenKeys=(), limit=None, table=None, orderer=None, tablebases=None):
+    start = time.perf_counter()
+    searcher = Searcher(limit, seenKeys, table, orderer, tablebases)
+    move, score, depth = searcher.search(position)
+    return {
+        "move": move,
+        "score": score,
+        "depth": depth,
+        "nodes": searcher.nodes,
+        "tablebaseHits": searcher.tablebaseHits,
+        "time": time.perf_counter() - start,
+        "table": searcher.table.stats(),
+        "ordering": searcher.orderer.stats(),
+    }
+
+
+# Adds the squares, promotion piece and SAN of a searched move in the game's current position
+def describeSearch(game, result):
+    move = result["move"]
+    if move is None:
+        raise GameOverError(game.outcome)
+    return {
+        "a": Square.tupleToDict(squareTuple(moveFrom(move))),
+        "b": Square.tupleToDict(squareTuple(moveTo(move))),
+        "promotionPiece": PROMOTION_CLASSES.get(movePromotion(move)),
+        "san": moveToSan(game.position, move, game.legalMoves),
+        **result,
+    }
+
+
+# Picks a move for the side to move in the game within the limit (Limit, seconds or None)
+# Returns the Game.move arguments (a, b, promotionPiece) with the move, its SAN, score, depth, nodes, time
+# and the transposition table and move ordering statistics
+def best_move(game, limit=None, table=None, orderer=None, tablebases=None):
+    if game.outcome is not None:
+        raise GameOverError(game.outcome)
+    return describeSearch(
+        game, searchPosition(game.position.copy(), game.positionHistory, limit, table, orderer, tablebases)
+    )
@@ -46,3 +46,21 @@ class InvalidPromotionPieceError(Exception):
     def __init__(self, *args: object) -> None:
         self.message = "Invalid promotion piece!"
         super().__init__(self.message)
+
+
+class GameOverError(RuntimeError):
+    def __init__(self, outcome) -> None:
+        self.message = f"Unable to move after the game has ended ({outcome})"
+        super().__init__(self.message)
+
+
+class SearchTimeoutError(Exception):
+    def __init__(self, nodes) -> None:
+        self.message = f"Search stopped after {nodes} nodes, the limit was reached"
+        super().__init__(self.message)
+
+
+class GameNotFoundError(KeyError):
+    def __init__(self, gameId) -> None:
+        self.message = f"No game found with id {gameId}, it may have expired"
+        super().__init__(self.message)
@@ -0,0 +1,103 @@
+from collections import defaultdict
+import json
+import queue
+import threading
+import time
+
+# Seconds between keepalive comments on an idle stream, so proxies do not close it
+HEARTBEAT_SECONDS = 15.0
+# Seconds a stream stays open, an open stream holds a server thread (the app needs a threaded server) so
+# streams of closed tabs that were never noticed are given back, EventSource reconnects to a fresh board
+MAX_STREAM_SECONDS = 5 * 60.0
+# Events buffered per subscriber, a subscriber that falls this far behind is dropped
+# (EventSource reconnects on its own and starts again from a full board)
+MAX_PENDING_EVENTS = 256
+
+
+# Formats one server-sent event with a JSON payload
+def formatEvent(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+# Pending events of one open stream, closed when the stream falls too far behind
+class Subscriber(queue.Queue):
+    def __init__(self, maxsize) -> None:
+        super().__init__(maxsize)
+        self.closed = False
+
+
+# Fans out events to every open stream of a game
+class EventBroker:
+    def __init__(
+        self, heartbeat=HEARTBEAT_SECONDS, maxPending=MAX_PENDING_EVENTS, lifetime=MAX_STREAM_SECONDS,
+        clock=time.monotonic,
+    ) -> None:
+        self.heartbeat = heartbeat
+        self.maxPending = maxPending
+        self.lifetime = lifetime
+        self.clock = clock
+        # gameId -> set of subscriber queues
+        self.subscribers = defaultdict(set)
+        self.lock = threading.Lock()
+        self.published = 0
+        self.dropped = 0
+
+    def subscribe(self, gameId):
+        subscriber = Subscriber(self.maxPending)
+        with self.lock:
+            self.subscribers[gameId].add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, gameId, subscriber):
+        with self.lock:
+            subscribers = self.subscribers.get(gameId)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self.subscribers[gameId]
+
+    def publish(self, gameId, event, data):
+        message = formatEvent(event, data)
+        with self.lock:
+            subscribers = list(self.subscribers.get(gameId, ()))
+            self.published += 1
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(message)
+            except queue.Full:
+                subscriber.closed = True
+                self.unsubscribe(gameId, subscriber)
+                self.dropped += 1
+
+    # Yields the initial events, then every event published for the game until the client goes away or
+    # the stream has been open for lifetime seconds
+    # Pass a subscriber from subscribe made before the initial events were built, events published in
+    # between are then streamed after them instead of lost
+    def stream(self, gameId, initial=(), subscriber=None):
+        if subscriber is None:
+            subscriber = self.subscribe(gameId)
+        closing = self.clock() + self.lifetime
+        try:
+            for event, data in initial:
+                yield formatEvent(event, data)
+            while True:
+                remaining = closing - self.clock()
+                if subscriber.closed or remaining <= 0:
+                    return
+                try:
+                    message = subscriber.get(timeout=min(self.heartbeat, remaining))
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                yield message
+        finally:
+            self.unsubscribe(gameId, subscriber)
+
+    def listeners(self, gameId):
+        with self.lock:
+            return len(self.subscribers.get(gameId, ()))
+
+    def stats(self):
+        with self.lock:
+            streams = sum(len(subscribers) for subscribers in self.subscribers.values())
+        return {"streams": streams, "published": self.published, "dropped": self.dropped}
@@ -1,23 +1,52 @@
 from chess.pieces import Square, Board, Pawn, Rook, Knight, Bishop, Queen, King
 from chess.pieces import WHITE, BLACK, ICON_DICT
+from chess.bitboard import Position, PIECE_TYPES, squareIndex, generate_legal_moves
+from chess.san import sanBody, sanMap, sanToSquares, moveToSan
 from chess.errors import *
 
 QUIT = "quit"
 RESIGN = "resign"
 DRAW = "draw"
 
+# Why a game ended, kept in Game.outcomeReason
+CHECKMATE = "checkmate"
+STALEMATE = "stalemate"
+FIFTY_MOVES = "fifty-move"
+INSUFFICIENT_MATERIAL = "insufficient-material"
+REPETITION = "repetition"
+RESIGNATION = "resignation"
+AGREEMENT = "agreement"
+
 
 class Game:
-    def __init__(self, board, testMoves=False) -> None:
-        self.turn = WHITE
+    # replay=True is for replaying recorded games, threefold repetition and the fifty move rule then only
+    # make a draw claimable (claimableDraw holds the reason) since a game may legally play on past them
+    def __init__(self, board, testMoves=False, position=None, replay=False) -> None:
+        self.turn = WHITE if position is None else position.turn
         self.check = {WHITE: False, BLACK: False}
         self.drawOffered = False
-        self.fiftyMoveRule = 0
-        self.positionHistory = {}
-        self.boardHistory = []
         self.testMoves = testMoves
+        self.replay = replay
+        self.claimableDraw = None
         self.board = board
+        # Bitboard mirror of self.board used for move generation and check detection
+        if position is None:
+            position = Position.fromBoard(board, self.turn)
+        self.position = position
+        # Times each position occurred by Zobrist key, the starting position counts as its first occurrence
+        self.positionHistory = {position.key: 1}
+        # Starting position, the game is this plus playedMoves()
+        self.startFen = position.toFen()
+        self.fiftyMoveRule = position.halfmoveClock
+        self.check = self.position.checkStatus()
+        # Legal moves for the side to move, regenerated once per ply
+        self.legalMoves = generate_legal_moves(self.position)
+        # SAN lookup for the legal moves, built on first use each ply
+        self.legalSan = None
+        # SAN of every move played, in order
+        self.moveHistory = []
         self.outcome = None
+        self.outcomeReason = None
 
         if self.testMoves:
             self.runTestMoves()
@@ -41,6 +70,40 @@ class Game:
             board[(6, i)] = Pawn(BLACK)
         return board
 
+    # Builds a game from a FEN string, including side to move, castling rights, en passant and clocks
+    @staticmethod
+    def from_fen(fen, testMoves=False, replay=False):
+        position = Position.fromFen(fen)
+        return Game(position.toBoard(), testMoves, position, replay)
+
+    def to_fen(self):
+        return self.position.toFen()
+
+    # Moves played since the start, as encoded bitboard moves
+    def playedMoves(self):
+        return [record[0] for record in self.position.history]
+
+    # Returns {san: move} for the side to move
+    def sanMoves(self):
+        if self.legalSan is None:
+            self.legalSan = sanMap(self.position, self.legalMoves)
+        return self.legalSan
+
+    # Target squares of the piece on (r, c), castling rights and en passant come from the game's position
+    def availableMoves(self, r, c):
+        piece = self.board.get((r, c))
+        if piece is None:
+            return []
+        return piece.availableMoves(self.board, r, c, self.position)
+
+    # Moves an opening book (chess.book.OpeningBook) has for the current position,
+    # as (san, weight, games) with the highest weight first
+    def bookMoves(self, book):
+        return [
+            (moveToSan(self.position, move, self.legalMoves), weight, games)
+            for move, weight, games in book.moves(self.position, self.legalMoves)
+        ]
+
     def runTestMoves(self):
         doneTesting = False
         testMovesIndex = 0
@@ -54,16 +117,16 @@ class Game:
             if i == QUIT:
                 return None
             if i == RESIGN:
-                self.outcome = self.opposingSide(self.turn)
+                self.resign()
                 break
 
             if i == DRAW:
                 self.outcome = "draw"
+                self.outcomeReason = AGREEMENT
                 break
 
             if i.get("drawOffered"):
                 if self.offerDraw() == "draw":
-                    self.outcome = "draw"
                     break
 
             self.move(i["a"], i["b"], i.get("promotionPiece"))
@@ -76,16 +139,13 @@ class Game:
 
     def move(self, a=None, b=None, promotionPiece=None, input=""):
         if self.outcome is not None:
-            raise RuntimeError()
+            raise GameOverError(self.outcome)
 
         if not self.testMoves:
             if a is None and b is None:
                 i = self.takeInput(input)
                 a, b, promotionPiece = i.get("a"), i.get("b"), i.get("promotionPiece")
 
-        self.boardHistory.append(self.board.copy())
-        Board.updateEnPassant(self.board)
-
         # Check both squares exist on a board
         if not Square.isOnBoard(a["row"], a["col"]):
             raise SquareNotOnBoardError(a)
@@ -102,66 +162,79 @@ class Game:
             raise MoveOutOfTurnError(aPiece.color, self.turn)
 
         # Check if move is legal
-        if not aPiece.validateMove(self.board, a, b):
-            raise InvalidMoveError(Square.dictToString(a), Square.dictToString(b))
-
-        # Make the move
-        self.board = Board.executeMove(a, b, self.board, promotionPiece)
-        checkStatus = Board.scanForCheck(self.board)
-
-        # If player does not move out of a check
-        if checkStatus[self.turn] and self.check[self.turn]:
-            self.board = self.boardHistory[-1]
-            raise MoveInCheckError()
-
-        # If prospective move exposes player to check
-        if not self.check[self.turn] and checkStatus[self.turn]:
-            self.board = self.boardHistory[-1]
+        fromSq = squareIndex(a["row"], a["col"])
+        toSq = squareIndex(b["row"], b["col"])
+        promotion = PIECE_TYPES.get(promotionPiece)
+        move = self.position.findMove(fromSq, toSq, promotion, self.legalMoves)
+        if move is None:
+            if self.position.findMove(fromSq, toSq, promotion) is None:
+                raise InvalidMoveError(Square.dictToString(a), Square.dictToString(b))
+            # If player does not move out of a check
+            if self.check[self.turn]:
+                raise MoveInCheckError()
+            # If prospective move exposes player to check
             raise ExposingCheckError()
 
-        self.check = checkStatus
+        # Make the move on the bitboard position
+        san = sanBody(self.position, move, self.legalMoves)
+        self.position.make_move(move)
+        self.check = self.position.checkStatus()
+        self.legalMoves = generate_legal_moves(self.position)
+        self.legalSan = None
+        if self.check[self.position.turn]:
+            san += "#" if self.noLegalMoves() else "+"
+        self.moveHistory.append(san)
+
+        # Mirror the move on the dict board
+        Board.make_move(a, b, self.board, promotionPiece)
+
+        # the position resets its halfmove clock on pawn moves and captures
+        self.fiftyMoveRule = self.position.halfmoveClock
+        self.claimableDraw = None
+
+        # scan for checkmate or stalemate first, a mate stands even on the move that completes
+        # fifty moves or repeats a position
+        if self.noLegalMoves():
+            if self.check[self.opposingSide(self.turn)]:
+                # checkmate
+                self.outcome = self.turn
+                self.outcomeReason = CHECKMATE
+                return
+            # stalemate
+            self.outcome = "draw"
+            self.outcomeReason = STALEMATE
+            return
 
-        # 50 move rule
-        if (
-            type(aPiece) == Pawn
-            or self.boardHistory[-1].get((b["row"], b["col"])) is not None
-        ):
-            self.fiftyMoveRule = 0
-        else:
-            self.fiftyMoveRule += 1
-            if self.fiftyMoveRule == 50:
+        # 50 move rule (50 moves by each side)
+        if self.fiftyMoveRule >= 100:
+            if not self.replay:
                 self.outcome = "draw"
+                self.outcomeReason = FIFTY_MOVES
                 return
+            self.claimableDraw = FIFTY_MOVES
 
         # check for insufficient material
-        if Board.insufficientMaterial(self.board):
+        if self.position.insufficientMaterial():
             self.outcome = "draw"
+            self.outcomeReason = INSUFFICIENT_MATERIAL
             return
 
-        # check for repetition
-        if str(self) not in self.positionHistory.keys():
-            self.positionHistory[str(self)] = 1
-        else:
-            self.positionHistory[str(self)] += 1
-            if self.positionHistory[str(self)] == 3:
+        # check for repetition, keyed by the Zobrist key of the full position
+        key = self.position.key
+        self.positionHistory[key] = self.positionHistory.get(key, 0) + 1
+        if self.positionHistory[key] >= 3:
+            if not self.replay:
                 self.outcome = "draw"
+                self.outcomeReason = REPETITION
                 return
-
-        # scan for checkmate or stalemate
-        if self.noLegalMoves():
-            if self.check[self.opposingSide(self.turn)]:
-                # checkmate
-                self.outcome = self.turn
-                return
-            # stalemate
-            self.outcome = "draw"
-            return
+            self.claimableDraw = REPETITION
 
         self.turn = self.opposingSide(self.turn)
 
     def offerDraw(self):
         if self.drawOffered:
             self.outcome = "draw"
+            self.outcomeReason = AGREEMENT
             self.drawOffered = False
             return "draw"
         else:
@@ -170,24 +243,13 @@ class Game:
 
     def resign(self):
         self.outcome = self.opposingSide(self.turn)
+        self.outcomeReason = RESIGNATION
 
     def noLegalMoves(self):
-        for location, piece in self.board.items():
-            if piece.color != self.turn:
-                for move in piece.availableMoves(self.board, location[0], location[1]):
-                    if not (
-                        Board.scanForCheck(
-                            Board.executeMove(
-                                Square.tupleToDict(location),
-                                Square.tupleToDict(move),
-                                self.board.copy(),
-                            )
-                        )[self.opposingSide(self.turn)]
-                    ):
-                        return False
-        return True
+        return len(self.legalMoves) == 0
 
     # TAKE INPUT IN THE FOLLOWING FORMAT: a (e2), b (e4), promotionPiece (q), drawOffered (True)
+    # OR IN SAN: san (Nf3, exd8=Q, O-O), drawOffered (True)
     def takeInput(self, input):
         # Game loop break condition
         if input.lower() == QUIT:
@@ -202,6 +264,13 @@ class Game:
         try:
             resultDict = {}
             args = input.split(" ")
+            if self.isSanInput(args):
+                a, b, promotionPiece = sanToSquares(self, args[0])
+                resultDict = {"a": a, "b": b, "promotionPiece": promotionPiece}
+                if len(args) == 2 and args[1] == DRAW:
+                    resultDict["drawOffered"] = True
+                return resultDict
+
             if len(args) >= 2:
                 resultDict = {
                     "a": Square.stringToDict(args[0]),
@@ -220,6 +289,13 @@ class Game:
         except:
             raise InputDecodingError(input)
 
+    # Coordinate input always starts with two squares, anything else is read as SAN
+    @staticmethod
+    def isSanInput(args):
+        if len(args) >= 2 and len(args[0]) == 2 and len(args[1]) == 2:
+            return False
+        return len(args) <= 2 and args[0] != ""
+
     # string representation of the game used for printing
     def __str__(self) -> str:
         row_list = ["-+--------+-"]
@@ -0,0 +1,65 @@
+from chess.bitboard import squareTuple, moveFrom, moveTo
+from chess.pieces import Square
+from collections import OrderedDict
+import threading
+
+DEFAULT_MAX_POSITIONS = 4096
+
+
+# Legal targets of every piece of the side to move: from square -> [target squares], as "e2" strings
+def moveHints(legalMoves):
+    hints = {}
+    for move in legalMoves:
+        fromSquare = Square.tupleToString(squareTuple(moveFrom(move)))
+        target = Square.tupleToString(squareTuple(moveTo(move)))
+        targets = hints.setdefault(fromSquare, [])
+        # promotions share a target square
+        if target not in targets:
+            targets.append(target)
+    return hints
+
+
+# Move hints keyed by the Zobrist key of a position, shared by all games
+# The map is built once from the game's legal moves, every later click in the same position is a lookup
+# Positions are kept in least recently used order and the oldest is dropped past maxPositions
+class HintCache:
+    def __init__(self, maxPositions=DEFAULT_MAX_POSITIONS) -> None:
+        if maxPositions < 1:
+            raise ValueError("a hint cache must hold at least one position")
+        self.maxPositions = maxPositions
+        self.hints = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, game):
+        key = game.position.key
+        with self.lock:
+            hints = self.hints.get(key)
+            if hints is not None:
+                self.hits += 1
+                self.hints.move_to_end(key)
+                return hints
+            self.misses += 1
+        hints = moveHints(game.legalMoves)
+        with self.lock:
+            self.hints[key] = hints
+            while len(self.hints) > self.maxPositions:
+                self.hints.popitem(last=False)
+        return hints
+
+    # Targets of the piece on the given square, empty for other squares
+    def targets(self, game, square):
+        return self.get(game).get(square, [])
+
+    def __len__(self):
+        return len(self.hints)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "positions": len(self.hints),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": self.hits / lookups if lookups else 0.0,
+        }
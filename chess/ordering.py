@@ -0,0 +1,117 @@
+from chess.bitboard import PAWN, EMPTY
+
+MAX_PLY = 128
+KILLER_SLOTS = 2
+
+# Victim and attacker values for MVV-LVA, indexed by piece type
+ORDER_VALUES = [1, 3, 3, 5, 9, 20]
+
+# Move scores, the table move first, then captures and promotions, killers and quiet moves by history
+TABLE_MOVE_SCORE = 1 << 30
+CAPTURE_SCORE = 1 << 28
+KILLER_SCORE = 1 << 26
+# History scores are halved before they can reach the killers
+HISTORY_LIMIT = KILLER_SCORE >> 1
+
+
+def isCapture(position, move):
+    toSq = (move >> 6) & 63
+    if position.mailbox[toSq] != EMPTY:
+        return True
+    return toSq == position.epSquare and position.mailbox[move & 63] % 6 == PAWN
+
+
+# Most valuable victim, least valuable attacker: PxQ scores highest, KxP lowest
+def mvvLva(position, move):
+    mailbox = position.mailbox
+    victim = mailbox[(move >> 6) & 63]
+    attacker = mailbox[move & 63] % 6
+    victimValue = ORDER_VALUES[PAWN if victim == EMPTY else victim % 6]
+    score = victimValue * 32 - ORDER_VALUES[attacker]
+    if move >> 12:
+        score += ORDER_VALUES[move >> 12] * 32
+    return score
+
+
+# Orders moves for alpha-beta search
+# Killers are quiet moves that caused a cutoff at the same ply, the history table counts cutoffs of quiet
+# moves by piece and target square across searches, both are kept until the orderer is dropped
+class MoveOrderer:
+    def __init__(self, captures=True, killers=True, history=True) -> None:
+        self.useCaptures = captures
+        self.useKillers = killers
+        self.useHistory = history
+        self.killers = [[None] * KILLER_SLOTS for _ in range(MAX_PLY)]
+        self.history = [[0] * 64 for _ in range(12)]
+        self.resetStats()
+
+    def resetStats(self):
+        # Nodes that ended in a beta cutoff, and how many of them cut off on the first move searched
+        self.cutoffs = 0
+        self.firstMoveCutoffs = 0
+        self.captureCutoffs = 0
+        self.killerCutoffs = 0
+        self.historyCutoffs = 0
+        # Sum of the (zero based) position of the cutoff move, for the average
+        self.cutoffIndexTotal = 0
+
+    # Called at the start of each search, killers are per search and old history counts fade
+    def newSearch(self):
+        self.killers = [[None] * KILLER_SLOTS for _ in range(MAX_PLY)]
+        for values in self.history:
+            for sq in range(64):
+                values[sq] >>= 1
+
+    def score(self, position, move, ply, tableMove=None):
+        if move == tableMove:
+            return TABLE_MOVE_SCORE
+        if self.useCaptures and (move >> 12 or isCapture(position, move)):
+            return CAPTURE_SCORE + mvvLva(position, move)
+        if self.useKillers and ply < MAX_PLY and move in self.killers[ply]:
+            return KILLER_SCORE - self.killers[ply].index(move)
+        if self.useHistory:
+            return self.history[position.mailbox[move & 63]][(move >> 6) & 63]
+        return 0
+
+    # Returns the moves sorted best first, moves with equal scores keep their generation order
+    def order(self, position, moves, ply=0, tableMove=None):
+        return sorted(moves, key=lambda move: -self.score(position, move, ply, tableMove))
+
+    # Records a beta cutoff by the move at the given index, with the position the move was played from
+    def cutoff(self, position, move, ply, depth, index):
+        self.cutoffs += 1
+        self.cutoffIndexTotal += index
+        if index == 0:
+            self.firstMoveCutoffs += 1
+        if move >> 12 or isCapture(position, move):
+            self.captureCutoffs += 1
+            return
+
+        if ply < MAX_PLY:
+            killers = self.killers[ply]
+            if move in killers:
+                self.killerCutoffs += 1
+            elif self.useKillers:
+                killers.pop()
+                killers.insert(0, move)
+        if self.useHistory:
+            piece = position.mailbox[move & 63]
+            toSq = (move >> 6) & 63
+            if self.history[piece][toSq]:
+                self.historyCutoffs += 1
+            self.history[piece][toSq] += depth * depth
+            if self.history[piece][toSq] >= HISTORY_LIMIT:
+                for values in self.history:
+                    for sq in range(64):
+                        values[sq] >>= 1
+
+    def stats(self):
+        return {
+            "cutoffs": self.cutoffs,
+            "firstMoveCutoffs": self.firstMoveCutoffs,
+            "firstMoveRate": self.firstMoveCutoffs / self.cutoffs if self.cutoffs else 0.0,
+            "averageCutoffIndex": self.cutoffIndexTotal / self.cutoffs if self.cutoffs else 0.0,
+            "captureCutoffs": self.captureCutoffs,
+            "killerCutoffs": self.killerCutoffs,
+            "historyCutoffs": self.historyCutoffs,
+        }
@@ -0,0 +1,112 @@
+from chess.bitboard import Position, generate_legal_moves, moveToString, STARTING_FEN
+import argparse
+import time
+
+# Standard perft positions with known node counts per depth
+PERFT_POSITIONS = {
+    "start": (
+        STARTING_FEN,
+        {1: 20, 2: 400, 3: 8902, 4: 197281, 5: 4865609},
+    ),
+    "kiwipete": (
+        "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+        {1: 48, 2: 2039, 3: 97862, 4: 4085603},
+    ),
+    "endgame": (
+        "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+        {1: 14, 2: 191, 3: 2812, 4: 43238, 5: 674624},
+    ),
+    "promotions": (
+        "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+        {1: 6, 2: 264, 3: 9467, 4: 422333},
+    ),
+    "talkchess": (
+        "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+        {1: 44, 2: 1486, 3: 62379, 4: 2103487},
+    ),
+    "middlegame": (
+        "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+        {1: 46, 2: 2079, 3: 89890, 4: 3894594},
+    ),
+}
+
+
+# Counts the leaf nodes of the legal move tree to the given depth
+def perft(position, depth):
+    moves = generate_legal_moves(position)
+    if depth <= 1:
+        return len(moves) if depth == 1 else 1
+    nodes = 0
+    for move in moves:
+        position.make_move(move)
+        nodes += perft(position, depth - 1)
+        position.unmake_move()
+    return nodes
+
+
+# Returns the perft count below each root move, keyed by the move in coordinate notation
+def divide(position, depth):
+    result = {}
+    for move in generate_legal_moves(position):
+        position.make_move(move)
+        result[moveToString(move)] = perft(position, depth - 1)
+        position.unmake_move()
+    return result
+
+
+# Runs every standard position up to maxDepth, returning (name, depth, nodes, expected, seconds) rows
+def runSuite(maxDepth, names=None):
+    results = []
+    for name, (fen, expected) in PERFT_POSITIONS.items():
+        if names and name not in names:
+            continue
+        for depth in sorted(expected):
+            if depth > maxDepth:
+                break
+            position = Position.fromFen(fen)
+            start = time.perf_counter()
+            nodes = perft(position, depth)
+            results.append((name, depth, nodes, expected[depth], time.perf_counter() - start))
+    return results
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Move generation perft suite and benchmark")
+    parser.add_argument("--depth", type=int, default=3, help="maximum depth to search")
+    parser.add_argument("--position", action="append", help="standard position name (repeatable)")
+    parser.add_argument("--fen", help="run a single FEN instead of the standard positions")
+    parser.add_argument("--divide", action="store_true", help="print the node count per root move")
+    args = parser.parse_args(args)
+
+    if args.fen or args.divide:
+        fen = args.fen or PERFT_POSITIONS[(args.position or ["start"])[0]][0]
+        position = Position.fromFen(fen)
+        start = time.perf_counter()
+        if args.divide:
+            counts = divide(position, args.depth)
+            for move, nodes in sorted(counts.items()):
+                print(f"{move}: {nodes}")
+            nodes = sum(counts.values())
+        else:
+            nodes = perft(position, args.depth)
+        seconds = time.perf_counter() - start
+        print(f"nodes {nodes}  time {seconds:.2f}s  nps {nodes / max(seconds, 1e-9):.0f}")
+        return 0
+
+    failed = 0
+    totalNodes, totalSeconds = 0, 0.0
+    for name, depth, nodes, expected, seconds in runSuite(args.depth, args.position):
+        status = "ok" if nodes == expected else "FAIL"
+        failed += nodes != expected
+        totalNodes += nodes
+        totalSeconds += seconds
+        print(
+            f"{name:<12} depth {depth}  nodes {nodes:>10}  expected {expected:>10}  "
+            f"nps {nodes / max(seconds, 1e-9):>9.0f}  {status}"
+        )
+    print(f"total nodes {totalNodes}  time {totalSeconds:.2f}s  nps {totalNodes / max(totalSeconds, 1e-9):.0f}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
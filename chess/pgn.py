@@ -0,0 +1,178 @@
+from chess.game import Game
+from chess.san import sanToSquares
+from chess.errors import *
+import argparse
+import functools
+import multiprocessing
+import re
+import time
+
+RESULTS = {"1-0", "0-1", "1/2-1/2", "*"}
+
+HEADER_PATTERN = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+COMMENT_PATTERN = re.compile(r"\{[^}]*\}|;[^\n]*")
+VARIATION_PATTERN = re.compile(r"\([^()]*\)")
+NAG_PATTERN = re.compile(r"\$\d+")
+MOVE_NUMBER_PATTERN = re.compile(r"^\d+\.+")
+
+
+# Yields the raw text of each game in a PGN file (path or open file) one game at a time
+def iterGameTexts(source):
+    if isinstance(source, str):
+        with open(source, encoding="utf-8", errors="replace") as file:
+            yield from iterGameTexts(file)
+        return
+
+    lines = []
+    inMovetext = False
+    for line in source:
+        stripped = line.strip()
+        if stripped.startswith("[") and inMovetext:
+            yield "".join(lines)
+            lines = []
+            inMovetext = False
+        if stripped and not stripped.startswith("[") and not stripped.startswith("%"):
+            inMovetext = True
+        lines.append(line)
+    if inMovetext or any(line.strip() for line in lines):
+        yield "".join(lines)
+
+
+# Splits the text of one game into (headers, san moves, result)
+def parseGame(text):
+    headers = {}
+    movetext = []
+    for line in text.splitlines():
+        stripped = line.strip()
+        if stripped.startswith("["):
+            match = HEADER_PATTERN.match(stripped)
+            if match:
+                headers[match.group(1)] = match.group(2).replace('\\"', '"')
+        elif not stripped.startswith("%"):
+            movetext.append(line)
+
+    movetext = COMMENT_PATTERN.sub(" ", "\n".join(movetext))
+    # Variations can nest, so remove the innermost ones until none are left
+    while "(" in movetext:
+        movetext, count = VARIATION_PATTERN.subn(" ", movetext)
+        if not count:
+            break
+    movetext = NAG_PATTERN.sub(" ", movetext)
+
+    moves = []
+    result = headers.get("Result", "*")
+    for token in movetext.split():
+        if token in RESULTS:
+            result = token
+            continue
+        token = MOVE_NUMBER_PATTERN.sub("", token)
+        if token:
+            moves.append(token)
+    return headers, moves, result
+
+
+# Streams (headers, san moves, result) for every game in a PGN file
+def readGames(source):
+    for text in iterGameTexts(source):
+        yield parseGame(text)
+
+
+# Replays one game through Game.move and reports whether every move was legal, threefold repetition and
+# the fifty move rule do not end the game since recorded games may play on without claiming them
+# Returns a dict with the game index, headers, plies played, outcome and the first error (if any)
+def replayGame(headers, moves, result, index=0, collectPositions=False):
+    report = {
+        "index": index,
+        "headers": headers,
+        "result": result,
+        "plies": 0,
+        "outcome": None,
+        "error": None,
+        "positions": [] if collectPositions else None,
+    }
+    try:
+        if "FEN" in headers:
+            game = Game.from_fen(headers["FEN"], replay=True)
+        else:
+            game = Game(Game.defaultBoard(), replay=True)
+    except (ValueError, KeyError, IndexError):
+        report["error"] = {
+            "type": "InputDecodingError",
+            "message": InputDecodingError(headers["FEN"]).message,
+            "ply": 0,
+            "san": None,
+            "fen": headers["FEN"],
+        }
+        return report
+
+    if collectPositions:
+        report["positions"].append(game.to_fen())
+    for ply, san in enumerate(moves):
+        try:
+            a, b, promotionPiece = sanToSquares(game, san)
+            game.move(a, b, promotionPiece)
+        except Exception as error:
+            report["error"] = {
+                "type": type(error).__name__,
+                "message": getattr(error, "message", str(error)),
+                "ply": ply,
+                "san": san,
+                # Game.move validates before changing anything, so this is the position the move was played from
+                "fen": game.to_fen(),
+            }
+            break
+        report["plies"] = ply + 1
+        if collectPositions:
+            report["positions"].append(game.to_fen())
+    report["outcome"] = game.outcome
+    return report
+
+
+def _replayText(item, collectPositions=False):
+    index, text = item
+    headers, moves, result = parseGame(text)
+    return replayGame(headers, moves, result, index, collectPositions)
+
+
+# Validates every game in a PGN file, yielding one report per game in file order
+# With workers > 1 games are parsed and replayed in a process pool while this process only splits the file
+def validateGames(source, workers=1, collectPositions=False, chunksize=64):
+    texts = enumerate(iterGameTexts(source))
+    replay = functools.partial(_replayText, collectPositions=collectPositions)
+    if workers <= 1:
+        yield from map(replay, texts)
+        return
+    with multiprocessing.Pool(workers) as pool:
+        yield from pool.imap(replay, texts, chunksize)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Stream a PGN file and validate every game")
+    parser.add_argument("path", help="PGN file to read")
+    parser.add_argument("--workers", type=int, default=1, help="number of worker processes")
+    parser.add_argument("--quiet", action="store_true", help="only print the summary")
+    args = parser.parse_args(args)
+
+    start = time.perf_counter()
+    games, invalid, plies = 0, 0, 0
+    for report in validateGames(args.path, args.workers):
+        games += 1
+        plies += report["plies"]
+        error = report["error"]
+        if error is not None:
+            invalid += 1
+            if not args.quiet:
+                print(
+                    f"game {report['index'] + 1}: {error['type']} at ply {error['ply'] + 1} "
+                    f"({error['san']}): {error['message']} [{error['fen']}]"
+                )
+    seconds = time.perf_counter() - start
+    print(
+        f"games {games}  invalid {invalid}  plies {plies}  time {seconds:.2f}s  "
+        f"games/s {games / max(seconds, 1e-9):.0f}"
+    )
+    return 1 if invalid else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -40,58 +40,114 @@ class Square:
         return Square.dictToString(Square.tupleToDict(squareString))
 
 
+KNIGHT_STEPS = ((2, 1), (-2, 1), (2, -1), (-2, -1), (1, 2), (-1, 2), (1, -2), (-1, -2))
+KING_STEPS = ((1, 0), (1, 1), (1, -1), (0, 1), (0, -1), (-1, 0), (-1, 1), (-1, -1))
+CARDINALS = ((1, 0), (0, 1), (-1, 0), (0, -1))
+DIAGONALS = ((1, 1), (-1, 1), (1, -1), (-1, -1))
+
+
+# Maps every square to the on-board squares one step away
+def _stepTable(steps):
+    return {
+        (r, c): tuple(
+            (r + dr, c + dc) for dr, dc in steps if Square.isOnBoard(r + dr, c + dc)
+        )
+        for r in range(8)
+        for c in range(8)
+    }
+
+
+# Maps every square to its rays, one tuple of squares per direction ordered outwards (empty rays are left out)
+def _rayTable(directions):
+    table = {}
+    for r in range(8):
+        for c in range(8):
+            rays = []
+            for dr, dc in directions:
+                ray = []
+                row, col = r + dr, c + dc
+                while Square.isOnBoard(row, col):
+                    ray.append((row, col))
+                    row, col = row + dr, col + dc
+                if ray:
+                    rays.append(tuple(ray))
+            table[(r, c)] = tuple(rays)
+    return table
+
+
+# Precomputed once at import, move generation is a table lookup plus a blocker check
+KNIGHT_TARGETS = _stepTable(KNIGHT_STEPS)
+KING_TARGETS = _stepTable(KING_STEPS)
+ROOK_RAYS = _rayTable(CARDINALS)
+BISHOP_RAYS = _rayTable(DIAGONALS)
+QUEEN_RAYS = _rayTable(CARDINALS + DIAGONALS)
+PAWN_CAPTURES = {WHITE: _stepTable(((1, -1), (1, 1))), BLACK: _stepTable(((-1, -1), (-1, 1)))}
+
+
 class Board:
     @staticmethod
     def executeMove(a, b, board, promotionPiece=None):
-        piece = board.get((a["row"], a["col"]))
-
-        # Double pawn move
-        if type(piece) == Pawn and b["row"] - a["row"] in [-2, 2]:
-            board[(b["row"], b["col"])] = board[(a["row"], a["col"])]
-            sides = [
-                board.get((b["row"], b["col"] - 1)),
-                board.get((b["row"], b["col"] + 1)),
-            ]
-            for side in sides:
-                if (
-                    side is not None
-                    and type(side) == Pawn
-                    and side.color != board[(b["row"], b["col"])].color
-                ):
-                    side.enPassant = {"col": b["col"], "age": 0}
+        Board.make_move(a, b, board, promotionPiece)
+        return board
+
+    # Plays a move on the board in place and returns an undo record for unmake_move
+    # The record holds the previous contents of every touched square, pieces themselves never change
+    @staticmethod
+    def make_move(a, b, board, promotionPiece=None):
+        squares = []
+
+        def setSquare(location, piece):
+            squares.append((location, board.get(location)))
+            if piece is None:
+                del board[location]
+            else:
+                board[location] = piece
+
+        aLocation, bLocation = (a["row"], a["col"]), (b["row"], b["col"])
+        piece = board.get(aLocation)
 
         # Pawn promotion
-        elif type(piece) == Pawn and b["row"] in [0, 7]:
+        if type(piece) == Pawn and b["row"] in [0, 7]:
             if promotionPiece is None:
                 promotionPiece = Queen
-            board[(b["row"], b["col"])] = promotionPiece(piece.color)
+            setSquare(bLocation, promotionPiece(piece.color))
 
         # En Passant
         elif (
             type(piece) == Pawn
             and b["col"] != a["col"]
-            and board.get((b["row"], b["col"])) is None
+            and board.get(bLocation) is None
         ):
-            board[(b["row"], b["col"])] = board[(a["row"], a["col"])]
-            del board[(a["row"], b["col"])]
+            setSquare(bLocation, piece)
+            setSquare((a["row"], b["col"]), None)
 
         # Castling
         elif type(piece) == King and b["col"] - a["col"] in [-2, 2]:
-            if b["col"] == 2:
-                board[(b["row"], b["col"])] = board[(a["row"], a["col"])]
-                board[(b["row"], 3)] = board[(b["row"], 0)]
-                del board[(a["row"], 0)]
-            elif b["col"] == 6:
-                board[(b["row"], b["col"])] = board[(a["row"], a["col"])]
-                board[(b["row"], 5)] = board[(b["row"], 7)]
-                del board[(a["row"], 7)]
+            rookCol, rookTarget = (0, 3) if b["col"] == 2 else (7, 5)
+            setSquare(bLocation, piece)
+            setSquare((b["row"], rookTarget), board[(b["row"], rookCol)])
+            setSquare((a["row"], rookCol), None)
 
         # Normal move
         else:
-            board[(b["row"], b["col"])] = board[(a["row"], a["col"])]
+            setSquare(bLocation, piece)
 
-        del board[(a["row"], a["col"])]
-        return board
+        setSquare(aLocation, None)
+        return squares
+
+    # Reverts a move played with make_move, undo records must be unmade in reverse order
+    @staticmethod
+    def unmake_move(board, undo):
+        for location, piece in reversed(undo):
+            if piece is None:
+                board.pop(location, None)
+            else:
+                board[location] = piece
+
+    # Pieces are shared and immutable, so a copy of the square dict is a complete copy of the board
+    @staticmethod
+    def copy(board):
+        return dict(board)
 
     @staticmethod
     def insufficientMaterial(board):
@@ -117,16 +173,6 @@ class Board:
                         return False
             return True
 
-    @staticmethod
-    def updateEnPassant(board):
-        for location, piece in board.items():
-            # en passant
-            if type(piece) == Pawn and piece.enPassant["col"] != -1:
-                piece.enPassant["age"] += 1
-                if piece.enPassant["age"] > 1:
-                    piece.enPassant["age"] = 0
-                    piece.enPassant["col"] = -1
-
     @staticmethod
     def scanForCheck(board):
         def canSeeKing(kingLocation, pieceList, board):
@@ -160,40 +206,61 @@ class Board:
         return {WHITE: False, BLACK: False}
 
 
+# Pieces are flyweights: one immutable instance per class and color, shared by every board
+# Per game state (castling rights, en passant) lives in the position, see chess.bitboard.Position
 class Piece:
-    def __init__(self, color) -> None:
-        self.color = color
-        self.CARDINALS = [(1, 0), (0, 1), (-1, 0), (0, -1)]
-        self.DIAGONALS = [(1, 1), (-1, 1), (1, -1), (-1, -1)]
+    __slots__ = ("color", "icon")
+    _instances = {}
+
+    def __new__(cls, color):
+        instance = Piece._instances.get((cls, color))
+        if instance is None:
+            instance = object.__new__(cls)
+            object.__setattr__(instance, "color", color)
+            object.__setattr__(instance, "icon", ICON_DICT[color][cls])
+            Piece._instances[(cls, color)] = instance
+        return instance
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is shared between boards and cannot be changed")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is shared between boards and cannot be changed")
+
+    # Unpickles (and copies) to the shared instance
+    def __reduce__(self):
+        return (type(self), (self.color,))
 
     # Returns a boolean that dictates whether the move is legal
-    def validateMove(self, board, a, b):
-        return (b["row"], b["col"]) in self.availableMoves(board, a["row"], a["col"])
+    # position supplies castling rights and the en passant square, see availableMoves
+    def validateMove(self, board, a, b, position=None):
+        return (b["row"], b["col"]) in self.availableMoves(board, a["row"], a["col"], position)
 
-    def availableMoves(self, board, r, c):
+    def availableMoves(self, board, r, c, position=None):
         raise RuntimeError()
 
-    # Checks if the prospective move is on the board and either empty or an opposing piece
-    def noConflict(self, board, r, c):
-        return Square.isOnBoard(r, c) and (
-            ((r, c) not in board) or board[(r, c)].color != self.color
-        )
+    # Returns the step targets that are empty or hold an opposing piece
+    def findStepMoves(self, board, targets):
+        color = self.color
+        return [
+            location
+            for location in targets
+            if location not in board or board[location].color != color
+        ]
 
-    # Returns list of potential moves using iterative approach on either CARDINALS or DIAGONALS
-    def findAvailableMoves(self, board, r, c, intervals):
+    # Returns list of potential moves walking the precomputed rays until the first blocker
+    def findAvailableMoves(self, board, rays):
         moves = []
-        for row, col in intervals:
-            tempRow, tempCol = r + row, c + col
-            while Square.isOnBoard(tempRow, tempCol):
-                target = board.get((tempRow, tempCol))
+        color = self.color
+        for ray in rays:
+            for location in ray:
+                target = board.get(location)
                 if target is None:
-                    moves.append((tempRow, tempCol))
-                elif target.color != self.color:
-                    moves.append((tempRow, tempCol))
-                    break
-                else:
-                    break
-                tempRow, tempCol = tempRow + row, tempCol + col
+                    moves.append(location)
+                    continue
+                if target.color != color:
+                    moves.append(location)
+                break
         return moves
 
     def __str__(self) -> str:
@@ -203,203 +270,122 @@ class Piece:
         return self.icon
 
 
-# Class for pieces that need to be tracked for their first move (king, rook)
-class TrackedPiece(Piece):
-    def __init__(self, color) -> None:
-        super().__init__(color)
-        self.moved = False
+class Rook(Piece):
+    __slots__ = ()
 
-    # Overrides validateMove to reset moved to False if the attempted move is illegal
-    def validateMove(self, board, a, b):
-        validity = (b["row"], b["col"]) in self.availableMoves(
-            board, a["row"], a["col"]
-        )
-        if not self.moved:
-            self.moved = validity
-        return validity
-
-
-class Rook(TrackedPiece):
-    def __init__(self, color) -> None:
-        super().__init__(color)
-        self.icon = ICON_DICT[color][Rook]
-
-    def availableMoves(self, board, r, c):
-        return self.findAvailableMoves(board, r, c, self.CARDINALS)
+    def availableMoves(self, board, r, c, position=None):
+        return self.findAvailableMoves(board, ROOK_RAYS[(r, c)])
 
 
 class Knight(Piece):
-    def __init__(self, color) -> None:
-        super().__init__(color)
-        self.icon = ICON_DICT[color][Knight]
+    __slots__ = ()
 
-    # Set of all legal knight moves given a base square
-    @staticmethod
-    def knightList(r, c, a, b):
-        return [
-            (r + a, c + b),
-            (r - a, c + b),
-            (r + a, c - b),
-            (r - a, c - b),
-            (r + b, c + a),
-            (r - b, c + a),
-            (r + b, c - a),
-            (r - b, c - a),
-        ]
-
-    def availableMoves(self, board, r, c):
-        return [
-            (row, col)
-            for row, col in self.knightList(r, c, 2, 1)
-            if self.noConflict(board, row, col)
-        ]
+    def availableMoves(self, board, r, c, position=None):
+        return self.findStepMoves(board, KNIGHT_TARGETS[(r, c)])
 
 
 class Bishop(Piece):
-    def __init__(self, color) -> None:
-        super().__init__(color)
-        self.icon = ICON_DICT[color][Bishop]
+    __slots__ = ()
 
-    def availableMoves(self, board, r, c):
-        return self.findAvailableMoves(board, r, c, self.DIAGONALS)
+    def availableMoves(self, board, r, c, position=None):
+        return self.findAvailableMoves(board, BISHOP_RAYS[(r, c)])
 
 
 class Queen(Piece):
-    def __init__(self, color) -> None:
-        super().__init__(color)
-        self.icon = ICON_DICT[color][Queen]
+    __slots__ = ()
 
-    def availableMoves(self, board, r, c):
-        return self.findAvailableMoves(board, r, c, self.CARDINALS + self.DIAGONALS)
+    def availableMoves(self, board, r, c, position=None):
+        return self.findAvailableMoves(board, QUEEN_RAYS[(r, c)])
 
 
-class King(TrackedPiece):
-    def __init__(self, color) -> None:
-        super().__init__(color)
-        self.icon = ICON_DICT[color][King]
+class King(Piece):
+    __slots__ = ()
 
-    # Set of all legal king moves given a base square
-    @staticmethod
-    def kingList(r, c):
-        return [
-            (r + 1, c),
-            (r + 1, c + 1),
-            (r + 1, c - 1),
-            (r, c + 1),
-            (r, c - 1),
-            (r - 1, c),
-            (r - 1, c + 1),
-            (r - 1, c - 1),
-        ]
+    # Castling needs the rights from position (Game.availableMoves passes the game's), without one
+    # they are read off the home squares of a position built from the bare board
+    def availableMoves(self, board, r, c, position=None):
+        return self.findStepMoves(board, KING_TARGETS[(r, c)]) + self.castlingMoves(board, position)
 
-    def availableMoves(self, board, r, c):
-        castlingMoves = self.castlingMoves(board)
-        return [
-            (row, col)
-            for row, col in self.kingList(r, c)
-            if self.noConflict(board, row, col)
-        ] + castlingMoves
-
-    # Overrides validateMove to reset moved to False if the attempted move is illegal
-    def validateMove(self, board, a, b):
-        validity = (b["row"], b["col"]) in self.availableMoves(
-            board, a["row"], a["col"]
-        )
-        if not self.moved:
-            self.moved = validity
-        return validity
+    def castlingMoves(self, board, position=None):
+        # Imported here since chess.bitboard builds on the piece classes in this module
+        from chess.bitboard import Position, COLOR_INDEX, squareIndex
+        from chess.bitboard import WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE
 
-    def castlingMoves(self, board):
-        if self.moved:
+        row = {WHITE: 0, BLACK: 7}[self.color]
+        if board.get((row, 4)) is not self:
+            return []
+        if position is None:
+            position = Position.fromBoard(board)
+        kingside, queenside = {
+            WHITE: (WHITE_KINGSIDE, WHITE_QUEENSIDE),
+            BLACK: (BLACK_KINGSIDE, BLACK_QUEENSIDE),
+        }[self.color]
+        if not position.castling & (kingside | queenside):
             return []
 
-        board = board.copy()
-        col = {WHITE: 0, BLACK: 7}[self.color]
+        # Squares attacked by the opponent, looked up from the position's attack map
+        attacked = position.attackMap(COLOR_INDEX[self.color] ^ 1)
+
+        def isAttacked(c):
+            return attacked >> squareIndex(row, c) & 1
+
         castlingMoves = []
-        # queenside castle, rook present, rook hasnt moved, no pieces in between, not in check
+        if isAttacked(4):
+            return castlingMoves
+        rook = Rook(self.color)
+        # queenside castle, right kept, rook present, no pieces in between, not passing through check
         if (
-            type(board.get((col, 0))) == Rook
-            and not board.get((col, 0)).moved
-            and [board.get((col, 1)), board.get((col, 2)), board.get((col, 3))]
+            position.castling & queenside
+            and board.get((row, 0)) is rook
+            and [board.get((row, 1)), board.get((row, 2)), board.get((row, 3))]
             == [None, None, None]
-            and Board.scanForCheck(board)[self.color] == False
+            and not isAttacked(3)
+            and not isAttacked(2)
         ):
-            # if moving one to the left doesnt result in check
-            board = Board.executeMove(
-                Square.tupleToDict((col, 4)), Square.tupleToDict((col, 3)), board
-            )
-            if not Board.scanForCheck(board)[self.color]:
-                # if moving two to the left doesnt result in check
-                board = Board.executeMove(
-                    Square.tupleToDict((col, 3)), Square.tupleToDict((col, 2)), board
-                )
-                if not Board.scanForCheck(board)[self.color]:
-                    castlingMoves.append((col, 2))
-        # kingside castle, rook present, rook hasnt moved, no pieces in between and not in check
+            castlingMoves.append((row, 2))
+        # kingside castle, right kept, rook present, no pieces in between, not passing through check
         if (
-            type(board.get((col, 7))) == Rook
-            and not board.get((col, 7)).moved
-            and [board.get((col, 5)), board.get((col, 6))] == [None, None]
-            and not Board.scanForCheck(board)[self.color]
+            position.castling & kingside
+            and board.get((row, 7)) is rook
+            and [board.get((row, 5)), board.get((row, 6))] == [None, None]
+            and not isAttacked(5)
+            and not isAttacked(6)
         ):
-            # if moving one to the right doesnt result in check
-            board = Board.executeMove(
-                Square.tupleToDict((col, 4)), Square.tupleToDict((col, 5)), board
-            )
-            if not Board.scanForCheck(board)[self.color]:
-                # if moving two to the right doesnt result in check
-                board = Board.executeMove(
-                    Square.tupleToDict((col, 5)), Square.tupleToDict((col, 6)), board
-                )
-                if not Board.scanForCheck(board)[self.color]:
-                    castlingMoves.append((col, 6))
+            castlingMoves.append((row, 6))
         return castlingMoves
 
 
 class Pawn(Piece):
-    # Accepts a direction, which is 1 for white and -1 for black
-    def __init__(self, color):
-        if color == WHITE:
-            self.icon = ICON_DICT[WHITE][Pawn]
-            self.direction = 1
-        else:
-            self.icon = ICON_DICT[BLACK][Pawn]
-            self.direction = -1
-        self.color = color
-        # En passant validity status for each individual piece
-        self.enPassant = {"col": -1, "age": 0}
+    __slots__ = ()
 
-    def availableMoves(self, board, r, c):
+    # 1 for white and -1 for black
+    @property
+    def direction(self):
+        return 1 if self.color == WHITE else -1
+
+    # En passant needs the en passant square from position, without one it is never available
+    def availableMoves(self, board, r, c, position=None):
         moves = []
-        enPassantRow = {WHITE: 4, BLACK: 3}[self.color]
+        direction = self.direction
         startingRow = {WHITE: 1, BLACK: 6}[self.color]
         # En passant
-        if self.enPassant["col"] != -1 and r == enPassantRow:
-            moves.append((enPassantRow + self.direction, self.enPassant["col"]))
-        # capturing to the left
-        if (r + self.direction, c - 1) in board and self.noConflict(
-            board, r + self.direction, c - 1
-        ):
-            moves.append((r + self.direction, c - 1))
-        # capturing to the right
-        if (r + self.direction, c + 1) in board and self.noConflict(
-            board, r + self.direction, c + 1
-        ):
-            moves.append((r + self.direction, c + 1))
+        if position is not None and position.epSquare != -1 and position.turn == self.color:
+            epRow, epCol = divmod(position.epSquare, 8)
+            if epRow == r + direction and epCol in (c - 1, c + 1):
+                moves.append((epRow, epCol))
+        # capturing to the left and right
+        for location in PAWN_CAPTURES[self.color][(r, c)]:
+            target = board.get(location)
+            if target is not None and target.color != self.color:
+                moves.append(location)
         # moving forward by one
-        if (r + self.direction, c) not in board:
-            moves.append((r + self.direction, c))
+        if (r + direction, c) not in board:
+            moves.append((r + direction, c))
         # moving forward by two on first move
-        if r == startingRow and ((r + self.direction, c) in moves) and not (r + (2 * self.direction), c) in board:
-            moves.append((r + (2 * self.direction), c))
+        if r == startingRow and ((r + direction, c) in moves) and not (r + (2 * direction), c) in board:
+            moves.append((r + (2 * direction), c))
         return moves
 
-    # Returns a boolean that dictates whether the move is legal
-    def validateMove(self, board, a, b):
-        if not (b["row"], b["col"]) in self.availableMoves(board, a["row"], a["col"]):
-            return False
-        return True
-
 
 ICON_DICT = {
     WHITE: {Rook: "♖", Knight: "♘", Bishop: "♗", King: "♔", Queen: "♕", Pawn: "♙"},
@@ -0,0 +1,242 @@
+from chess.game import Game
+from chess.bitboard import Position
+from chess.storage import GameDatabase, playMove, encodeMoves, decodeMoves
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import itertools
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+
+# Games replayed and written per transaction in bulk builds
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_LIMIT = 100
+
+# positions is clustered on the Zobrist key, so finding a position reads one range of the table
+# however many games are indexed. Games are numbered to keep the rows small, indexedGames also keeps the
+# moves indexed so far and the position after them, so later moves are appended without a replay
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS indexedGames (
+    number INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE,
+    startFen TEXT NOT NULL,
+    moves BLOB NOT NULL,
+    fen TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS positions (
+    key INTEGER NOT NULL,
+    game INTEGER NOT NULL,
+    ply INTEGER NOT NULL,
+    PRIMARY KEY (key, game, ply)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS positionsByGame ON positions (game, ply);
+"""
+
+
+# Zobrist keys are unsigned 64 bit, SQLite integers are signed
+def signedKey(key):
+    return key - (1 << 64) if key >= 1 << 63 else key
+
+
+# Accepts a Zobrist key, a Position, a Game or a FEN string
+def positionKey(item):
+    if isinstance(item, int):
+        return item
+    if isinstance(item, Game):
+        return item.position.key
+    if isinstance(item, str):
+        return Position.fromFen(item).key
+    return item.key
+
+
+# Replays moves through Game.move from the position fen, which is reached after firstPly plies
+# Returns the (ply, key) of every position after keepAfter and the FEN of the last position
+# Games may play on past a repetition or fifty quiet moves nobody claimed, so they are replayed in replay
+# mode. Those draws then never end the replay, which is also why an incremental replay from a saved FEN
+# can start without the repetition counts of the plies before it
+def replayKeys(fen, moves, firstPly, keepAfter):
+    game = Game.from_fen(fen, replay=True)
+    keys = [(firstPly, game.position.key)] if firstPly > keepAfter else []
+    for ply, move in enumerate(moves, firstPly + 1):
+        playMove(game, move)
+        if ply > keepAfter:
+            keys.append((ply, game.position.key))
+    return keys, game.position.toFen()
+
+
+def _replayKeys(job):
+    return replayKeys(*job)
+
+
+# Inverted index from position to the games (and plies) reaching it, in its own SQLite file next to the
+# game database. Games are indexed incrementally as they grow and in batches for bulk builds
+class PositionIndex:
+    def __init__(self, path=":memory:") -> None:
+        self.path = path
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        if path != ":memory:":
+            self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.executescript(SCHEMA)
+        self.lock = threading.Lock()
+        self.lookups = 0
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    # What has to be replayed for a game given what is indexed already: returns (game number or None,
+    # plies to delete after or None, replay job) or None when the index is up to date
+    def plan(self, gameId, startFen, moves):
+        row = self.connection.execute(
+            "SELECT number, startFen, moves, fen FROM indexedGames WHERE id = ?", (gameId,)
+        ).fetchone()
+        if row is None:
+            return None, None, (startFen, moves, 0, -1)
+        number, indexedFen, indexedMoves, fen = row
+        indexedMoves = decodeMoves(indexedMoves)
+        if indexedFen != startFen:
+            return number, -1, (startFen, moves, 0, -1)
+        common = 0
+        for indexed, move in zip(indexedMoves, moves):
+            if indexed != move:
+                break
+            common += 1
+        if common == len(indexedMoves):
+            if common == len(moves):
+                return None
+            # Only new moves, replayed from the last indexed position
+            return number, None, (fen, moves[common:], common, common)
+        # An undo or a different continuation, plies after the common moves are indexed again
+        return number, common, (startFen, moves, 0, common)
+
+    # Writes the replayed positions of a game, must run inside a transaction
+    def write(self, gameId, startFen, moves, number, deleteAfter, keys, fen):
+        if number is None:
+            number = self.connection.execute(
+                "INSERT INTO indexedGames (id, startFen, moves, fen) VALUES (?, ?, ?, ?)",
+                (gameId, startFen, encodeMoves(moves), fen),
+            ).lastrowid
+        else:
+            self.connection.execute(
+                "UPDATE indexedGames SET startFen = ?, moves = ?, fen = ? WHERE number = ?",
+                (startFen, encodeMoves(moves), fen, number),
+            )
+        if deleteAfter is not None:
+            self.connection.execute("DELETE FROM positions WHERE game = ? AND ply > ?", (number, deleteAfter))
+        # Sorted by key so the inserts walk the table in order
+        rows = sorted((signedKey(key), number, ply) for ply, key in keys)
+        self.connection.executemany("INSERT OR IGNORE INTO positions (key, game, ply) VALUES (?, ?, ?)", rows)
+        return len(rows)
+
+    # Indexes a game's positions, only the plies that changed since it was last indexed are replayed
+    def indexGame(self, gameId, startFen, moves):
+        with self.lock, self.connection:
+            plan = self.plan(gameId, startFen, moves)
+            if plan is None:
+                return 0
+            number, deleteAfter, job = plan
+            keys, fen = replayKeys(*job)
+            return self.write(gameId, startFen, moves, number, deleteAfter, keys, fen)
+
+    # Indexes many (id, startFen, moves) records, batchSize games per transaction, replaying them in
+    # worker processes (processes=1 replays in this process). Returns the number of games and positions
+    def indexRecords(self, records, batchSize=DEFAULT_BATCH_SIZE, processes=1):
+        games = positions = 0
+        executor = None
+        if processes != 1:
+            executor = ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context("spawn"))
+        try:
+            records = iter(records)
+            while batch := list(itertools.islice(records, batchSize)):
+                with self.lock:
+                    plans = [(record, self.plan(*record)) for record in batch]
+                plans = [(record, plan) for record, plan in plans if plan is not None]
+                jobs = [plan[2] for record, plan in plans]
+                if executor is None:
+                    replays = [_replayKeys(job) for job in jobs]
+                else:
+                    replays = list(executor.map(_replayKeys, jobs, chunksize=max(1, len(jobs) // (4 * processes))))
+                with self.lock, self.connection:
+                    for ((gameId, startFen, moves), (number, deleteAfter, job)), (keys, fen) in zip(plans, replays):
+                        positions += self.write(gameId, startFen, moves, number, deleteAfter, keys, fen)
+                games += len(plans)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        return games, positions
+
+    # Indexes every game of a GameDatabase
+    def build(self, database, batchSize=DEFAULT_BATCH_SIZE, processes=1):
+        return self.indexRecords(database.records(), batchSize, processes)
+
+    def removeGame(self, gameId):
+        with self.lock, self.connection:
+            row = self.connection.execute("SELECT number FROM indexedGames WHERE id = ?", (gameId,)).fetchone()
+            if row is not None:
+                self.connection.execute("DELETE FROM positions WHERE game = ?", row)
+                self.connection.execute("DELETE FROM indexedGames WHERE number = ?", row)
+
+    # (game id, ply) of the games reaching the position, a game repeating it is listed once per ply
+    def find(self, item, limit=DEFAULT_LIMIT):
+        with self.lock:
+            self.lookups += 1
+            return self.connection.execute(
+                "SELECT indexedGames.id, positions.ply FROM positions "
+                "JOIN indexedGames ON indexedGames.number = positions.game "
+                "WHERE positions.key = ? ORDER BY positions.game, positions.ply LIMIT ?",
+                (signedKey(positionKey(item)), limit),
+            ).fetchall()
+
+    # Number of games reaching the position
+    def count(self, item):
+        with self.lock:
+            self.lookups += 1
+            return self.connection.execute(
+                "SELECT count(DISTINCT game) FROM positions WHERE key = ?", (signedKey(positionKey(item)),)
+            ).fetchone()[0]
+
+    def __contains__(self, gameId):
+        with self.lock:
+            return self.connection.execute(
+                "SELECT 1 FROM indexedGames WHERE id = ?", (gameId,)
+            ).fetchone() is not None
+
+    def stats(self):
+        with self.lock:
+            games = self.connection.execute("SELECT count(*) FROM indexedGames").fetchone()[0]
+        return {"games": games, "lookups": self.lookups}
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Build or query a position index over a game database")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="index every game of a game database")
+    build.add_argument("database", help="game database to read")
+    build.add_argument("index", help="position index to write, existing games are updated")
+    build.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="games per transaction")
+    build.add_argument("--processes", type=int, default=None, help="replay processes (default: all cores)")
+    find = commands.add_parser("find", help="list the games reaching a position")
+    find.add_argument("index", help="position index to read")
+    find.add_argument("fen")
+    find.add_argument("--limit", type=int, default=DEFAULT_LIMIT)
+    args = parser.parse_args(args)
+
+    start = time.perf_counter()
+    if args.command == "build":
+        database = GameDatabase(args.database)
+        index = PositionIndex(args.index)
+        games, positions = index.build(database, args.batch_size, args.processes or os.cpu_count() or 1)
+        print(f"games {games}  positions {positions}  time {time.perf_counter() - start:.2f}s")
+        return 0
+
+    index = PositionIndex(args.index)
+    for gameId, ply in index.find(args.fen, args.limit):
+        print(f"{gameId}  ply {ply}")
+    print(f"games {index.count(args.fen)}  time {(time.perf_counter() - start) * 1000:.1f}ms")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
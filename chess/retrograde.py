@@ -0,0 +1,456 @@
+from chess.bitboard import PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING
+from chess.bitboard import KNIGHT_ATTACKS, KING_ATTACKS, PAWN_ATTACKS, BETWEEN, DIRECTIONS, squares
+from chess.tablebase import TableLayout, HEADER, MAGIC, EXTENSION, TRIVIAL_DRAWS, UNREACHED
+from chess.tablebase import TABLE_ORDER, LETTER_BY_PIECE, SYMMETRIES, tableName, splitName
+import numpy as np
+import os
+import time
+
+# Retrograde generation of the tables in chess.tablebase, every array is indexed like the table file:
+# side to move * 64^pieces + the squares of the pieces in layout order
+# Captures and promotions leave the table, their results are read from the smaller tables generated first
+
+# Positions decoded and searched at a time, bounds the memory of the move generation arrays
+CHUNK_SIZE = 1 << 20
+PROMOTIONS = (QUEEN, ROOK, BISHOP, KNIGHT)
+
+
+def _stepTargets(attacks):
+    table = np.full((8, 64), -1, dtype=np.int64)
+    for sq in range(64):
+        for index, target in enumerate(squares(attacks[sq])):
+            table[index, sq] = target
+    return table
+
+
+def _rayTargets():
+    table = np.full((8, 64, 7), -1, dtype=np.int64)
+    for d, (dr, dc) in enumerate(DIRECTIONS):
+        for sq in range(64):
+            r, c = divmod(sq, 8)
+            for distance in range(7):
+                r, c = r + dr, c + dc
+                if not (0 <= r < 8 and 0 <= c < 8):
+                    break
+                table[d, sq, distance] = r * 8 + c
+    return table
+
+
+def _reach(attacks):
+    table = np.zeros((64, 64), dtype=bool)
+    for sq in range(64):
+        table[sq, list(squares(attacks[sq]))] = True
+    return table
+
+
+def _lines(directions):
+    table = np.zeros((64, 64), dtype=bool)
+    rays = _rayTargets()
+    for d in directions:
+        for sq in range(64):
+            targets = rays[d, sq]
+            table[sq, targets[targets >= 0]] = True
+    return table
+
+
+KING_STEPS = _stepTargets(KING_ATTACKS)
+KNIGHT_STEPS = _stepTargets(KNIGHT_ATTACKS)
+PAWN_CAPTURES = [_stepTargets(PAWN_ATTACKS[0]), _stepTargets(PAWN_ATTACKS[1])]
+RAY_TARGETS = _rayTargets()
+SLIDER_DIRECTIONS = {ROOK: (0, 1, 4, 5), BISHOP: (2, 3, 6, 7), QUEEN: tuple(range(8))}
+# REACH[color][ptype][attacker, target] for pieces that attack without rays, LINES for sliders
+KING_REACH = _reach(KING_ATTACKS)
+KNIGHT_REACH = _reach(KNIGHT_ATTACKS)
+PAWN_REACH = [_reach(PAWN_ATTACKS[0]), _reach(PAWN_ATTACKS[1])]
+LINES = {ROOK: _lines(SLIDER_DIRECTIONS[ROOK]), BISHOP: _lines(SLIDER_DIRECTIONS[BISHOP])}
+LINES[QUEEN] = LINES[ROOK] | LINES[BISHOP]
+BETWEEN_BITS = np.array(BETWEEN, dtype=np.uint64)
+SQUARE_BITS = np.array([1 << sq for sq in range(64)], dtype=np.uint64)
+ROWS = np.arange(64) // 8
+
+
+# Squares of every piece for an array of indices
+def decode(layout, indices):
+    return [(indices // weight) % 64 for weight in layout.weights]
+
+
+# Whether the pieces of one color attack the target squares, pieces are (color, ptype) with their squares
+def attacked(target, color, pieces, pieceSquares, occupied):
+    result = np.zeros(len(target), dtype=bool)
+    for (pieceColor, ptype), sq in zip(pieces, pieceSquares):
+        if pieceColor != color:
+            continue
+        if ptype == KING:
+            result |= KING_REACH[sq, target]
+        elif ptype == KNIGHT:
+            result |= KNIGHT_REACH[sq, target]
+        elif ptype == PAWN:
+            result |= PAWN_REACH[color][sq, target]
+        else:
+            result |= LINES[ptype][sq, target] & ((BETWEEN_BITS[sq, target] & occupied) == 0)
+    return result
+
+
+# Legal positions (distinct squares, no pawns on the first or last rank, the side that just moved is
+# not in check) and whether the side to move is in check, for one chunk of a single side to move
+def legality(layout, side, pieceSquares):
+    count = len(pieceSquares[0])
+    legal = np.ones(count, dtype=bool)
+    occupied = np.zeros(count, dtype=np.uint64)
+    for first in range(layout.count):
+        for second in range(first + 1, layout.count):
+            legal &= pieceSquares[first] != pieceSquares[second]
+        occupied |= SQUARE_BITS[pieceSquares[first]]
+        if layout.pieces[first][1] == PAWN:
+            legal &= (ROWS[pieceSquares[first]] != 0) & (ROWS[pieceSquares[first]] != 7)
+    # Kings are the first two pieces
+    legal &= ~attacked(pieceSquares[side ^ 1], side, layout.pieces, pieceSquares, occupied)
+    inCheck = attacked(pieceSquares[side], side ^ 1, layout.pieces, pieceSquares, occupied)
+    return legal, inCheck & legal
+
+
+# Codes of a trivially drawn table, 0 for legal positions and the illegal code otherwise
+def drawnCodes(name):
+    layout = TableLayout(name)
+    codes = np.full(layout.size, 0xFF, dtype=np.uint8)
+    indices = np.arange(layout.half, dtype=np.int64)
+    for side in (0, 1):
+        legal, inCheck = legality(layout, side, decode(layout, indices))
+        codes[side * layout.half:(side + 1) * layout.half][legal] = 0
+    return codes, 0xFF
+
+
+# Reads a table file and unfolds it into every placement of the pieces
+def readCodes(path):
+    with open(path, "rb") as file:
+        magic, count, width, stored, longest = HEADER.unpack(file.read(HEADER.size))
+        folded = np.fromfile(file, dtype="<u1" if width == 1 else "<u2")
+    layout = TableLayout(stored.rstrip(b"\0").decode())
+    folded = folded.reshape(2, len(layout.kingSquares), layout.weights[0])
+    codes = np.empty((2, 64, layout.weights[0]), dtype=folded.dtype)
+    for whiteKing in range(64):
+        images = np.array(SYMMETRIES[layout.pawns][whiteKing], dtype=np.int64)
+        # Stored index of every placement of the other pieces after the symmetry
+        others = np.zeros(1, dtype=np.int64)
+        for piece in range(layout.count - 1):
+            others = (others[:, None] * 64 + images[None, :]).ravel()
+        codes[:, whiteKing] = folded[:, layout.kingIndex[images[whiteKing]], others]
+    return codes.ravel(), (1 << (8 * width)) - 1
+
+
+# Where a capture or promotion leads: the smaller table and how to index the resulting position in it
+class Exit:
+    def __init__(self, layout, moved, removed=None, promotion=None) -> None:
+        pieces = []
+        for slot, (color, ptype) in enumerate(layout.pieces):
+            if slot == removed:
+                continue
+            pieces.append((color, promotion if slot == moved and promotion is not None else ptype, slot))
+        letters = ["", ""]
+        for color, ptype, slot in pieces:
+            letters[color] += LETTER_BY_PIECE[ptype]
+        self.name, self.flipped = tableName(*letters)
+        if self.flipped:
+            pieces = [(color ^ 1, ptype, slot) for color, ptype, slot in pieces]
+        # Slots of the current table in the order of the smaller table
+        pieces.sort(key=lambda piece: (piece[1] != KING, piece[0], TABLE_ORDER.index(LETTER_BY_PIECE[piece[1]])))
+        self.slots = [slot for color, ptype, slot in pieces]
+        self.moved = moved
+        self.layout = TableLayout(self.name)
+
+    # Indices in the smaller table after the moved piece went to target, the other side is to move
+    def indices(self, side, pieceSquares, target):
+        side ^= 1
+        if self.flipped:
+            side ^= 1
+        index = np.full(len(target), side * self.layout.half, dtype=np.int64)
+        for slot, weight in zip(self.slots, self.layout.weights):
+            sq = target if slot == self.moved else pieceSquares[slot]
+            index += (sq ^ 56 if self.flipped else sq) * weight
+        return index
+
+
+# Generates one table into a file, the tables it leads into must already be in the directory
+# Returns the longest distance to mate in plies
+def generateTable(name, directory):
+    layout = TableLayout(name)
+    size, half = layout.size, layout.half
+    chunk = min(half, CHUNK_SIZE)
+
+    legal = np.zeros(size, dtype=bool)
+    inCheck = np.zeros(size, dtype=bool)
+    for start in range(0, size, chunk):
+        indices = np.arange(start, start + chunk, dtype=np.int64)
+        legal[start:start + chunk], inCheck[start:start + chunk] = legality(
+            layout, start // half, decode(layout, indices)
+        )
+
+    subtables = {}
+    for dependency in exitNames(layout):
+        if dependency in TRIVIAL_DRAWS:
+            subtables[dependency] = drawnCodes(dependency)
+        else:
+            subtables[dependency] = readCodes(os.path.join(directory, dependency + EXTENSION))
+
+    # Moves staying in the table with a legal result, and what the moves leaving it lead to
+    counts = np.zeros(size, dtype=np.int8)
+    exits = np.zeros(size, dtype=np.int8)
+    drawExit = np.zeros(size, dtype=bool)
+    winExit = np.full(size, UNREACHED, dtype=np.int16)
+    lossExit = np.zeros(size, dtype=np.int16)
+    for start in range(0, size, chunk):
+        side = start // half
+        indices = np.arange(start, start + chunk, dtype=np.int64)
+        pieceSquares = decode(layout, indices)
+        quiet = np.zeros(chunk, dtype=np.int8)
+        exitCount = np.zeros(chunk, dtype=np.int8)
+        draws = np.zeros(chunk, dtype=bool)
+        wins = np.full(chunk, UNREACHED, dtype=np.int16)
+        losses = np.zeros(chunk, dtype=np.int16)
+
+        # Records the results of the moves leaving the table for the positions where valid is set
+        def leave(exit, valid, target):
+            where = np.flatnonzero(valid)
+            if not len(where):
+                return
+            codes, illegal = subtables[exit.name]
+            code = codes[exit.indices(side, [sq[where] for sq in pieceSquares], target[where])].astype(np.int32)
+            where, code = where[code != illegal], code[code != illegal]
+            exitCount[where] += 1
+            draws[where[code == 0]] = True
+            # The other side is to move after the exit, so its losses are wins here
+            won = (code > 0) & (code % 2 == 1)
+            wins[where[won]] = np.minimum(wins[where[won]], code[won])
+            lost = (code > 0) & (code % 2 == 0)
+            losses[where[lost]] = np.maximum(losses[where[lost]], code[lost])
+
+        lastRow = 7 if side == 0 else 0
+        for moved, target, empty, enemy in moveTargets(layout, side, pieceSquares):
+            pawn = layout.pieces[moved][1] == PAWN
+            promoting = (ROWS[np.maximum(target, 0)] == lastRow) if pawn else np.zeros(chunk, dtype=bool)
+            stays = empty & ~promoting
+            child = indices + (target - pieceSquares[moved]) * layout.weights[moved] + (half if side == 0 else -half)
+            quiet += stays & legal[np.where(stays, child, 0)]
+            for removed, captures in enemy.items():
+                leave(_exit(layout, moved, removed, None), captures & ~promoting, target)
+            if pawn:
+                for promotion in PROMOTIONS:
+                    leave(_exit(layout, moved, None, promotion), empty & promoting, target)
+                    for removed, captures in enemy.items():
+                        leave(_exit(layout, moved, removed, promotion), captures & promoting, target)
+
+        active = legal[start:start + chunk]
+        counts[start:start + chunk] = np.where(active, quiet, 0)
+        exits[start:start + chunk] = np.where(active, exitCount, 0)
+        drawExit[start:start + chunk] = active & draws
+        winExit[start:start + chunk] = np.where(active, wins, UNREACHED)
+        lossExit[start:start + chunk] = np.where(active, losses, 0)
+
+    dtm = np.full(size, UNREACHED, dtype=np.int16)
+    # Level each undecided position is going to be decided at
+    scheduled = np.full(size, UNREACHED, dtype=np.int16)
+    scheduled[legal & (winExit < UNREACHED)] = winExit[legal & (winExit < UNREACHED)]
+    # Every move leaves the table and loses
+    forced = legal & (counts == 0) & (exits > 0) & ~drawExit & (winExit == UNREACHED)
+    scheduled[forced] = lossExit[forced]
+    scheduled[legal & (counts == 0) & (exits == 0) & inCheck] = 0
+    del winExit, exits, inCheck
+
+    level = 0
+    while True:
+        frontier = np.flatnonzero((scheduled == level) & (dtm == UNREACHED))
+        if not len(frontier):
+            waiting = (scheduled > level) & (scheduled < UNREACHED) & (dtm == UNREACHED)
+            if not waiting.any():
+                break
+            level += 1
+            continue
+        dtm[frontier] = level
+        predecessors = unmoves(layout, frontier, legal)
+        undecided = predecessors[dtm[predecessors] == UNREACHED]
+        if level % 2 == 0:
+            # A move into a lost position wins
+            scheduled[undecided] = np.minimum(scheduled[undecided], level + 1)
+        else:
+            # Positions whose last move to a non losing position is gone are lost
+            undecided, moves = np.unique(undecided, return_counts=True)
+            counts[undecided] -= moves.astype(np.int8)
+            lost = undecided[(counts[undecided] == 0) & ~drawExit[undecided] & (scheduled[undecided] == UNREACHED)]
+            scheduled[lost] = np.maximum(lossExit[lost], level + 1)
+        level += 1
+
+    longest = int(dtm[dtm < UNREACHED].max(initial=0))
+    width = 1 if longest + 1 < 0xFF else 2
+    illegal = (1 << (8 * width)) - 1
+    codes = np.where(dtm < UNREACHED, dtm.astype(np.int32) + 1, 0)
+    codes = np.where(legal, codes, illegal).astype("<u1" if width == 1 else "<u2")
+    # Only the positions with the white king on a stored square are written
+    codes = codes.reshape(2, 64, layout.weights[0])[:, layout.kingSquares]
+
+    # Written next to the target and renamed, so readers never map a half written table
+    path = os.path.join(directory, name + EXTENSION)
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as file:
+        file.write(HEADER.pack(MAGIC, layout.count, width, name.encode(), longest))
+        codes.tofile(file)
+    os.replace(temporary, path)
+    return longest
+
+
+_EXITS = {}
+
+
+def _exit(layout, moved, removed, promotion):
+    key = (layout.name, moved, removed, promotion)
+    if key not in _EXITS:
+        _EXITS[key] = Exit(layout, moved, removed, promotion)
+    return _EXITS[key]
+
+
+# Names of every table a capture or promotion in the layout can lead into
+def exitNames(layout):
+    names = set()
+    for moved, (color, ptype) in enumerate(layout.pieces):
+        for removed, (otherColor, otherType) in enumerate(layout.pieces):
+            if otherColor != color and otherType != KING:
+                names.add(_exit(layout, moved, removed, None).name)
+        if ptype == PAWN:
+            for promotion in PROMOTIONS:
+                names.add(_exit(layout, moved, None, promotion).name)
+                for removed, (otherColor, otherType) in enumerate(layout.pieces):
+                    if otherColor != color and otherType != KING:
+                        names.add(_exit(layout, moved, removed, promotion).name)
+    return names
+
+
+# Pseudo legal moves of the side to move for a chunk of positions, one entry per piece and pattern:
+# (moved slot, target squares (-1 for none), target empty, {enemy slot: target holds it})
+# Kings are never captured, a square holding the enemy king is treated as blocked
+def moveTargets(layout, side, pieceSquares):
+    own = [slot for slot, (color, ptype) in enumerate(layout.pieces) if color == side]
+    enemies = [slot for slot, (color, ptype) in enumerate(layout.pieces) if color != side]
+
+    def classify(moved, target):
+        valid = target >= 0
+        blocked = ~valid
+        for slot in own + enemies:
+            if slot != moved and (slot in own or layout.pieces[slot][1] == KING):
+                blocked |= target == pieceSquares[slot]
+        enemy = {slot: valid & (target == pieceSquares[slot]) for slot in enemies if layout.pieces[slot][1] != KING}
+        empty = ~blocked
+        for hit in enemy.values():
+            empty &= ~hit
+        return empty, enemy
+
+    for moved in own:
+        ptype = layout.pieces[moved][1]
+        sq = pieceSquares[moved]
+        if ptype in (KING, KNIGHT):
+            steps = KING_STEPS if ptype == KING else KNIGHT_STEPS
+            for step in steps:
+                target = step[sq]
+                empty, enemy = classify(moved, target)
+                yield moved, target, empty, enemy
+        elif ptype == PAWN:
+            forward = 8 if side == 0 else -8
+            # Pawns on the last rank only appear in illegal positions, which have no square ahead
+            single = np.where(ROWS[sq] != (7 if side == 0 else 0), sq + forward, -1)
+            empty, enemy = classify(moved, single)
+            yield moved, single, empty, {}
+            startRow = 1 if side == 0 else 6
+            double = np.where(empty & (ROWS[sq] == startRow), sq + 2 * forward, -1)
+            doubleEmpty, doubleEnemy = classify(moved, double)
+            yield moved, double, doubleEmpty & empty & (ROWS[sq] == startRow), {}
+            for step in PAWN_CAPTURES[side]:
+                target = step[sq]
+                empty, enemy = classify(moved, target)
+                yield moved, target, np.zeros(len(sq), dtype=bool), enemy
+        else:
+            for d in SLIDER_DIRECTIONS[ptype]:
+                clear = np.ones(len(sq), dtype=bool)
+                for distance in range(7):
+                    target = np.where(clear, RAY_TARGETS[d, sq, distance], -1)
+                    empty, enemy = classify(moved, target)
+                    yield moved, target, empty, enemy
+                    clear = empty
+                    if not clear.any():
+                        break
+
+
+# Legal positions with the other side to move that reach the frontier positions with one move staying
+# in the table, repeated once per move leading there
+def unmoves(layout, frontier, legal):
+    result = []
+    half = layout.half
+    for side in (0, 1):
+        positions = frontier[(frontier >= half) == bool(side)]
+        if not len(positions):
+            continue
+        pieceSquares = decode(layout, positions)
+        mover = side ^ 1
+        occupied = np.zeros(len(positions), dtype=np.uint64)
+        for sq in pieceSquares:
+            occupied |= SQUARE_BITS[sq]
+
+        def emptyOrigin(origin):
+            valid = origin >= 0
+            return valid & ((SQUARE_BITS[np.maximum(origin, 0)] & occupied) == 0)
+
+        for moved, (color, ptype) in enumerate(layout.pieces):
+            if color != mover:
+                continue
+            sq = pieceSquares[moved]
+            origins = []
+            if ptype in (KING, KNIGHT):
+                for step in KING_STEPS if ptype == KING else KNIGHT_STEPS:
+                    origins.append(step[sq])
+            elif ptype == PAWN:
+                backward = -8 if mover == 0 else 8
+                single = sq + backward
+                valid = (single >= 0) & (single < 64)
+                single = np.where(valid, single, -1)
+                origins.append(single)
+                doubleRow = 3 if mover == 0 else 4
+                double = np.where((ROWS[sq] == doubleRow) & emptyOrigin(single), sq + 2 * backward, -1)
+                origins.append(double)
+            else:
+                for d in SLIDER_DIRECTIONS[ptype]:
+                    clear = np.ones(len(sq), dtype=bool)
+                    for distance in range(7):
+                        origin = np.where(clear, RAY_TARGETS[d, sq, distance], -1)
+                        clear = emptyOrigin(origin)
+                        origins.append(origin)
+                        if not clear.any():
+                            break
+            for origin in origins:
+                valid = emptyOrigin(origin)
+                predecessor = positions + (origin - sq) * layout.weights[moved] + (mover - side) * half
+                predecessor = predecessor[valid]
+                result.append(predecessor[legal[predecessor]])
+    if not result:
+        return np.zeros(0, dtype=np.int64)
+    return np.concatenate(result)
+
+
+# Generates the named tables and every table they depend on that is not in the directory yet, smallest
+# first, yields (name, seconds, longest distance to mate) for each table generated
+def generateTables(names, directory):
+    os.makedirs(directory, exist_ok=True)
+    order = []
+
+    def visit(name):
+        name = tableName(*splitName(name))[0]
+        if name in order or name in TRIVIAL_DRAWS:
+            return
+        for dependency in sorted(exitNames(TableLayout(name)) - TRIVIAL_DRAWS):
+            visit(dependency)
+        order.append(name)
+
+    for name in names:
+        visit(name)
+    for name in order:
+        if os.path.exists(os.path.join(directory, name + EXTENSION)):
+            continue
+        start = time.perf_counter()
+        longest = generateTable(name, directory)
+        yield name, time.perf_counter() - start, longest
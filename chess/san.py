@@ -0,0 +1,156 @@
+from chess.pieces import Square, Rook, Knight, Bishop, Queen
+from chess.bitboard import PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, EMPTY, FILES, FEN_SQUARES
+from chess.bitboard import moveFrom, moveTo, movePromotion, squareTuple, generate_legal_moves
+from chess.errors import InputDecodingError
+
+SAN_PIECES = {"N": KNIGHT, "B": BISHOP, "R": ROOK, "Q": QUEEN, "K": KING}
+SAN_LETTERS = {ptype: letter for letter, ptype in SAN_PIECES.items()}
+PROMOTION_CLASSES = {KNIGHT: Knight, BISHOP: Bishop, ROOK: Rook, QUEEN: Queen}
+
+
+def squareName(sq):
+    return FILES[sq & 7] + str((sq >> 3) + 1)
+
+
+# Returns the SAN of a legal move without its check suffix, disambiguated against the other legal moves
+def sanBody(position, move, legalMoves):
+    fromSq, toSq, promotion = move & 63, (move >> 6) & 63, move >> 12
+    ptype = position.mailbox[fromSq] % 6
+    capture = position.mailbox[toSq] != EMPTY
+
+    if ptype == KING and toSq - fromSq in (2, -2):
+        return "O-O" if toSq > fromSq else "O-O-O"
+
+    if ptype == PAWN:
+        if fromSq & 7 != toSq & 7:
+            san = FILES[fromSq & 7] + "x" + squareName(toSq)
+        else:
+            san = squareName(toSq)
+        if promotion:
+            san += "=" + SAN_LETTERS[promotion]
+        return san
+
+    # Other pieces of the same type that can reach the same square
+    others = [
+        other & 63
+        for other in legalMoves
+        if (other >> 6) & 63 == toSq
+        and other & 63 != fromSq
+        and position.mailbox[other & 63] == position.mailbox[fromSq]
+    ]
+    disambiguation = ""
+    if others:
+        if all(other & 7 != fromSq & 7 for other in others):
+            disambiguation = FILES[fromSq & 7]
+        elif all(other >> 3 != fromSq >> 3 for other in others):
+            disambiguation = str((fromSq >> 3) + 1)
+        else:
+            disambiguation = squareName(fromSq)
+    return SAN_LETTERS[ptype] + disambiguation + ("x" if capture else "") + squareName(toSq)
+
+
+# Returns the full SAN of a legal move, including the check (+) or mate (#) suffix
+def moveToSan(position, move, legalMoves=None):
+    if legalMoves is None:
+        legalMoves = generate_legal_moves(position)
+    san = sanBody(position, move, legalMoves)
+    position.make_move(move)
+    if position.inCheck(position.side):
+        san += "#" if not generate_legal_moves(position) else "+"
+    position.unmake_move()
+    return san
+
+
+# Converts a list of moves played from the position into SAN, leaving the position unchanged
+def movesToSan(position, moves):
+    sanList = []
+    for move in moves:
+        sanList.append(moveToSan(position, move))
+        position.make_move(move)
+    for _ in moves:
+        position.unmake_move()
+    return sanList
+
+
+# Normalizes user or PGN input so it can be looked up in a SAN map
+def normalizeSan(san):
+    token = san.rstrip("+#!?")
+    if token.startswith("0-0"):
+        token = token.replace("0", "O")
+    if token[-1:] in "nbrq" and "=" in token:
+        token = token[:-1] + token[-1].upper()
+    elif len(token) > 2 and token[0] in FILES and token[-2] in "18" and token[-1] in "NBRQnbrq":
+        token = token[:-1] + "=" + token[-1].upper()
+    return token
+
+
+# Builds {san: move} for every legal move so resolving a SAN token is a single dictionary lookup
+# Besides the canonical SAN, over-disambiguated piece moves (Ngf3, N1f3, Ng1f3) are accepted too
+def sanMap(position, legalMoves):
+    result = {}
+    for move in legalMoves:
+        san = sanBody(position, move, legalMoves)
+        result[san] = move
+        fromSq, toSq = move & 63, (move >> 6) & 63
+        ptype = position.mailbox[fromSq] % 6
+        if ptype == PAWN or san.startswith("O"):
+            continue
+        letter = SAN_LETTERS[ptype]
+        capture = "x" if "x" in san else ""
+        for disambiguation in (FILES[fromSq & 7], str((fromSq >> 3) + 1), squareName(fromSq)):
+            result.setdefault(letter + disambiguation + capture + squareName(toSq), move)
+    return result
+
+
+# Returns the moves in the list matching a SAN token by scanning them, used for moves that are not legal
+def matchSan(position, moves, san):
+    token = normalizeSan(san)
+    if token in ("O-O", "O-O-O"):
+        offset = 2 if token == "O-O" else -2
+        return [
+            move
+            for move in moves
+            if position.mailbox[moveFrom(move)] % 6 == KING
+            and moveTo(move) - moveFrom(move) == offset
+        ]
+
+    promotion = 0
+    if "=" in token:
+        token, letter = token.split("=", 1)
+        promotion = SAN_PIECES.get(letter, -1)
+
+    ptype = SAN_PIECES.get(token[:1], PAWN)
+    if ptype != PAWN:
+        token = token[1:]
+    token = token.replace("x", "").replace("-", "")
+    toSq = FEN_SQUARES.get(token[-2:], -1)
+    if toSq == -1:
+        return []
+    disambiguation = token[:-2]
+
+    matches = []
+    for move in moves:
+        if moveTo(move) != toSq or movePromotion(move) != promotion:
+            continue
+        fromSq = moveFrom(move)
+        if position.mailbox[fromSq] % 6 != ptype:
+            continue
+        if all(char in squareName(fromSq) for char in disambiguation):
+            matches.append(move)
+    return matches
+
+
+# Turns a SAN token into the (a, b, promotionPiece) arguments Game.move expects
+# Illegal moves resolve to their pseudo legal match, so Game.move raises the precise error
+def sanToSquares(game, san):
+    move = game.sanMoves().get(normalizeSan(san))
+    if move is None:
+        matches = matchSan(game.position, game.position.pseudoLegalMoves(), san)
+        if len(matches) != 1:
+            raise InputDecodingError(san)
+        move = matches[0]
+    return (
+        Square.tupleToDict(squareTuple(moveFrom(move))),
+        Square.tupleToDict(squareTuple(moveTo(move))),
+        PROMOTION_CLASSES.get(movePromotion(move)),
+    )
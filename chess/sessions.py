@@ -0,0 +1,154 @@
+from chess.errors import GameNotFoundError
+from collections import OrderedDict
+import contextlib
+import itertools
+import secrets
+import threading
+import time
+
+DEFAULT_MAX_GAMES = 1000
+DEFAULT_TTL_SECONDS = 30 * 60
+
+
+# In memory store of live games keyed by a random game id
+# Games are kept in least recently used order, idle games expire after ttl seconds and once maxGames
+# are stored the least recently used game is evicted to make room for a new one
+# With a database (chess.storage.GameDatabase) games are written through on add and save, and games
+# that were evicted or lost in a restart are replayed from it on first access
+class GameStore:
+    def __init__(
+        self, maxGames=DEFAULT_MAX_GAMES, ttl=DEFAULT_TTL_SECONDS, clock=time.monotonic, database=None
+    ) -> None:
+        if maxGames < 1:
+            raise ValueError("a game store must hold at least one game")
+        self.maxGames = maxGames
+        self.ttl = ttl
+        self.clock = clock
+        # gameId -> (game, last access time), oldest access first
+        self.games = OrderedDict()
+        self.database = database
+        self.lock = threading.Lock()
+        # gameId -> [lock, requests using it] for games requests are changing, games in use are never
+        # evicted or expired so a request cannot lose its game (and lock) to a fresh copy of it
+        self.gameLocks = {}
+        self.created = 0
+        self.loaded = 0
+        self.evicted = 0
+        self.expired = 0
+
+    @staticmethod
+    def newId():
+        return secrets.token_urlsafe(12)
+
+    def inUse(self, gameId):
+        return gameId in self.gameLocks
+
+    # Drops games idle for longer than the ttl, the oldest are at the front so the scan stops early
+    def removeExpired(self, now):
+        if self.ttl is None:
+            return
+        expired = []
+        for gameId, (game, lastAccess) in self.games.items():
+            if now - lastAccess <= self.ttl:
+                break
+            if not self.inUse(gameId):
+                expired.append(gameId)
+        for gameId in expired:
+            del self.games[gameId]
+            self.expired += 1
+
+    # Stores a game under a new id (or the given one) and returns the id
+    def add(self, game, gameId=None):
+        with self.lock:
+            now = self.clock()
+            self.removeExpired(now)
+            if gameId is None:
+                gameId = self.newId()
+            self.insert(gameId, game, now)
+            self.created += 1
+        if self.database is not None:
+            self.database.saveGame(gameId, game)
+        return gameId
+
+    def insert(self, gameId, game, now):
+        self.games.pop(gameId, None)
+        # Games in use are skipped, if every game is in use the store holds more than maxGames for a while
+        excess = len(self.games) + 1 - self.maxGames
+        if excess > 0:
+            idle = (other for other in self.games if not self.inUse(other))
+            for evictedId in list(itertools.islice(idle, excess)):
+                del self.games[evictedId]
+                self.evicted += 1
+        self.games[gameId] = (game, now)
+
+    # Writes the game's current state to the database, if there is one
+    def save(self, gameId):
+        if self.database is not None:
+            self.database.saveGame(gameId, self.get(gameId))
+
+    # Returns the game and marks it as recently used
+    # Raises GameNotFoundError for unknown ids, and for expired ones unless the database still has them
+    def get(self, gameId):
+        with self.lock:
+            now = self.clock()
+            self.removeExpired(now)
+            entry = self.games.get(gameId)
+            if entry is not None:
+                self.games[gameId] = (entry[0], now)
+                self.games.move_to_end(gameId)
+                return entry[0]
+
+        game = None if self.database is None else self.database.loadGame(gameId)
+        if game is None:
+            raise GameNotFoundError(gameId)
+        with self.lock:
+            # Another request may have loaded it meanwhile
+            entry = self.games.get(gameId)
+            if entry is not None:
+                return entry[0]
+            self.insert(gameId, game, self.clock())
+            self.loaded += 1
+        return game
+
+    def remove(self, gameId):
+        with self.lock:
+            return self.games.pop(gameId, (None, None))[0]
+
+    # Holds the lock of one game, around reading, changing and saving it so two requests for the same game
+    # cannot interleave their moves. The lock lives while requests use it, and keeps the game stored
+    @contextlib.contextmanager
+    def gameLock(self, gameId):
+        with self.lock:
+            entry = self.gameLocks.setdefault(gameId, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self.lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self.gameLocks[gameId]
+
+    def __contains__(self, gameId):
+        with self.lock:
+            self.removeExpired(self.clock())
+            if gameId in self.games:
+                return True
+        return self.database is not None and gameId in self.database
+
+    def __len__(self):
+        with self.lock:
+            self.removeExpired(self.clock())
+            return len(self.games)
+
+    def stats(self):
+        return {
+            "games": len(self),
+            "maxGames": self.maxGames,
+            "ttl": self.ttl,
+            "created": self.created,
+            "evicted": self.evicted,
+            "expired": self.expired,
+            "loaded": self.loaded,
+        }
@@ -0,0 +1,230 @@
+from chess.game import Game
+from chess.pieces import Square
+from chess.bitboard import Position, moveFrom, moveTo, movePromotion, squareTuple
+from chess.san import PROMOTION_CLASSES
+from array import array
+import json
+import sqlite3
+import sys
+import threading
+import time
+
+# A position snapshot (FEN) is stored every SNAPSHOT_INTERVAL plies for random access
+SNAPSHOT_INTERVAL = 32
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    id TEXT PRIMARY KEY,
+    startFen TEXT NOT NULL,
+    headers TEXT NOT NULL,
+    moves BLOB NOT NULL,
+    outcome TEXT,
+    outcomeReason TEXT,
+    drawOffered INTEGER NOT NULL DEFAULT 0,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS snapshots (
+    gameId TEXT NOT NULL REFERENCES games(id) ON DELETE CASCADE,
+    ply INTEGER NOT NULL,
+    fen TEXT NOT NULL,
+    PRIMARY KEY (gameId, ply)
+);
+"""
+# Columns added to games after the first release, added to older database files when they are opened
+ADDED_COLUMNS = {"outcomeReason": "TEXT", "drawOffered": "INTEGER NOT NULL DEFAULT 0"}
+
+
+# Moves are stored as 16 bit words (from | to << 6 | promotion << 12), little endian
+def encodeMoves(moves):
+    words = array("H", moves)
+    if sys.byteorder == "big":
+        words.byteswap()
+    return words.tobytes()
+
+
+def decodeMoves(data):
+    words = array("H")
+    words.frombytes(data)
+    if sys.byteorder == "big":
+        words.byteswap()
+    return words.tolist()
+
+
+# Plays a move given as an int through Game.move, so every stored move is validated again on replay
+def playMove(game, move):
+    game.move(
+        Square.tupleToDict(squareTuple(moveFrom(move))),
+        Square.tupleToDict(squareTuple(moveTo(move))),
+        PROMOTION_CLASSES.get(movePromotion(move)),
+    )
+
+
+# SQLite backed game store, each game is its start FEN, headers and a 16 bit per ply move list
+# Games are rebuilt by replaying their moves, snapshots let positionAt start close to any ply
+# With a position index (chess.positions.PositionIndex) every saved game is also indexed by position
+class GameDatabase:
+    def __init__(self, path=":memory:", snapshotInterval=SNAPSHOT_INTERVAL, positions=None) -> None:
+        self.path = path
+        self.snapshotInterval = snapshotInterval
+        self.positions = positions
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        if path != ":memory:":
+            self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.executescript(SCHEMA)
+        columns = {row[1] for row in self.connection.execute("PRAGMA table_info(games)")}
+        for name, definition in ADDED_COLUMNS.items():
+            if name not in columns:
+                self.connection.execute(f"ALTER TABLE games ADD COLUMN {name} {definition}")
+        self.lock = threading.Lock()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    # Inserts or updates a game, writing snapshots for any new multiple of the snapshot interval
+    def saveGame(self, gameId, game, headers=None):
+        moves = game.playedMoves()
+        now = time.time()
+        with self.lock, self.connection:
+            row = self.connection.execute(
+                "SELECT headers FROM games WHERE id = ?", (gameId,)
+            ).fetchone()
+            if headers is None:
+                headers = json.loads(row[0]) if row else {}
+            self.connection.execute(
+                "INSERT INTO games (id, startFen, headers, moves, outcome, outcomeReason, drawOffered, created, "
+                "updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET startFen = excluded.startFen, headers = excluded.headers, "
+                "moves = excluded.moves, outcome = excluded.outcome, outcomeReason = excluded.outcomeReason, "
+                "drawOffered = excluded.drawOffered, updated = excluded.updated",
+                (
+                    gameId, game.startFen, json.dumps(headers), encodeMoves(moves), game.outcome,
+                    game.outcomeReason, int(game.drawOffered), now, now,
+                ),
+            )
+            self.writeSnapshots(gameId, game.startFen, moves)
+        if self.positions is not None:
+            self.positions.indexGame(gameId, game.startFen, moves)
+
+    def writeSnapshots(self, gameId, startFen, moves):
+        interval = self.snapshotInterval
+        # Snapshots past the end belong to an older, longer move list (after an undo or a new start)
+        self.connection.execute(
+            "DELETE FROM snapshots WHERE gameId = ? AND ply > ?", (gameId, len(moves))
+        )
+        lastPly, fen = self.connection.execute(
+            "SELECT ply, fen FROM snapshots WHERE gameId = ? ORDER BY ply DESC LIMIT 1", (gameId,)
+        ).fetchone() or (0, startFen)
+        if len(moves) - lastPly < interval:
+            return
+
+        position = Position.fromFen(fen)
+        rows = []
+        for ply in range(lastPly, len(moves)):
+            position.make_move(moves[ply])
+            if (ply + 1) % interval == 0:
+                rows.append((gameId, ply + 1, position.toFen()))
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO snapshots (gameId, ply, fen) VALUES (?, ?, ?)", rows
+        )
+
+    # Returns (startFen, headers, moves, outcome) without replaying, or None for an unknown id
+    def loadRecord(self, gameId):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT startFen, headers, moves, outcome FROM games WHERE id = ?", (gameId,)
+            ).fetchone()
+        if row is None:
+            return None
+        startFen, headers, moves, outcome = row
+        return startFen, json.loads(headers), decodeMoves(moves), outcome
+
+    # Rebuilds the game by replaying its moves, or returns None for an unknown id
+    # The replay does not stop at a repetition or the fifty move rule, a game may have played on
+    # past a draw nobody claimed
+    def loadGame(self, gameId):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT startFen, moves, outcome, outcomeReason, drawOffered FROM games WHERE id = ?", (gameId,)
+            ).fetchone()
+        if row is None:
+            return None
+        startFen, moves, outcome, outcomeReason, drawOffered = row
+        game = Game.from_fen(startFen, replay=True)
+        for move in decodeMoves(moves):
+            playMove(game, move)
+        game.replay = False
+        # Resignations, agreed draws and open draw offers are not in the moves
+        game.outcome = outcome
+        game.outcomeReason = outcomeReason
+        game.drawOffered = bool(drawOffered)
+        return game
+
+    # Returns the position after the given number of plies, replaying from the closest snapshot
+    def positionAt(self, gameId, ply):
+        record = self.loadRecord(gameId)
+        if record is None:
+            return None
+        startFen, headers, moves, outcome = record
+        if not 0 <= ply <= len(moves):
+            raise IndexError(f"game {gameId} has {len(moves)} plies, not {ply}")
+        with self.lock:
+            snapshot = self.connection.execute(
+                "SELECT ply, fen FROM snapshots WHERE gameId = ? AND ply <= ? ORDER BY ply DESC LIMIT 1",
+                (gameId, ply),
+            ).fetchone()
+        snapshotPly, fen = snapshot or (0, startFen)
+        position = Position.fromFen(fen)
+        for move in moves[snapshotPly:ply]:
+            position.make_move(move)
+        return position
+
+    def deleteGame(self, gameId):
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM games WHERE id = ?", (gameId,))
+        if self.positions is not None:
+            self.positions.removeGame(gameId)
+
+    def __contains__(self, gameId):
+        with self.lock:
+            return self.connection.execute(
+                "SELECT 1 FROM games WHERE id = ?", (gameId,)
+            ).fetchone() is not None
+
+    # Returns the ids of the most recently updated games
+    def gameIds(self, limit=100):
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT id FROM games ORDER BY updated DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    # Yields (id, startFen, moves) for every game, read a page at a time so the lock is not held
+    # while the caller works on them
+    def records(self, pageSize=1000):
+        last = ""
+        while True:
+            with self.lock:
+                rows = self.connection.execute(
+                    "SELECT id, startFen, moves FROM games WHERE id > ? ORDER BY id LIMIT ?", (last, pageSize)
+                ).fetchall()
+            if not rows:
+                return
+            for gameId, startFen, moves in rows:
+                yield gameId, startFen, decodeMoves(moves)
+            last = rows[-1][0]
+
+    # Bytes stored for a game (record plus snapshots), for monitoring storage per game
+    def storedBytes(self, gameId):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT length(id) + length(startFen) + length(headers) + length(moves) + "
+                "coalesce(length(outcome), 0) + 16 FROM games WHERE id = ?",
+                (gameId,),
+            ).fetchone()
+            snapshots = self.connection.execute(
+                "SELECT coalesce(sum(length(fen) + 8), 0) FROM snapshots WHERE gameId = ?", (gameId,)
+            ).fetchone()[0]
+        return None if row is None else row[0] + snapshots
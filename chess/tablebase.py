@@ -0,0 +1,272 @@
+from chess.bitboard import Position, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, squares
+import argparse
+import itertools
+import mmap
+import os
+import struct
+
+# Endgame tables for positions with the two kings and up to MAX_PIECES pieces in total, generated by
+# retrograde analysis, every position stores whether the side to move wins, draws or loses and the
+# distance to mate in plies
+# Table files are a header and one code per position, indexed by side to move and the square of every
+# piece: code 0 is a draw, dtm + 1 for a decided position (odd dtm is a win for the side to move, even
+# dtm a loss), and the largest code marks positions that cannot occur. Codes take one byte unless the
+# longest mate needs two
+# Tables are folded by board symmetry: only positions with the white king in KING_SQUARES (the a1-d1-d4
+# triangle) are stored, or PAWN_KING_SQUARES (files a to d) when pawns rule out all but mirroring files
+# Tables assume no castling rights and no en passant square, and ignore the fifty move rule
+
+MAX_PIECES = 4
+MAGIC = b"CTB2"
+# magic, number of pieces, bytes per code, table name, longest distance to mate in plies
+HEADER = struct.Struct("<4sBB8sH")
+EXTENSION = ".ctb"
+
+# Pieces within each side are listed in this order, kings first
+TABLE_ORDER = "KQRBNP"
+PIECE_BY_LETTER = {"K": KING, "Q": QUEEN, "R": ROOK, "B": BISHOP, "N": KNIGHT, "P": PAWN}
+LETTER_BY_PIECE = {ptype: letter for letter, ptype in PIECE_BY_LETTER.items()}
+# The side with more material is white in a table name
+NAME_VALUES = {"K": 0, "Q": 90, "R": 50, "B": 33, "N": 32, "P": 10}
+# Nobody can mate, these tables are not stored and every legal position in them is a draw
+TRIVIAL_DRAWS = {"KK", "KBK", "KNK"}
+
+KING_SQUARES = [sq for sq in range(64) if sq >> 3 <= sq & 7 <= 3]
+PAWN_KING_SQUARES = [sq for sq in range(64) if sq & 7 <= 3]
+
+WIN, DRAW, LOSS = 1, 0, -1
+RESULT_NAMES = {WIN: "win", DRAW: "draw", LOSS: "loss"}
+UNREACHED = 0x7FFF
+
+
+# The board symmetry moving a white king on whiteKing into the stored squares, as the image of every square
+def _symmetry(whiteKing, pawns):
+    mirrorFiles = whiteKing & 7 > 3
+    if mirrorFiles:
+        whiteKing ^= 7
+    mirrorRanks = not pawns and whiteKing >> 3 > 3
+    if mirrorRanks:
+        whiteKing ^= 56
+    mirrorDiagonal = not pawns and whiteKing >> 3 > whiteKing & 7
+    images = []
+    for sq in range(64):
+        if mirrorFiles:
+            sq ^= 7
+        if mirrorRanks:
+            sq ^= 56
+        if mirrorDiagonal:
+            sq = (sq & 7) << 3 | sq >> 3
+        images.append(sq)
+    return tuple(images)
+
+
+# SYMMETRIES[pawns][white king square]
+SYMMETRIES = {pawns: [_symmetry(sq, pawns) for sq in range(64)] for pawns in (False, True)}
+
+
+def splitName(name):
+    second = name.index("K", 1)
+    return name[:second], name[second:]
+
+
+def sortSide(letters):
+    return "".join(sorted(letters, key=TABLE_ORDER.index))
+
+
+# Returns (table name, flipped) for the material of both sides, flipped when black is the stronger side
+# and the position has to be mirrored to look it up
+def tableName(white, black):
+    white, black = sortSide(white), sortSide(black)
+    whiteKey = (sum(NAME_VALUES[letter] for letter in white), [-TABLE_ORDER.index(letter) for letter in white])
+    blackKey = (sum(NAME_VALUES[letter] for letter in black), [-TABLE_ORDER.index(letter) for letter in black])
+    if blackKey > whiteKey:
+        return black + white, True
+    return white + black, False
+
+
+# Every table name with the given number of pieces (kings included)
+def tableNames(pieces):
+    names = set()
+    others = "QRBNP"
+    for extra in itertools.combinations_with_replacement(others * 2, pieces - 2):
+        for split in range(len(extra) + 1):
+            white = "K" + "".join(extra[:split])
+            black = "K" + "".join(extra[split:])
+            names.add(tableName(white, black)[0])
+    return sorted(names - TRIVIAL_DRAWS, key=lambda name: (len(name), name))
+
+
+# Piece order and index arithmetic of one table
+class TableLayout:
+    def __init__(self, name) -> None:
+        self.name = name
+        white, black = splitName(name)
+        # (color, piece type) in index order, both kings first
+        self.pieces = [(0, KING), (1, KING)]
+        self.pieces += [(0, PIECE_BY_LETTER[letter]) for letter in white[1:]]
+        self.pieces += [(1, PIECE_BY_LETTER[letter]) for letter in black[1:]]
+        self.count = len(self.pieces)
+        self.half = 64 ** self.count
+        self.size = 2 * self.half
+        self.weights = [64 ** (self.count - 1 - index) for index in range(self.count)]
+        # The stored part of the table, see KING_SQUARES
+        self.pawns = "P" in name
+        self.kingSquares = PAWN_KING_SQUARES if self.pawns else KING_SQUARES
+        self.kingIndex = {sq: index for index, sq in enumerate(self.kingSquares)}
+        self.storedHalf = len(self.kingSquares) * self.weights[0]
+        self.storedSize = 2 * self.storedHalf
+
+    # Index over every placement of the pieces, used while generating
+    def index(self, side, pieceSquares):
+        return side * self.half + sum(sq * weight for sq, weight in zip(pieceSquares, self.weights))
+
+    # Index in the table file, the position is moved by the symmetry that puts the white king on a stored square
+    def storedIndex(self, side, pieceSquares):
+        images = SYMMETRIES[self.pawns][pieceSquares[0]]
+        index = side * self.storedHalf + self.kingIndex[images[pieceSquares[0]]] * self.weights[0]
+        return index + sum(images[sq] * weight for sq, weight in zip(pieceSquares[1:], self.weights[1:]))
+
+
+# Reads the tables in a directory, files are memory mapped on first use so processes share them
+class Tablebases:
+    def __init__(self, directory) -> None:
+        self.directory = directory
+        # name -> (layout, mapped codes, bytes per code, illegal code, longest dtm), None for missing tables
+        self.tables = {}
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, name):
+        return os.path.join(self.directory, name + EXTENSION)
+
+    def table(self, name):
+        if name not in self.tables:
+            self.tables[name] = self.open(name)
+        return self.tables[name]
+
+    def open(self, name):
+        path = self.path(name)
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as file:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count, width, stored, longest = HEADER.unpack_from(data, 0)
+        layout = TableLayout(name)
+        if (
+            magic != MAGIC
+            or stored.rstrip(b"\0").decode() != name
+            or count != layout.count
+            or len(data) != HEADER.size + width * layout.storedSize
+        ):
+            data.close()
+            raise ValueError(f"{path} is not a tablebase file for {name}")
+        return layout, data, width, (1 << (8 * width)) - 1, longest
+
+    def available(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name[: -len(EXTENSION)] for name in os.listdir(self.directory) if name.endswith(EXTENSION))
+
+    def close(self):
+        for table in self.tables.values():
+            if table is not None:
+                table[1].close()
+        self.tables = {}
+
+    # Raw code of a position in a table, None when the table is missing
+    def code(self, name, side, pieceSquares):
+        table = self.table(name)
+        if table is None:
+            return None
+        layout, data, width, illegal, longest = table
+        offset = HEADER.size + width * layout.storedIndex(side, pieceSquares)
+        if width == 1:
+            return data[offset]
+        return int.from_bytes(data[offset:offset + width], "little")
+
+    # Returns (result, dtm) for the side to move, result is WIN, DRAW or LOSS and dtm is the distance to
+    # mate in plies (None for draws), or None when no table covers the position or it is illegal
+    def probe(self, position):
+        if position.castling or position.epSquare != -1 or position.occupied.bit_count() > MAX_PIECES:
+            return None
+        bitboards = position.bitboards
+
+        letters = ["", ""]
+        placed = ([], [])
+        for piece in range(12):
+            color, ptype = divmod(piece, 6)
+            for sq in squares(bitboards[piece]):
+                letters[color] += LETTER_BY_PIECE[ptype]
+                placed[color].append((TABLE_ORDER.index(LETTER_BY_PIECE[ptype]), sq))
+        name, flipped = tableName(*letters)
+        side = position.side
+        if flipped:
+            placed = ([(order, sq ^ 56) for order, sq in placed[1]], [(order, sq ^ 56) for order, sq in placed[0]])
+            side ^= 1
+        if name in TRIVIAL_DRAWS:
+            self.hits += 1
+            return DRAW, None
+
+        white = [sq for order, sq in sorted(placed[0])]
+        black = [sq for order, sq in sorted(placed[1])]
+        code = self.code(name, side, [white[0], black[0]] + white[1:] + black[1:])
+        if code is None or code == self.tables[name][3]:
+            self.misses += 1
+            return None
+        self.hits += 1
+        if code == 0:
+            return DRAW, None
+        dtm = code - 1
+        return (WIN if dtm % 2 else LOSS), dtm
+
+    def stats(self):
+        return {"tables": self.available(), "hits": self.hits, "misses": self.misses}
+
+
+# Outcome of the game if the tables decide it from here with best play: the winning color or "draw",
+# None when the position is not in the tables
+def adjudicate(game, tablebases):
+    if tablebases is None or game.outcome is not None:
+        return None
+    probe = tablebases.probe(game.position)
+    if probe is None:
+        return None
+    result, dtm = probe
+    if result == DRAW:
+        return "draw"
+    return game.turn if result == WIN else game.opposingSide(game.turn)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Generate or probe endgame tablebases")
+    commands = parser.add_subparsers(dest="command", required=True)
+    generate = commands.add_parser("generate", help="generate tables and the tables they depend on")
+    generate.add_argument("names", nargs="*", help="table names such as KQK, KRK, KPK or KQKR")
+    generate.add_argument("--pieces", type=int, choices=(3, 4), help="generate every table up to this many pieces")
+    generate.add_argument("--directory", default="tablebases")
+    probe = commands.add_parser("probe", help="probe a position")
+    probe.add_argument("fen")
+    probe.add_argument("--directory", default="tablebases")
+    args = parser.parse_args(args)
+
+    if args.command == "probe":
+        result = Tablebases(args.directory).probe(Position.fromFen(args.fen))
+        if result is None:
+            print("not in the tables")
+            return 1
+        outcome, dtm = result
+        print(RESULT_NAMES[outcome] + ("" if dtm is None else f" in {dtm} plies"))
+        return 0
+
+    # Generating needs numpy, probing does not
+    from chess.retrograde import generateTables
+    names = list(args.names)
+    if args.pieces:
+        names += [name for count in range(3, args.pieces + 1) for name in tableNames(count)]
+    for name, seconds, longest in generateTables(names, args.directory):
+        print(f"{name:<6} longest mate {longest:>3} plies  time {seconds:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,7 +1,47 @@
 from chess.game import Game, QUIT, DRAW, RESIGN
+from chess.game import CHECKMATE, FIFTY_MOVES, INSUFFICIENT_MATERIAL, REPETITION, RESIGNATION
 from chess.pieces import Pawn, Rook, Knight, Bishop, Queen, King, Square
 from chess.pieces import ICON_DICT, WHITE, BLACK
+from chess.pieces import Board, KNIGHT_TARGETS, KING_TARGETS, QUEEN_RAYS, BISHOP_RAYS
+from chess.bitboard import Position, squareIndex, squareTuple, moveFrom, moveTo
+from chess.bitboard import generate_legal_moves, WHITE_KINGSIDE, BLACK_QUEENSIDE
+from chess.perft import perft, divide, PERFT_POSITIONS
+from chess.pgn import readGames, validateGames
+from chess.san import moveToSan, movesToSan, sanMap, normalizeSan
+from chess.engine import best_move, evaluate, Limit, MATE_BOUND
+from chess.transposition import TranspositionTable, EXACT, LOWER, UPPER
+from chess.ordering import MoveOrderer, mvvLva, KILLER_SCORE
+from chess.sessions import GameStore
+from chess.storage import GameDatabase, encodeMoves, decodeMoves
+from chess.positions import PositionIndex, signedKey
+from chess.events import EventBroker, formatEvent
+from chess.hints import HintCache, moveHints
+from chess.workers import EnginePool
+from chess.tournament import playGame, runTournament, eloDifference, eloInterval, MAX_PLIES, TABLEBASE
+from chess.book import OpeningBook, buildBook, writeBook, bookMove, ENTRY
+from chess.tablebase import Tablebases, tableName, adjudicate, WIN, LOSS
+from chess.tablebase import DRAW as TABLEBASE_DRAW
+from chess.engine import MATE
+import json
+import os
+import random
+import re
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+try:
+    import numpy
+    from chess.batch import packPositions, packBoards, toPlanes, evaluateTerms, evaluatePositions
+    from chess.retrograde import generateTables
+except ImportError:
+    numpy = None
+import io
 from chess.errors import *
+import pickle
 import unittest
 
 TESTING_BOARD = {
@@ -461,3 +501,1261 @@ class test_WinConditions(unittest.TestCase):
         bishops[Square.stringtoTuple("a2")] = Bishop(WHITE)
         game4 = Game(board=bishops, testMoves=["d1 d8", "e8 d8"])
         self.assertFalse(game4.outcome == "draw")
+
+
+class TestPosition(unittest.TestCase):
+    def test_boardRoundTrip(self):
+        board = Game.defaultBoard()
+        converted = Position.fromBoard(board).toBoard()
+        self.assertEqual(
+            {location: str(piece) for location, piece in board.items()},
+            {location: str(piece) for location, piece in converted.items()},
+        )
+
+    def test_castlingRightsFromHomeSquares(self):
+        board = Game.defaultBoard()
+        del board[Square.stringtoTuple("a1")]
+        board[Square.stringtoTuple("h8")] = Knight(BLACK)
+        position = Position.fromBoard(board)
+        self.assertEqual(position.castling, WHITE_KINGSIDE | BLACK_QUEENSIDE)
+
+        position = Position.fromBoard(Game.defaultBoard(), castling=WHITE_KINGSIDE)
+        self.assertEqual(position.castling, WHITE_KINGSIDE)
+
+    def test_checkMatchesScanForCheck(self):
+        board = {
+            Square.stringtoTuple("e1"): King(WHITE),
+            Square.stringtoTuple("e8"): King(BLACK),
+            Square.stringtoTuple("b4"): Bishop(BLACK),
+            Square.stringtoTuple("h8"): Rook(WHITE),
+        }
+        self.assertEqual(Position.fromBoard(board).checkStatus(), Board.scanForCheck(board))
+
+        board[Square.stringtoTuple("d2")] = Knight(WHITE)
+        board[Square.stringtoTuple("f8")] = Bishop(BLACK)
+        self.assertEqual(
+            Position.fromBoard(board).checkStatus(), {WHITE: False, BLACK: False}
+        )
+
+    def test_pseudoLegalMovesFromStart(self):
+        position = Position.fromBoard(Game.defaultBoard())
+        self.assertEqual(len(position.pseudoLegalMoves()), 20)
+        self.assertIsNotNone(position.findMove(squareIndex(1, 4), squareIndex(3, 4)))
+        self.assertIsNone(position.findMove(squareIndex(1, 4), squareIndex(4, 4)))
+
+
+class TestMakeUnmake(unittest.TestCase):
+    def snapshot(self, position):
+        return (
+            position.bitboards.copy(),
+            position.mailbox.copy(),
+            position.side,
+            position.castling,
+            position.epSquare,
+            position.halfmoveClock,
+        )
+
+    def test_positionRestoredAfterEveryMove(self):
+        board = {
+            Square.stringtoTuple("e1"): King(WHITE),
+            Square.stringtoTuple("a1"): Rook(WHITE),
+            Square.stringtoTuple("h1"): Rook(WHITE),
+            Square.stringtoTuple("b7"): Pawn(WHITE),
+            Square.stringtoTuple("e5"): Pawn(WHITE),
+            Square.stringtoTuple("e8"): King(BLACK),
+            Square.stringtoTuple("a8"): Rook(BLACK),
+            Square.stringtoTuple("d7"): Pawn(BLACK),
+        }
+        game = Game(board=board, testMoves=["e1 f1", "d7 d5"])
+        position = game.position
+        before = self.snapshot(position)
+        for move in position.pseudoLegalMoves():
+            position.make_move(move)
+            position.unmake_move()
+            self.assertEqual(self.snapshot(position), before)
+
+    def test_boardRestoredAfterCastling(self):
+        king = King(WHITE)
+        rook = Rook(WHITE)
+        board = {Square.stringtoTuple("e1"): king, Square.stringtoTuple("h1"): rook}
+        before = board.copy()
+        undo = Board.make_move(
+            Square.stringToDict("e1"), Square.stringToDict("g1"), board
+        )
+        self.assertIs(board[Square.stringtoTuple("f1")], rook)
+        self.assertIs(board[Square.stringtoTuple("g1")], king)
+
+        Board.unmake_move(board, undo)
+        self.assertEqual(board, before)
+
+
+class TestLegalMoves(unittest.TestCase):
+    def movesFrom(self, position, square):
+        fromSq = squareIndex(*Square.stringtoTuple(square))
+        return sorted(
+            Square.tupleToString(squareTuple(moveTo(move)))
+            for move in generate_legal_moves(position)
+            if moveFrom(move) == fromSq
+        )
+
+    def test_pinnedPieces(self):
+        board = {
+            Square.stringtoTuple("e1"): King(WHITE),
+            Square.stringtoTuple("e2"): Rook(WHITE),
+            Square.stringtoTuple("d2"): Knight(WHITE),
+            Square.stringtoTuple("e8"): Rook(BLACK),
+            Square.stringtoTuple("a5"): Bishop(BLACK),
+            Square.stringtoTuple("h8"): King(BLACK),
+        }
+        position = Position.fromBoard(board)
+        self.assertEqual(self.movesFrom(position, "d2"), [])
+        self.assertEqual(
+            self.movesFrom(position, "e2"), "e3,e4,e5,e6,e7,e8".split(",")
+        )
+
+    def test_checkEvasions(self):
+        board = {
+            Square.stringtoTuple("e1"): King(WHITE),
+            Square.stringtoTuple("a4"): Rook(WHITE),
+            Square.stringtoTuple("c1"): Bishop(WHITE),
+            Square.stringtoTuple("e8"): Rook(BLACK),
+            Square.stringtoTuple("h8"): King(BLACK),
+        }
+        position = Position.fromBoard(board)
+        self.assertEqual(self.movesFrom(position, "a4"), ["e4"])
+        self.assertEqual(self.movesFrom(position, "c1"), ["e3"])
+        self.assertEqual(self.movesFrom(position, "e1"), "d1,d2,f1,f2".split(","))
+
+        board[Square.stringtoTuple("b4")] = Bishop(BLACK)
+        position = Position.fromBoard(board)
+        self.assertEqual(self.movesFrom(position, "a4"), [])
+        self.assertEqual(self.movesFrom(position, "e1"), "d1,f1,f2".split(","))
+
+    def test_enPassantDiscoveredCheck(self):
+        board = {
+            Square.stringtoTuple("a5"): King(WHITE),
+            Square.stringtoTuple("b5"): Pawn(WHITE),
+            Square.stringtoTuple("h1"): Knight(WHITE),
+            Square.stringtoTuple("c7"): Pawn(BLACK),
+            Square.stringtoTuple("h5"): Rook(BLACK),
+            Square.stringtoTuple("h8"): King(BLACK),
+        }
+        game = Game(board=board, testMoves=["h1 g3", "c7 c5"])
+        self.assertEqual(self.movesFrom(game.position, "b5"), ["b6"])
+        self.assertRaises(
+            ExposingCheckError,
+            game.move,
+            Square.stringToDict("b5"),
+            Square.stringToDict("c6"),
+        )
+
+
+class TestZobrist(unittest.TestCase):
+    def test_transpositionsShareKey(self):
+        game1 = Game(Game.defaultBoard(), testMoves=["g1 f3", "g8 f6", "b1 c3"])
+        game2 = Game(Game.defaultBoard(), testMoves=["b1 c3", "g8 f6", "g1 f3"])
+        self.assertEqual(game1.position.key, game2.position.key)
+        self.assertEqual(game1.position.key, game1.position.computeKey())
+
+    def test_keyCoversSideAndCastling(self):
+        start = Position.fromBoard(Game.defaultBoard()).key
+        game = Game(Game.defaultBoard(), testMoves=["g1 f3", "g8 f6", "f3 g1", "f6 g8"])
+        self.assertEqual(game.position.key, start)
+
+        self.assertNotEqual(Position.fromBoard(Game.defaultBoard(), BLACK).key, start)
+
+        moved = Game(
+            Game.defaultBoard(),
+            testMoves=["g1 f3", "g8 f6", "h1 g1", "f6 g8", "g1 h1", "g8 f6", "f3 g1", "f6 g8"],
+        )
+        self.assertNotEqual(moved.position.key, start)
+
+    def test_startingPositionCountsForRepetition(self):
+        shuffle = ["Nf3", "Nf6", "Ng1", "Ng8"]
+        game = Game(Game.defaultBoard(), testMoves=shuffle)
+        self.assertEqual(game.positionHistory[game.position.key], 2)
+        self.assertIsNone(game.outcome)
+        game = Game(Game.defaultBoard(), testMoves=shuffle * 2)
+        self.assertEqual((game.outcome, game.outcomeReason), (DRAW, REPETITION))
+        self.assertEqual(game.position.key, Game(Game.defaultBoard()).position.key)
+        # From a FEN too
+        game = Game.from_fen("4k3/8/8/8/8/8/8/R3K3 w - - 0 1", testMoves=["Ra2", "Kd8", "Ra1", "Ke8"] * 2)
+        self.assertEqual((game.outcome, game.outcomeReason), (DRAW, REPETITION))
+
+    def test_fenEnPassantOnlyWhenCapturable(self):
+        # Standard FENs name the en passant square after every double push, the key only covers it
+        # when a pawn can take there, like a position reached by moves
+        e4 = Game(Game.defaultBoard(), testMoves=["e4"])
+        position = Position.fromFen("rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1")
+        self.assertEqual(position.epSquare, -1)
+        self.assertEqual(position.key, e4.position.key)
+        self.assertEqual(position.key, position.computeKey())
+
+        d5 = Game(Game.defaultBoard(), testMoves=["e4", "a6", "e5", "d5"])
+        position = Position.fromFen("rnbqkbnr/1pp1pppp/p7/3pP3/8/8/PPPP1PPP/RNBQKBNR w KQkq d6 0 3")
+        self.assertEqual(position.epSquare, d5.position.epSquare)
+        self.assertEqual(position.key, d5.position.key)
+
+
+class TestAttackMaps(unittest.TestCase):
+    def test_mapsFollowMakeAndUnmake(self):
+        game = Game(Game.defaultBoard(), testMoves=["e2 e4", "d7 d5", "f1 b5"])
+        position = game.position
+        self.assertTrue(position.inCheck(position.side))
+        self.assertTrue(position.isSquareAttacked(squareIndex(6, 3), 0))
+        self.assertFalse(position.isSquareAttacked(squareIndex(4, 1), 1))
+
+        before = position.attacks.copy()
+        for move in generate_legal_moves(position):
+            position.make_move(move)
+            self.assertEqual(
+                position.attacks, [position.attacksBy(0), position.attacksBy(1)]
+            )
+            position.unmake_move()
+            self.assertEqual(position.attacks, before)
+
+
+class TestPerft(unittest.TestCase):
+    def test_standardPositions(self):
+        for name, (fen, expected) in PERFT_POSITIONS.items():
+            depth = 3 if name == "start" else 2
+            self.assertEqual(perft(Position.fromFen(fen), depth), expected[depth], name)
+
+    def test_divideMatchesPerft(self):
+        fen, expected = PERFT_POSITIONS["kiwipete"]
+        counts = divide(Position.fromFen(fen), 2)
+        self.assertEqual(len(counts), expected[1])
+        self.assertEqual(sum(counts.values()), expected[2])
+
+    def test_startFenMatchesDefaultBoard(self):
+        self.assertEqual(
+            Position.fromFen(PERFT_POSITIONS["start"][0]).key,
+            Position.fromBoard(Game.defaultBoard()).key,
+        )
+
+
+class TestFen(unittest.TestCase):
+    def test_roundTrip(self):
+        for fen, _ in PERFT_POSITIONS.values():
+            self.assertEqual(Game.from_fen(fen).to_fen(), fen)
+
+    def test_gameStateFromFen(self):
+        game = Game.from_fen("4k3/8/8/3pP3/8/8/8/4K2R w K d6 12 40")
+        self.assertEqual(game.turn, WHITE)
+        self.assertEqual(game.fiftyMoveRule, 12)
+        self.assertIsInstance(game.board.get(Square.stringtoTuple("h1")), Rook)
+
+        game.move(Square.stringToDict("e5"), Square.stringToDict("d6"))
+        self.assertIsNone(game.board.get(Square.stringtoTuple("d5")))
+        self.assertEqual(game.to_fen(), "4k3/8/3P4/8/8/8/8/4K2R b K - 0 40")
+
+        game.move(Square.stringToDict("e8"), Square.stringToDict("d7"))
+        game.move(Square.stringToDict("e1"), Square.stringToDict("g1"))
+        self.assertIsInstance(game.board.get(Square.stringtoTuple("f1")), Rook)
+
+    def test_fenMatchesPlayedGame(self):
+        game = Game(Game.defaultBoard(), testMoves=["e2 e4", "c7 c5", "g1 f3"])
+        self.assertEqual(
+            game.to_fen(), "rnbqkbnr/pp1ppppp/8/2p5/4P3/5N2/PPPP1PPP/RNBQKB1R b KQkq - 1 2"
+        )
+        self.assertEqual(
+            Position.fromFen(game.to_fen()).key, game.position.key
+        )
+
+
+PGN_SAMPLE = """[Event "Sample"]
+[Result "1-0"]
+
+1. e4 e5 2. Nf3 {main line} Nc6 (2... d6 3. d4) 3. Bc4 Nf6 4. O-O Bc5
+5. d3 d6 $1 6. Bg5 h6 7. Bxf6 Qxf6 8. Nc3 O-O 9. Nd5 Qd8 1-0
+
+[Event "Promotion"]
+[FEN "8/P6k/8/8/8/8/8/K7 w - - 0 1"]
+[Result "*"]
+
+1. a8=Q Kg6 2. Qa7 *
+
+[Event "Illegal"]
+[Result "*"]
+
+1. e4 e5 2. Ke3 *
+"""
+
+
+class TestPgn(unittest.TestCase):
+    def test_readGames(self):
+        games = list(readGames(io.StringIO(PGN_SAMPLE)))
+        self.assertEqual(len(games), 3)
+        headers, moves, result = games[0]
+        self.assertEqual(headers["Event"], "Sample")
+        self.assertEqual(result, "1-0")
+        self.assertEqual(moves[:4], ["e4", "e5", "Nf3", "Nc6"])
+        self.assertEqual(len(moves), 18)
+
+    def test_validateGames(self):
+        reports = list(validateGames(io.StringIO(PGN_SAMPLE)))
+        self.assertEqual([report["error"] for report in reports[:2]], [None, None])
+        self.assertEqual(reports[0]["plies"], 18)
+        self.assertEqual(reports[1]["plies"], 3)
+
+        error = reports[2]["error"]
+        self.assertEqual(error["type"], "InputDecodingError")
+        self.assertEqual(error["ply"], 2)
+        self.assertEqual(
+            error["fen"], "rnbqkbnr/pppp1ppp/8/4p3/4P3/8/PPPP1PPP/RNBQKBNR w KQkq - 0 2"
+        )
+
+    def test_unclaimedDrawsDoNotEndReplays(self):
+        # The starting position comes up a third time after ply 8, the game plays on without a claim
+        shuffle = "1. Nf3 Nf6 2. Ng1 Ng8 3. Nf3 Nf6 4. Ng1 Ng8 5. Nf3 Nf6 6. e4 e5 1-0"
+        # Fifty moves by each side without a pawn move or capture, then a mate
+        quiet = "[FEN \"7k/8/6K1/8/8/8/8/R7 w - - 99 1\"]\n\n1. Rb1 Kg8 2. Rb8# 1-0"
+        reports = list(validateGames(io.StringIO(shuffle + "\n\n" + quiet + "\n")))
+        self.assertEqual([report["error"] for report in reports], [None, None])
+        self.assertEqual(reports[0]["plies"], 12)
+        self.assertEqual(reports[0]["outcome"], None)
+        self.assertEqual(reports[1]["outcome"], WHITE)
+
+        game = Game(Game.defaultBoard(), testMoves=["Nf3", "Nf6", "Ng1", "Ng8"] * 2)
+        self.assertEqual(game.outcome, "draw")
+        replay = Game(Game.defaultBoard(), replay=True)
+        for san in ["Nf3", "Nf6", "Ng1", "Ng8"] * 2 + ["Nf3", "Nf6"]:
+            replay.move(input=san)
+        self.assertEqual(replay.outcome, None)
+        self.assertEqual(replay.claimableDraw, REPETITION)
+        replay.move(input="e4")
+        self.assertEqual(replay.claimableDraw, None)
+
+    def test_workerPoolKeepsOrder(self):
+        serial = list(validateGames(io.StringIO(PGN_SAMPLE)))
+        pooled = list(validateGames(io.StringIO(PGN_SAMPLE), workers=2, chunksize=1))
+        self.assertEqual(serial, pooled)
+
+
+class TestSan(unittest.TestCase):
+    def test_disambiguation(self):
+        # Knights on b1 and f3 both reach d2, rooks on a1 and a5 both reach a3
+        position = Position.fromFen("4k3/8/8/R7/8/5N2/8/RN2K3 w - - 0 1")
+        moves = generate_legal_moves(position)
+        names = sanMap(position, moves)
+        self.assertEqual(names["Nbd2"], position.findMove(squareIndex(0, 1), squareIndex(1, 3)))
+        self.assertEqual(names["Nfd2"], position.findMove(squareIndex(2, 5), squareIndex(1, 3)))
+        self.assertEqual(names["R1a3"], position.findMove(squareIndex(0, 0), squareIndex(2, 0)))
+        self.assertEqual(names["R5a3"], position.findMove(squareIndex(4, 0), squareIndex(2, 0)))
+        self.assertNotIn("Nd2", names)
+        # Over disambiguated input is accepted as well
+        self.assertEqual(names["Nf3d2"], names["Nfd2"])
+
+    def test_suffixesAndSpecialMoves(self):
+        position = Position.fromFen("r3k2r/1P6/8/8/8/8/8/R3K2R w KQkq - 0 1")
+        castle = position.findMove(squareIndex(0, 4), squareIndex(0, 6))
+        self.assertEqual(moveToSan(position, castle), "O-O")
+        promotion = position.findMove(squareIndex(6, 1), squareIndex(7, 0), 4)
+        self.assertEqual(moveToSan(position, promotion), "bxa8=Q+")
+
+        game = Game(Game.defaultBoard(), testMoves=["f2 f3", "e7 e5", "g2 g4", "d8 h4"])
+        self.assertEqual(game.moveHistory, ["f3", "e5", "g4", "Qh4#"])
+        self.assertEqual(game.outcome, BLACK)
+
+    def test_movesToSanLeavesPositionUnchanged(self):
+        position = Position.fromFen(PERFT_POSITIONS["kiwipete"][0])
+        fen = position.toFen()
+        moves = generate_legal_moves(position)[:5]
+        self.assertEqual(len(movesToSan(position, moves)), 5)
+        self.assertEqual(position.toFen(), fen)
+
+    def test_normalizeSan(self):
+        self.assertEqual(normalizeSan("0-0-0+"), "O-O-O")
+        self.assertEqual(normalizeSan("e8q"), "e8=Q")
+        self.assertEqual(normalizeSan("exd8=n#"), "exd8=N")
+        self.assertEqual(normalizeSan("Nf3!?"), "Nf3")
+
+    def test_sanInput(self):
+        game = Game(Game.defaultBoard(), testMoves=["e4", "e7 e5", "Nf3", "Nc6 draw"])
+        self.assertEqual(game.moveHistory, ["e4", "e5", "Nf3", "Nc6"])
+        self.assertTrue(game.drawOffered)
+        with self.assertRaises(InputDecodingError):
+            Game(Game.defaultBoard(), testMoves=["Nd2"])
+        with self.assertRaises(ExposingCheckError):
+            Game.from_fen("4k3/4r3/8/8/8/8/4B3/4K3 w - - 0 1", testMoves=["Bd3"])
+
+
+class TestEngine(unittest.TestCase):
+    def test_evaluateIsSymmetric(self):
+        start = Position.fromFen(PERFT_POSITIONS["start"][0])
+        self.assertEqual(evaluate(start), 0)
+        white = Position.fromFen("4k3/8/8/8/8/8/8/3QK3 w - - 0 1")
+        black = Position.fromFen("3qk3/8/8/8/8/8/8/4K3 b - - 0 1")
+        self.assertEqual(evaluate(white), evaluate(black))
+        self.assertGreater(evaluate(white), 800)
+
+    def test_findsMateInOne(self):
+        game = Game.from_fen("6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1")
+        result = best_move(game, Limit(depth=3))
+        self.assertEqual(result["san"], "Rd8#")
+        self.assertGreaterEqual(result["score"], MATE_BOUND)
+        game.move(result["a"], result["b"], result["promotionPiece"])
+        self.assertEqual(game.outcome, WHITE)
+
+    def test_winsHangingQueen(self):
+        game = Game.from_fen("4k3/8/8/3q4/8/2N5/8/4K3 w - - 0 1")
+        self.assertEqual(best_move(game, Limit(depth=2))["san"], "Nxd5")
+
+    def test_limits(self):
+        game = Game(Game.defaultBoard())
+        result = best_move(game, Limit(nodes=300))
+        self.assertLessEqual(result["nodes"], 300)
+        self.assertIn(result["move"], game.legalMoves)
+        self.assertLess(best_move(game, 0.05)["time"], 0.5)
+
+        game.resign()
+        with self.assertRaises(GameOverError):
+            best_move(game, Limit(depth=1))
+
+
+class TestTranspositionTable(unittest.TestCase):
+    def test_sizeFollowsBudget(self):
+        table = TranspositionTable(1)
+        self.assertEqual(table.megabytes, 1)
+        self.assertEqual(len(table.table) * table.table.itemsize, 1024 * 1024)
+        self.assertLessEqual(TranspositionTable(3).megabytes, 3)
+        with self.assertRaises(ValueError):
+            TranspositionTable(0)
+
+    def test_storeAndProbe(self):
+        table = TranspositionTable(1)
+        key = Position.fromFen(PERFT_POSITIONS["kiwipete"][0]).key
+        self.assertIsNone(table.probe(key))
+        table.store(key, 5, LOWER, -1234, 0x1ABC)
+        self.assertEqual(table.probe(key), (0x1ABC, 5, LOWER, -1234))
+        # A result without a move keeps the known best move
+        table.store(key, 6, EXACT, 20)
+        self.assertEqual(table.probe(key), (0x1ABC, 6, EXACT, 20))
+        self.assertEqual(table.bestMove(key), 0x1ABC)
+        stats = table.stats()
+        self.assertEqual((stats["probes"], stats["hits"], stats["misses"]), (3, 2, 1))
+
+    def test_replacementPolicy(self):
+        table = TranspositionTable(1)
+        # Keys that share a bucket
+        deep, shallow, other = 7, 7 + table.buckets, 7 + 2 * table.buckets
+        table.store(deep, 8, EXACT, 1)
+        table.store(shallow, 2, UPPER, 2)
+        self.assertEqual(table.probe(deep)[1], 8)
+        self.assertEqual(table.probe(shallow)[1], 2)
+        # The always replace slot gives way, the deep entry stays
+        table.store(other, 3, LOWER, 3)
+        self.assertIsNone(table.probe(shallow))
+        self.assertEqual(table.probe(deep)[1], 8)
+        self.assertEqual(table.probe(other)[1], 3)
+        self.assertEqual(table.overwrites, 1)
+        self.assertEqual(table.collisions, 1)
+        # A deeper result takes the depth preferred slot and moves the old entry down
+        table.store(shallow, 9, EXACT, 4)
+        self.assertEqual(table.probe(shallow)[1], 9)
+        self.assertEqual(table.probe(deep)[1], 8)
+        self.assertIsNone(table.probe(other))
+
+    def test_sharedTableBetweenSearches(self):
+        table = TranspositionTable(1)
+        game = Game.from_fen("4k3/8/8/3q4/8/2N5/8/4K3 w - - 0 1")
+        first = best_move(game, Limit(depth=3), table)
+        second = best_move(game, Limit(depth=3), table)
+        self.assertEqual(first["san"], second["san"])
+        self.assertEqual(second["score"], first["score"])
+        self.assertLess(second["nodes"], first["nodes"])
+        self.assertGreater(second["table"]["hits"], 0)
+
+
+class TestMoveOrdering(unittest.TestCase):
+    def test_mvvLva(self):
+        # The pawn on f2 and the queen on d2 can both take the queen on e3, the queen can also take on d4
+        position = Position.fromFen("4k3/8/8/8/3p4/4q3/3Q1P2/7K w - - 0 1")
+        pawnTakesQueen = position.findMove(squareIndex(1, 5), squareIndex(2, 4))
+        queenTakesQueen = position.findMove(squareIndex(1, 3), squareIndex(2, 4))
+        queenTakesPawn = position.findMove(squareIndex(1, 3), squareIndex(3, 3))
+        self.assertGreater(mvvLva(position, pawnTakesQueen), mvvLva(position, queenTakesQueen))
+        self.assertGreater(mvvLva(position, queenTakesQueen), mvvLva(position, queenTakesPawn))
+
+        ordered = MoveOrderer().order(position, generate_legal_moves(position))
+        self.assertEqual(ordered[:3], [pawnTakesQueen, queenTakesQueen, queenTakesPawn])
+
+    def test_killersAndHistory(self):
+        position = Position.fromFen(PERFT_POSITIONS["start"][0])
+        moves = generate_legal_moves(position)
+        orderer = MoveOrderer()
+        quiet = moves[-1]
+        orderer.cutoff(position, quiet, 2, 3, 5)
+        self.assertEqual(orderer.order(position, moves, 2)[0], quiet)
+        self.assertEqual(orderer.score(position, quiet, 2), KILLER_SCORE)
+        # Other plies only see the history score
+        self.assertEqual(orderer.score(position, quiet, 3), 9)
+        self.assertEqual(orderer.order(position, moves, 2, moves[4])[0], moves[4])
+        self.assertEqual(orderer.stats()["cutoffs"], 1)
+        self.assertEqual(orderer.stats()["firstMoveCutoffs"], 0)
+
+        # Killers last one search, history carries over
+        orderer.newSearch()
+        self.assertEqual(orderer.order(position, moves, 2)[0], quiet)
+        self.assertEqual(orderer.score(position, quiet, 2), 4)
+
+    def test_orderingReducesNodes(self):
+        game = Game(Game.defaultBoard())
+        plain = best_move(game, Limit(depth=3), orderer=MoveOrderer(False, False, False))
+        ordered = best_move(game, Limit(depth=3), orderer=MoveOrderer())
+        self.assertEqual(plain["score"], ordered["score"])
+        self.assertLess(ordered["nodes"], plain["nodes"])
+        self.assertGreater(
+            ordered["ordering"]["firstMoveRate"], plain["ordering"]["firstMoveRate"]
+        )
+
+
+class TestAttackTables(unittest.TestCase):
+    def test_stepTargets(self):
+        self.assertEqual(set(KNIGHT_TARGETS[(0, 0)]), {(1, 2), (2, 1)})
+        self.assertEqual(len(KNIGHT_TARGETS[(3, 3)]), 8)
+        self.assertEqual(len(KING_TARGETS[(0, 7)]), 3)
+        self.assertEqual(len(KING_TARGETS[(4, 4)]), 8)
+
+    def test_rays(self):
+        self.assertEqual(len(BISHOP_RAYS[(0, 0)]), 1)
+        self.assertEqual(BISHOP_RAYS[(0, 0)][0], tuple((i, i) for i in range(1, 8)))
+        self.assertEqual(sum(len(ray) for ray in QUEEN_RAYS[(3, 3)]), 27)
+
+    def test_blockersStopRays(self):
+        board = {(3, 3): Queen(WHITE), (3, 5): Pawn(WHITE), (5, 5): Pawn(BLACK)}
+        moves = board[(3, 3)].availableMoves(board, 3, 3)
+        self.assertIn((3, 4), moves)
+        self.assertNotIn((3, 5), moves)
+        self.assertIn((5, 5), moves)
+        self.assertNotIn((6, 6), moves)
+        self.assertEqual(len(moves), 22)
+
+
+class TestFlyweightPieces(unittest.TestCase):
+    def test_sharedInstances(self):
+        self.assertIs(Pawn(WHITE), Pawn(WHITE))
+        self.assertIsNot(Pawn(WHITE), Pawn(BLACK))
+        self.assertIsNot(Rook(WHITE), King(WHITE))
+        self.assertIs(pickle.loads(pickle.dumps(Queen(BLACK))), Queen(BLACK))
+        self.assertFalse(hasattr(Knight(WHITE), "__dict__"))
+        self.assertEqual(Pawn(BLACK).direction, -1)
+
+    def test_piecesAreImmutable(self):
+        with self.assertRaises(AttributeError):
+            Rook(WHITE).color = BLACK
+        with self.assertRaises(AttributeError):
+            King(WHITE).moved = True
+
+    def test_gamesShareAndCopyBoards(self):
+        first = Game(Game.defaultBoard(), testMoves=["e2 e4"])
+        copy = Board.copy(first.board)
+        second = Game(copy, testMoves=["d2 d4"])
+        self.assertIs(first.board[(3, 4)], second.board[(3, 3)])
+        self.assertNotIn((3, 3), first.board)
+        self.assertIn((1, 3), first.board)
+
+    def test_castlingRightsLiveInThePosition(self):
+        board = {
+            Square.stringtoTuple("e1"): King(WHITE),
+            Square.stringtoTuple("h1"): Rook(WHITE),
+            Square.stringtoTuple("e8"): King(BLACK),
+        }
+        # The king returns to its home square, but the right is gone
+        game = Game(board, testMoves=["e1 f1", "e8 d8", "f1 e1", "d8 e8"])
+        self.assertEqual(game.position.castling, 0)
+        self.assertEqual(King(WHITE).castlingMoves(game.board, game.position), [])
+        self.assertEqual(King(WHITE).castlingMoves(game.board), [(0, 6)])
+        self.assertNotIn((0, 6), game.availableMoves(0, 4))
+        with self.assertRaises(InvalidMoveError):
+            game.move(Square.stringToDict("e1"), Square.stringToDict("g1"))
+
+    def test_enPassantFromThePosition(self):
+        game = Game(Game.defaultBoard(), testMoves=["e2 e4", "a7 a6", "e4 e5", "d7 d5"])
+        pawn = game.board[Square.stringtoTuple("e5")]
+        self.assertIn((5, 3), pawn.availableMoves(game.board, 4, 4, game.position))
+        self.assertNotIn((5, 3), pawn.availableMoves(game.board, 4, 4))
+        self.assertIn((5, 3), game.availableMoves(4, 4))
+
+
+class TestGameStore(unittest.TestCase):
+    def setUp(self):
+        self.now = 0
+        self.store = GameStore(maxGames=2, ttl=60, clock=lambda: self.now)
+
+    def test_gamesAreKeptApart(self):
+        first = self.store.add(Game(Game.defaultBoard()))
+        second = self.store.add(Game(Game.defaultBoard()))
+        self.assertNotEqual(first, second)
+        self.store.get(first).move(Square.stringToDict("e2"), Square.stringToDict("e4"))
+        self.assertEqual(self.store.get(first).turn, BLACK)
+        self.assertEqual(self.store.get(second).turn, WHITE)
+        with self.assertRaises(GameNotFoundError):
+            self.store.get("missing")
+
+    def test_leastRecentlyUsedIsEvictedAtTheCap(self):
+        first = self.store.add(Game(Game.defaultBoard()))
+        second = self.store.add(Game(Game.defaultBoard()))
+        self.store.get(first)
+        third = self.store.add(Game(Game.defaultBoard()))
+        self.assertIn(first, self.store)
+        self.assertNotIn(second, self.store)
+        self.assertIn(third, self.store)
+        self.assertEqual(self.store.stats()["evicted"], 1)
+
+    def test_idleGamesExpire(self):
+        first = self.store.add(Game(Game.defaultBoard()))
+        self.now = 40
+        second = self.store.add(Game(Game.defaultBoard()))
+        self.now = 80
+        self.assertNotIn(first, self.store)
+        self.assertIsNotNone(self.store.get(second))
+        self.now = 130
+        self.assertIsNotNone(self.store.get(second))
+        self.assertEqual(len(self.store), 1)
+        self.assertEqual(self.store.stats()["expired"], 1)
+
+    def test_gamesInUseAreKept(self):
+        first = self.store.add(Game(Game.defaultBoard()))
+        second = self.store.add(Game(Game.defaultBoard()))
+        with self.store.gameLock(first):
+            self.assertTrue(self.store.gameLocks[first][0].locked())
+            # The least recently used game is in use, the next one is evicted instead
+            third = self.store.add(Game(Game.defaultBoard()))
+            self.assertEqual(list(self.store.games), [first, third])
+            self.now = 1000
+            self.assertEqual(len(self.store), 1)
+            self.assertIn(first, self.store)
+            self.assertEqual(self.store.gameLocks[first][1], 1)
+        self.assertEqual(self.store.gameLocks, {})
+        self.assertEqual(len(self.store), 0)
+        self.assertNotIn(second, self.store)
+
+
+class TestGameDatabase(unittest.TestCase):
+    SAMPLE = "e4 e5 Nf3 Nc6 Bc4 Nf6 O-O Bc5 d3 d6 Bg5 h6 Bxf6 Qxf6 Nc3 O-O Nd5 Qd8".split()
+
+    def setUp(self):
+        self.database = GameDatabase(":memory:", snapshotInterval=4)
+        self.game = Game(Game.defaultBoard(), testMoves=self.SAMPLE)
+
+    def tearDown(self):
+        self.database.close()
+
+    def test_movesUseTwoBytesEach(self):
+        moves = self.game.playedMoves()
+        self.assertEqual(len(encodeMoves(moves)), 2 * len(moves))
+        self.assertEqual(decodeMoves(encodeMoves(moves)), moves)
+
+    def test_saveAndReplay(self):
+        self.database.saveGame("sample", self.game, {"White": "A", "Black": "B"})
+        self.assertIn("sample", self.database)
+        loaded = self.database.loadGame("sample")
+        self.assertEqual(loaded.to_fen(), self.game.to_fen())
+        self.assertEqual(loaded.moveHistory, self.SAMPLE)
+        self.assertEqual(self.database.loadRecord("sample")[1], {"White": "A", "Black": "B"})
+        self.assertLess(self.database.storedBytes("sample"), 600)
+        self.assertIsNone(self.database.loadGame("missing"))
+
+    def test_outcomeAndStartFenAreKept(self):
+        game = Game.from_fen("8/P6k/8/8/8/8/8/K7 w - - 0 1", testMoves=["a8=Q"])
+        game.resign()
+        self.database.saveGame("promotion", game)
+        loaded = self.database.loadGame("promotion")
+        self.assertEqual(loaded.outcome, WHITE)
+        self.assertEqual(loaded.startFen, "8/P6k/8/8/8/8/8/K7 w - - 0 1")
+        self.assertEqual(loaded.to_fen(), game.to_fen())
+        self.assertEqual(loaded.outcomeReason, RESIGNATION)
+
+        game = Game(Game.defaultBoard(), testMoves=["e4"])
+        game.offerDraw()
+        self.database.saveGame("offer", game)
+        loaded = self.database.loadGame("offer")
+        self.assertTrue(loaded.drawOffered)
+        self.assertEqual(loaded.offerDraw(), "draw")
+
+    def test_gamesPlayedPastUnclaimedDrawsLoad(self):
+        game = Game(Game.defaultBoard(), replay=True)
+        for san in ["Nf3", "Nf6", "Ng1", "Ng8"] * 2 + ["e4"]:
+            game.move(input=san)
+        self.database.saveGame("shuffle", game)
+        loaded = self.database.loadGame("shuffle")
+        self.assertEqual((loaded.to_fen(), loaded.outcome, loaded.replay), (game.to_fen(), None, False))
+        loaded.move(input="e5")
+
+    def test_olderDatabaseFilesGainNewColumns(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "games.db")
+            connection = sqlite3.connect(path)
+            connection.execute(
+                "CREATE TABLE games (id TEXT PRIMARY KEY, startFen TEXT NOT NULL, headers TEXT NOT NULL, "
+                "moves BLOB NOT NULL, outcome TEXT, created REAL NOT NULL, updated REAL NOT NULL)"
+            )
+            connection.execute(
+                "INSERT INTO games VALUES ('old', ?, '{}', ?, NULL, 0, 0)",
+                (Game(Game.defaultBoard()).startFen, encodeMoves(self.game.playedMoves())),
+            )
+            connection.commit()
+            connection.close()
+            database = GameDatabase(path)
+            loaded = database.loadGame("old")
+            self.assertEqual(loaded.to_fen(), self.game.to_fen())
+            self.assertEqual((loaded.outcomeReason, loaded.drawOffered), (None, False))
+            database.saveGame("old", self.game)
+            database.close()
+
+    def test_positionAtUsesSnapshots(self):
+        replay = Game(Game.defaultBoard())
+        fens = [replay.to_fen()]
+        for san in self.SAMPLE:
+            replay.move(input=san)
+            fens.append(replay.to_fen())
+        self.database.saveGame("sample", self.game)
+        for ply in (0, 3, 4, 9, 18):
+            self.assertEqual(self.database.positionAt("sample", ply).toFen(), fens[ply])
+        with self.assertRaises(IndexError):
+            self.database.positionAt("sample", 19)
+
+    def test_storeReloadsEvictedGames(self):
+        store = GameStore(maxGames=1, database=self.database)
+        first = store.add(self.game)
+        store.add(Game(Game.defaultBoard()))
+        self.assertEqual(store.stats()["evicted"], 1)
+        self.assertIn(first, store)
+        self.assertEqual(store.get(first).to_fen(), self.game.to_fen())
+        self.assertEqual(store.stats()["loaded"], 1)
+
+
+class TestEventBroker(unittest.TestCase):
+    def test_formatEvent(self):
+        self.assertEqual(formatEvent("outcome", {"outcome": None}), 'event: outcome\ndata: {"outcome": null}\n\n')
+
+    def test_streamSendsInitialThenPublished(self):
+        broker = EventBroker(heartbeat=0.01)
+        stream = broker.stream("game", [("board", {"e1": "K"})])
+        self.assertEqual(next(stream), formatEvent("board", {"e1": "K"}))
+        self.assertEqual(next(stream), ": keepalive\n\n")
+        broker.publish("game", "draw", {"drawOffered": True})
+        broker.publish("other", "draw", {"drawOffered": False})
+        self.assertEqual(next(stream), formatEvent("draw", {"drawOffered": True}))
+        self.assertEqual(broker.listeners("game"), 1)
+        self.assertEqual(broker.stats(), {"streams": 1, "published": 2, "dropped": 0})
+        stream.close()
+        self.assertEqual(broker.listeners("game"), 0)
+
+    def test_slowSubscriberIsDropped(self):
+        broker = EventBroker(heartbeat=0.01, maxPending=2)
+        stream = broker.stream("game")
+        next(stream)
+        for ply in range(3):
+            broker.publish("game", "move", {"ply": ply})
+        self.assertEqual(broker.dropped, 1)
+        self.assertEqual(broker.listeners("game"), 0)
+        # the stream ends without its backlog, the client reconnects for a fresh board
+        self.assertEqual(list(stream), [])
+
+    def test_eventsPublishedWhileTheSnapshotIsBuiltAreKept(self):
+        broker = EventBroker(heartbeat=0.01)
+        subscriber = broker.subscribe("game")
+        broker.publish("game", "move", {"san": "e4"})
+        stream = broker.stream("game", [("board", {"e4": "P"})], subscriber)
+        self.assertEqual(next(stream), formatEvent("board", {"e4": "P"}))
+        self.assertEqual(next(stream), formatEvent("move", {"san": "e4"}))
+        stream.close()
+        self.assertEqual(broker.listeners("game"), 0)
+
+    def test_streamsEndAfterTheirLifetime(self):
+        now = [0.0]
+        broker = EventBroker(heartbeat=10, lifetime=60, clock=lambda: now[0])
+        stream = broker.stream("game", [("board", {})])
+        next(stream)
+        broker.publish("game", "draw", {"drawOffered": True})
+        self.assertEqual(next(stream), formatEvent("draw", {"drawOffered": True}))
+        now[0] = 60
+        self.assertEqual(list(stream), [])
+        self.assertEqual(broker.listeners("game"), 0)
+
+
+class TestHintCache(unittest.TestCase):
+    def test_hintsMatchLegalMoves(self):
+        game = Game.from_fen("4k3/1P6/8/8/8/8/8/R3K2R w KQ - 0 1")
+        hints = moveHints(game.legalMoves)
+        # four promotions share one target, castling is a king move
+        self.assertEqual(hints["b7"], ["b8"])
+        self.assertIn("g1", hints["e1"])
+        self.assertIn("c1", hints["e1"])
+        self.assertEqual(sum(len(targets) for targets in hints.values()), len(game.legalMoves) - 3)
+
+    def test_cachedByPositionKey(self):
+        cache = HintCache()
+        game = Game(Game.defaultBoard())
+        other = Game(Game.defaultBoard())
+        self.assertEqual(sorted(cache.targets(game, "g1")), ["f3", "h3"])
+        self.assertIs(cache.get(other), cache.get(game))
+        self.assertEqual(cache.stats()["hits"], 2)
+        game.move(input="e4")
+        self.assertEqual(cache.targets(game, "e2"), [])
+        self.assertEqual(sorted(cache.targets(game, "e7")), ["e5", "e6"])
+        self.assertEqual(len(cache), 2)
+
+    def test_leastRecentlyUsedPositionIsDropped(self):
+        cache = HintCache(maxPositions=1)
+        game = Game(Game.defaultBoard())
+        start = cache.get(game)
+        game.move(input="d4")
+        cache.get(game)
+        self.assertEqual(len(cache), 1)
+        self.assertIsNot(cache.get(Game(Game.defaultBoard())), start)
+        self.assertEqual(cache.stats()["misses"], 3)
+
+
+class TestEnginePool(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.pool = EnginePool(processes=1, megabytes=1)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.shutdown()
+
+    def test_matchesInProcessSearch(self):
+        game = Game.from_fen("4k3/8/8/3q4/8/2N5/8/4K3 w - - 0 1")
+        result = self.pool.bestMove(game, Limit(depth=2))
+        local = best_move(game, Limit(depth=2))
+        self.assertEqual(result["san"], "Nxd5")
+        self.assertEqual((result["a"], result["b"], result["score"]), (local["a"], local["b"], local["score"]))
+
+    def test_staleResultIsDropped(self):
+        game = Game(Game.defaultBoard())
+        future = self.pool.submit(game, Limit(depth=1))
+        key = game.position.key
+        game.move(input="e4")
+        self.assertIsNone(self.pool.describe(game, key, future.result()))
+        game.resign()
+        with self.assertRaises(GameOverError):
+            self.pool.submit(game)
+
+
+@unittest.skipIf(numpy is None, "batch evaluation needs numpy")
+class TestBatchEvaluation(unittest.TestCase):
+    FENS = [
+        PERFT_POSITIONS["start"][0],
+        "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+        "4k3/8/8/3q4/8/2N5/8/4K3 b - - 0 1",
+        "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+    ]
+
+    def test_packing(self):
+        mailboxes, sides = packPositions(self.FENS + [Game(Game.defaultBoard())])
+        self.assertEqual(mailboxes.shape, (5, 64))
+        self.assertEqual(mailboxes.dtype, numpy.int8)
+        self.assertEqual(list(sides), [0, 0, 1, 0, 0])
+        self.assertEqual(mailboxes[0].tolist(), Position.fromFen(self.FENS[0]).mailbox)
+        self.assertTrue((packBoards([Game.defaultBoard()])[0] == mailboxes[4]).all())
+        planes = toPlanes(mailboxes)
+        self.assertEqual(planes.shape, (5, 12, 64))
+        self.assertEqual(planes[0].sum(), 32)
+
+    def test_materialAndSquaresMatchEngine(self):
+        terms = evaluateTerms(packPositions(self.FENS)[0])
+        for index, fen in enumerate(self.FENS):
+            position = Position.fromFen(fen)
+            expected = evaluate(position) if position.side == 0 else -evaluate(position)
+            self.assertEqual(terms["material"][index] + terms["squares"][index], expected)
+
+    def test_mobilityAndKingSafety(self):
+        terms = evaluateTerms(packPositions(self.FENS)[0])
+        # The start position is symmetric, a lone knight has eight moves worth 4 each
+        self.assertEqual(terms["mobility"][0], 0)
+        self.assertEqual(terms["kingSafety"][0], 0)
+        knight = evaluateTerms(packPositions(["4k3/8/8/8/3N4/8/8/4K3 w - - 0 1"])[0])
+        self.assertEqual(knight["mobility"][0], 32)
+        scores = evaluatePositions(self.FENS)
+        self.assertEqual(scores.shape, (4,))
+        # Black to move with the queen up
+        self.assertGreater(scores[2], 500)
+        self.assertEqual(len(evaluatePositions([])), 0)
+
+
+class TestTournament(unittest.TestCase):
+    def test_outcomeReasons(self):
+        game = Game.from_fen("6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1", testMoves=["Rd8"])
+        self.assertEqual((game.outcome, game.outcomeReason), (WHITE, CHECKMATE))
+        game = Game.from_fen("4k3/8/8/8/8/8/8/R3K3 w - - 99 80", testMoves=["Ra2"])
+        self.assertEqual((game.outcome, game.outcomeReason), (DRAW, FIFTY_MOVES))
+        # Fifty moves by each side, not fifty plies
+        game = Game.from_fen("4k3/8/8/8/8/8/8/R3K3 w - - 50 55", testMoves=["Ra2"])
+        self.assertEqual((game.outcome, game.fiftyMoveRule), (None, 51))
+        # A mate on the hundredth quiet ply stands
+        game = Game.from_fen("7k/8/6K1/8/8/8/8/1R6 w - - 99 80", testMoves=["Rb8"])
+        self.assertEqual((game.outcome, game.outcomeReason), (WHITE, CHECKMATE))
+        game = Game.from_fen("4k3/8/8/8/8/8/4r3/4K1N1 w - - 0 1", testMoves=["Kxe2"])
+        self.assertEqual((game.outcome, game.outcomeReason), (DRAW, INSUFFICIENT_MATERIAL))
+        game = Game(Game.defaultBoard(), testMoves=["Nf3", "Nf6", "Ng1", "Ng8"] * 2)
+        self.assertEqual((game.outcome, game.outcomeReason), (DRAW, REPETITION))
+        game = Game(Game.defaultBoard())
+        game.resign()
+        self.assertEqual((game.outcome, game.outcomeReason), (BLACK, RESIGNATION))
+
+    def test_playGame(self):
+        record = playGame("script:e4,e5,Qh5,Nc6,Bc4,Nf6,Qxf7:random", "script:e4,e5,Qh5,Nc6,Bc4,Nf6:random")
+        self.assertEqual(record["moves"], ["e4", "e5", "Qh5", "Nc6", "Bc4", "Nf6", "Qxf7#"])
+        self.assertEqual((record["outcome"], record["reason"]), (WHITE, CHECKMATE))
+        record = playGame("random", "random", seed=3, maxPlies=10)
+        self.assertEqual((record["outcome"], record["reason"], record["plies"]), (DRAW, MAX_PLIES, 10))
+        self.assertEqual(playGame("random", "random", seed=3, maxPlies=10)["moves"], record["moves"])
+
+    def test_elo(self):
+        self.assertEqual(eloDifference(0.5, 10), 0)
+        self.assertAlmostEqual(eloDifference(0.75, 100), 190.85, places=2)
+        elo, margin = eloInterval(30, 40, 30)
+        self.assertEqual(elo, 0)
+        self.assertGreater(margin, 0)
+
+    def test_runTournament(self):
+        records, summary = runTournament(["engine:depth=1", "random"], 2, processes=1, maxPlies=60)
+        self.assertEqual(len(records), 2)
+        self.assertEqual([record["white"] for record in records], ["engine:depth=1", "random"])
+        standings = summary["standings"]
+        self.assertGreaterEqual(standings["engine:depth=1"]["points"], standings["random"]["points"])
+        self.assertAlmostEqual(standings["engine:depth=1"]["elo"], -standings["random"]["elo"])
+        self.assertEqual(sum(summary["reasons"].values()), 2)
+        self.assertEqual(summary["plies"], sum(record["plies"] for record in records))
+
+
+class TestOpeningBook(unittest.TestCase):
+    PGN = """[Result "1-0"]
+
+1. e4 e5 2. Nf3 Nc6 1-0
+
+[Result "1/2-1/2"]
+
+1. e4 c5 1/2-1/2
+
+[Result "0-1"]
+
+1. d4 d5 0-1
+
+[Result "*"]
+
+1. c4 *
+"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "book.bin")
+
+    def openBook(self):
+        book = OpeningBook(self.path)
+        self.addCleanup(book.close)
+        return book
+
+    def test_buildAndProbe(self):
+        self.assertEqual(buildBook(io.StringIO(self.PGN), self.path, plies=2), 3)
+        self.assertEqual(os.path.getsize(self.path), 3 * ENTRY.size)
+        book = self.openBook()
+        game = Game(Game.defaultBoard())
+        # e4 won once and drew once, losing moves (d4, e5) and unfinished games are left out
+        self.assertEqual(game.bookMoves(book), [("e4", 3, 2)])
+        game.move(input="e4")
+        self.assertEqual(game.bookMoves(book), [("c5", 1, 1)])
+        game.move(input="c5")
+        self.assertEqual(game.bookMoves(book), [])
+        self.assertEqual(book.stats()["hits"], 2)
+
+    def test_sortedEntriesAndLegalMovesOnly(self):
+        start = Game(Game.defaultBoard())
+        e4, d4 = start.sanMoves()["e4"], start.sanMoves()["d4"]
+        # e2e5 is not legal, it stands in for a move stored under a colliding key
+        illegal = 12 | 36 << 6
+        moves = {key: {1: [1, 1]} for key in (5, 1 << 40, 3)}
+        moves[start.position.key] = {e4: [4, 2], d4: [9, 3], illegal: [50, 5]}
+        writeBook(moves, self.path)
+        book = self.openBook()
+        self.assertEqual(len(book), 6)
+        self.assertEqual(book.entriesFor(3), [(1, 1, 1)])
+        self.assertEqual(book.entriesFor(4), [])
+        self.assertEqual([entry[0] for entry in book.entriesFor(start.position.key)], [illegal, d4, e4])
+        self.assertEqual(book.choose(start.position, best=True), d4)
+        self.assertIn(book.choose(start.position), (d4, e4))
+        result = bookMove(start, book, best=True)
+        self.assertEqual((result["san"], result["book"]), ("d4", True))
+
+    def test_emptyAndInvalidFiles(self):
+        open(self.path, "wb").close()
+        book = self.openBook()
+        self.assertEqual(len(book), 0)
+        self.assertIsNone(bookMove(Game(Game.defaultBoard()), book))
+        with open(self.path, "wb") as file:
+            file.write(b"not a book")
+        with self.assertRaises(ValueError):
+            OpeningBook(self.path)
+
+
+@unittest.skipIf(numpy is None, "generating tablebases needs numpy")
+class TestTablebase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        # The longest losses are one ply past the longest wins, mate in 10, 16 and 28 moves
+        cls.longest = {name: longest for name, seconds, longest in generateTables(["KPK"], cls.directory.name)}
+        cls.tablebases = Tablebases(cls.directory.name)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tablebases.close()
+        cls.directory.cleanup()
+
+    def probe(self, fen):
+        return self.tablebases.probe(Position.fromFen(fen))
+
+    def test_generatedTables(self):
+        self.assertEqual(self.longest, {"KQK": 20, "KRK": 32, "KPK": 56})
+        self.assertEqual(self.tablebases.available(), ["KPK", "KQK", "KRK"])
+        # Folded by symmetry: 10 white king squares without pawns, 32 with, one byte per position
+        sizes = {name: os.path.getsize(os.path.join(self.directory.name, name + ".ctb")) for name in self.longest}
+        pawnless = 16 + 2 * 10 * 64 ** 2
+        self.assertEqual(sizes, {"KQK": pawnless, "KRK": pawnless, "KPK": 16 + 2 * 32 * 64 ** 2})
+        self.assertEqual(tableName("K", "KQ"), ("KQK", True))
+        self.assertEqual(tableName("KR", "KQ"), ("KQKR", True))
+
+    def test_probe(self):
+        self.assertEqual(self.probe("7k/8/6K1/8/8/8/8/1Q6 w - - 0 1"), (WIN, 1))
+        # The same position with the colors swapped is looked up mirrored
+        self.assertEqual(self.probe("1q6/8/8/8/8/6k1/8/7K b - - 0 1"), (WIN, 1))
+        self.assertEqual(self.probe("7k/6Q1/6K1/8/8/8/8/8 b - - 0 1"), (LOSS, 0))
+        self.assertEqual(self.probe("k7/P7/1K6/8/8/8/8/8 b - - 0 1"), (TABLEBASE_DRAW, None))
+        self.assertEqual(self.probe("k7/8/8/8/8/8/P7/K7 w - - 0 1"), (TABLEBASE_DRAW, None))
+        self.assertEqual(self.probe("8/8/8/4k3/8/8/8/2B1K3 w - - 0 1"), (TABLEBASE_DRAW, None))
+        self.assertIsNone(self.probe("rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"))
+        self.assertIsNone(self.probe("4k3/8/8/8/8/8/8/R3K3 w Q - 0 1"))
+        # The side not to move is in check
+        self.assertIsNone(self.probe("7k/8/6K1/8/8/8/8/Q7 w - - 0 1"))
+        # No KQKR file in the directory
+        self.assertIsNone(self.probe("4k3/8/8/8/8/8/8/Q2rK3 w - - 0 1"))
+
+    def test_resultsAgreeWithMoves(self):
+        rng = random.Random(3)
+        checked = 0
+        while checked < 200:
+            letters = rng.choice(["KQk", "KRk", "KPk", "kqK", "kpK"])
+            board = ["."] * 64
+            for letter, sq in zip(letters, rng.sample(range(64), 3)):
+                board[sq] = letter
+            fen = "/".join("".join(board[row * 8:row * 8 + 8]) for row in range(7, -1, -1))
+            fen = re.sub(r"\.+", lambda dots: str(len(dots.group())), fen) + rng.choice([" w", " b"]) + " - - 0 1"
+            position = Position.fromFen(fen)
+            pawnOnLastRank = any(board[sq] in "Pp" for sq in [*range(8), *range(56, 64)])
+            if pawnOnLastRank or position.inCheck(position.side ^ 1):
+                continue
+            result, dtm = self.probe(fen)
+            children = []
+            for move in generate_legal_moves(position):
+                position.make_move(move)
+                children.append(self.tablebases.probe(position))
+                position.unmake_move()
+            if result == WIN:
+                self.assertEqual(min(child[1] for child in children if child[0] == LOSS), dtm - 1, fen)
+            elif result == LOSS:
+                self.assertTrue(all(child[0] == WIN for child in children), fen)
+                self.assertEqual(max((child[1] for child in children), default=-1), dtm - 1, fen)
+            else:
+                self.assertNotIn(LOSS, [child[0] for child in children], fen)
+            checked += 1
+
+    def test_engineScoresFromTables(self):
+        game = Game.from_fen("8/8/8/4k3/8/8/8/R3K3 w - - 0 1")
+        result, dtm = self.tablebases.probe(game.position)
+        found = best_move(game, Limit(depth=3), tablebases=self.tablebases)
+        self.assertEqual(found["score"], MATE - dtm)
+        self.assertGreater(found["tablebaseHits"], 0)
+        # Playing the moves the tables prefer mates in exactly dtm plies
+        for _ in range(dtm):
+            found = best_move(game, Limit(depth=1), tablebases=self.tablebases)
+            game.move(found["a"], found["b"], found["promotionPiece"])
+        self.assertEqual((game.outcome, game.outcomeReason), (WHITE, CHECKMATE))
+
+    def test_adjudication(self):
+        game = Game.from_fen("8/8/8/4k3/8/8/8/R3K3 b - - 0 1")
+        self.assertEqual(adjudicate(game, self.tablebases), WHITE)
+        self.assertIsNone(adjudicate(Game(Game.defaultBoard()), self.tablebases))
+        record = playGame("random", "random", fen="8/8/8/4k3/8/8/3P4/4K3 w - - 0 1",
+                          tablebases=self.directory.name)
+        self.assertEqual((record["reason"], record["plies"]), (TABLEBASE, 0))
+        self.assertIn(record["outcome"], (WHITE, "draw"))
+
+    def test_invalidFile(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, "KQK.ctb"), "wb") as file:
+                file.write(b"not a table" * 10)
+            with self.assertRaises(ValueError):
+                Tablebases(directory).probe(Position.fromFen("7k/8/6K1/8/8/8/8/1Q6 w - - 0 1"))
+
+
+class TestPositionIndex(unittest.TestCase):
+    SAMPLE = TestGameDatabase.SAMPLE
+
+    def setUp(self):
+        self.positions = PositionIndex(":memory:")
+        self.database = GameDatabase(":memory:", positions=self.positions)
+
+    def tearDown(self):
+        self.database.close()
+        self.positions.close()
+
+    def fenAfter(self, sans):
+        return Game(Game.defaultBoard(), testMoves=sans).to_fen()
+
+    def test_savedGamesAreIndexed(self):
+        self.database.saveGame("sample", Game(Game.defaultBoard(), testMoves=self.SAMPLE))
+        self.database.saveGame("petrov", Game(Game.defaultBoard(), testMoves=["e4", "e5", "Nf3", "Nf6"]))
+        self.assertEqual(self.positions.find(self.fenAfter(["e4", "e5", "Nf3"])), [("sample", 3), ("petrov", 3)])
+        self.assertEqual(self.positions.find(self.fenAfter(["e4", "e5", "Nf3", "Nf6"])), [("petrov", 4)])
+        self.assertEqual(self.positions.count(Game(Game.defaultBoard())), 2)
+        self.assertEqual(self.positions.find(self.fenAfter(["d4"])), [])
+        self.assertEqual(self.positions.find(self.fenAfter(["e4"]), limit=1), [("sample", 1)])
+        standard = "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1"
+        self.assertEqual(self.positions.find(standard), [("sample", 1), ("petrov", 1)])
+        self.database.deleteGame("sample")
+        self.assertNotIn("sample", self.positions)
+        self.assertEqual(self.positions.count(self.fenAfter(["e4"])), 1)
+
+    def test_incrementalAppendsAndUndos(self):
+        start = Game(Game.defaultBoard())
+        moves = Game(Game.defaultBoard(), testMoves=self.SAMPLE).playedMoves()
+        self.assertEqual(self.positions.indexGame("sample", start.startFen, moves[:4]), 5)
+        # Only the new plies are written, nothing when the moves did not change
+        self.assertEqual(self.positions.indexGame("sample", start.startFen, moves[:6]), 2)
+        self.assertEqual(self.positions.indexGame("sample", start.startFen, moves[:6]), 0)
+        self.assertEqual(self.positions.find(self.fenAfter(self.SAMPLE[:6])), [("sample", 6)])
+        # Taking back three plies and playing d6 instead drops the positions after the third ply
+        d6 = Game(Game.defaultBoard(), testMoves=self.SAMPLE[:3] + ["d6"]).playedMoves()
+        self.assertEqual(self.positions.indexGame("sample", start.startFen, d6), 1)
+        self.assertEqual(self.positions.find(self.fenAfter(self.SAMPLE[:6])), [])
+        self.assertEqual(self.positions.find(self.fenAfter(self.SAMPLE[:3] + ["d6"])), [("sample", 4)])
+
+    def test_repeatedPositionsAndLargeKeys(self):
+        shuffle = ["Nf3", "Nf6", "Ng1", "Ng8"] * 2
+        self.database.saveGame("shuffle", Game(Game.defaultBoard(), testMoves=shuffle))
+        self.assertEqual(
+            self.positions.find(Game(Game.defaultBoard())), [("shuffle", 0), ("shuffle", 4), ("shuffle", 8)]
+        )
+        self.assertEqual(self.positions.count(Game(Game.defaultBoard())), 1)
+        # Games that play on past a repetition nobody claimed are indexed, in bulk and a few plies at a time
+        played = Game(Game.defaultBoard(), replay=True)
+        for san in shuffle + ["Nf3", "Nf6", "e4"]:
+            played.move(input=san)
+        moves = played.playedMoves()
+        self.assertEqual(self.positions.indexRecords([("played", played.startFen, moves)]), (1, 12))
+        self.assertEqual(self.positions.indexGame("growing", played.startFen, moves[:7]), 8)
+        self.assertEqual(self.positions.indexGame("growing", played.startFen, moves), 4)
+        self.assertEqual(self.positions.find(played, limit=10), [("played", 11), ("growing", 11)])
+        self.assertEqual(signedKey((1 << 64) - 1), -1)
+        self.assertEqual(signedKey(5), 5)
+
+    def test_bulkBuild(self):
+        openings = [["e4", "e5"], ["e4", "c5"], ["d4", "d5", "c4"], ["c4"], ["e4", "e5", "Nf3"]]
+        database = GameDatabase(":memory:")
+        self.addCleanup(database.close)
+        for number, sans in enumerate(openings):
+            database.saveGame(f"game{number}", Game(Game.defaultBoard(), testMoves=sans))
+        self.assertEqual(self.positions.build(database, batchSize=2), (5, 16))
+        # Indexed games are skipped the next time
+        self.assertEqual(self.positions.build(database, batchSize=2), (0, 0))
+        self.assertEqual(self.positions.count(self.fenAfter(["e4"])), 3)
+        self.assertEqual(self.positions.find(self.fenAfter(["d4", "d5", "c4"])), [("game2", 3)])
+        self.assertEqual(self.positions.stats()["games"], 5)
+
+    def test_bulkBuildInWorkerProcesses(self):
+        records = [(f"game{number}", Game(Game.defaultBoard()).startFen,
+                    Game(Game.defaultBoard(), testMoves=self.SAMPLE[:number]).playedMoves())
+                   for number in range(6)]
+        self.assertEqual(self.positions.indexRecords(records, batchSize=4, processes=2), (6, 21))
+        self.assertEqual(self.positions.count(self.fenAfter(self.SAMPLE[:2])), 4)
+
+
+class TestAppServer(unittest.TestCase):
+    # Out of any opening book, so the computer move is searched
+    FEN = "r1bq1rk1/pp2bppp/2n1pn2/3p4/2PP4/2N1PN2/P3BPPP/R1BQK2R w KQ - 0 8"
+
+    @classmethod
+    def setUpClass(cls):
+        from werkzeug.serving import make_server, WSGIRequestHandler
+        import app
+
+        # Keeps the request log out of the test output
+        class QuietHandler(WSGIRequestHandler):
+            def log_request(self, *args):
+                pass
+
+        cls.app = app
+        # Services of a running app (the self-test endpoint imports these tests) are put back afterwards
+        cls.savedServices = {name: getattr(app, name) for name in app.SERVICES}
+        app.startServices(":memory:", ":memory:", engineProcesses=1, tablebasePath=None, bookPath=None)
+        cls.server = make_server("127.0.0.1", 0, app.app, threaded=True, request_handler=QuietHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f"http://127.0.0.1:{cls.server.server_port}"
+        # Starts the engine process before anything is timed
+        app.engine.bestMove(Game.from_fen(cls.FEN), Limit(depth=1))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        cls.app.stopServices()
+        for name, service in cls.savedServices.items():
+            setattr(cls.app, name, service)
+
+    def request(self, path, method="GET"):
+        with urllib.request.urlopen(urllib.request.Request(self.url + path, method=method), timeout=10) as response:
+            return json.loads(response.read() or "null")
+
+    def test_cheapRoutesAreServedDuringSearches(self):
+        gameId = self.app.games.add(Game.from_fen(self.FEN))
+        results = {}
+
+        def computerMove():
+            start = time.perf_counter()
+            results["move"] = self.request(f"/game/{gameId}/computer-move", "POST")
+            results["moveSeconds"] = time.perf_counter() - start
+
+        thinking = threading.Thread(target=computerMove)
+        thinking.start()
+        time.sleep(0.1)
+        start = time.perf_counter()
+        board = self.request(f"/game/{gameId}/get-board")
+        boardSeconds = time.perf_counter() - start
+        thinking.join()
+
+        self.assertTrue(results["move"]["move"])
+        self.assertFalse(results["move"]["book"])
+        self.assertGreaterEqual(results["moveSeconds"], self.app.ENGINE_TIME_LIMIT)
+        # Served while the engine was still thinking, not after it
+        self.assertIn("e1", board)
+        self.assertLess(boardSeconds, self.app.ENGINE_TIME_LIMIT / 2)
+
+    def test_gameIsUnlockedWhileTheEngineThinks(self):
+        gameId = self.app.games.add(Game.from_fen(self.FEN))
+        results = {}
+        thinking = threading.Thread(
+            target=lambda: results.update(move=self.request(f"/game/{gameId}/computer-move", "POST"))
+        )
+        thinking.start()
+        time.sleep(0.1)
+        start = time.perf_counter()
+        self.request(f"/game/{gameId}/resign", "POST")
+        resignSeconds = time.perf_counter() - start
+        thinking.join()
+        self.assertLess(resignSeconds, self.app.ENGINE_TIME_LIMIT / 2)
+        # The search result is for a game that has ended since, so no move is played
+        self.assertFalse(results["move"]["move"])
+        self.assertEqual(self.app.games.get(gameId).moveHistory, [])
+
+    def test_importingCreatesNoFiles(self):
+        with tempfile.TemporaryDirectory() as directory:
+            root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            code = "import app; assert app.games is None and app.engine is None"
+            environment = {**os.environ, "PYTHONPATH": root}
+            subprocess.run([sys.executable, "-c", code], cwd=directory, check=True, env=environment)
+            self.assertEqual(os.listdir(directory), [])
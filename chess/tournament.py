@@ -0,0 +1,269 @@
+from chess.game import Game
+from chess.pieces import WHITE, BLACK
+from chess.bitboard import STARTING_FEN
+from chess.engine import best_move, Limit
+from chess.transposition import TranspositionTable
+from chess.ordering import MoveOrderer
+from chess.san import normalizeSan
+from chess.storage import playMove
+from chess.tablebase import Tablebases, adjudicate
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import itertools
+import math
+import multiprocessing
+import os
+import random
+import time
+
+# Games still running after this many plies are stopped and scored as draws
+DEFAULT_MAX_PLIES = 400
+MAX_PLIES = "max-plies"
+# Games reaching a position covered by the endgame tables are scored by the tables
+TABLEBASE = "tablebase"
+# Transposition table per engine player, small because every game builds its own
+PLAYER_TABLE_MEGABYTES = 4
+
+
+# Plays a uniformly random legal move
+class RandomPlayer:
+    def __init__(self, seed=None) -> None:
+        self.random = random.Random(seed)
+
+    def choose(self, game):
+        return self.random.choice(game.legalMoves)
+
+
+# Plays the engine's best move within the limit, with its own table and move history for the game
+class EnginePlayer:
+    def __init__(self, limit, megabytes=PLAYER_TABLE_MEGABYTES, tablebases=None) -> None:
+        self.limit = limit
+        self.table = TranspositionTable(megabytes)
+        self.orderer = MoveOrderer()
+        self.tablebases = tablebases
+
+    def choose(self, game):
+        return best_move(game, self.limit, self.table, self.orderer, self.tablebases)["move"]
+
+
+# Plays the given SAN moves while they last and are legal, then hands over to another player
+class ScriptedPlayer:
+    def __init__(self, moves, fallback) -> None:
+        self.moves = moves
+        self.fallback = fallback
+
+    def choose(self, game):
+        ply = len(game.moveHistory)
+        if ply < len(self.moves):
+            move = game.sanMoves().get(normalizeSan(self.moves[ply]))
+            if move is not None:
+                return move
+        return self.fallback.choose(game)
+
+
+# Builds a player from its spec, specs are strings so they can be sent to worker processes:
+# "random", "engine:depth=2", "engine:nodes=5000,time=0.1" or "script:e4,e5,Nf3:random"
+# Engine players search with the endgame tables when they are given
+def makePlayer(spec, seed=None, tablebases=None):
+    kind, _, options = spec.partition(":")
+    if kind == "random":
+        return RandomPlayer(seed)
+    if kind == "engine":
+        settings = {}
+        for option in filter(None, options.split(",")):
+            name, _, value = option.partition("=")
+            if name not in ("depth", "nodes", "time"):
+                raise ValueError(f"unknown engine option {name!r} in {spec!r}")
+            settings[name] = float(value) if name == "time" else int(value)
+        return EnginePlayer(Limit(**settings) if settings else Limit(depth=2), tablebases=tablebases)
+    if kind == "script":
+        moves, _, fallback = options.partition(":")
+        return ScriptedPlayer(moves.split(","), makePlayer(fallback or "random", seed, tablebases))
+    raise ValueError(f"unknown player {spec!r}")
+
+
+# Plays one game through Game.move and returns its record
+# openingPlies random moves are played first (the same ones for a given seed) so repeated pairings differ
+# With a directory of endgame tables the game stops once the tables know its result
+def playGame(white, black, seed=0, openingPlies=0, maxPlies=DEFAULT_MAX_PLIES, fen=STARTING_FEN, tablebases=None):
+    start = time.perf_counter()
+    game = Game.from_fen(fen)
+    tables = Tablebases(tablebases) if tablebases else None
+    players = {WHITE: makePlayer(white, seed, tables), BLACK: makePlayer(black, seed + 1, tables)}
+    thinking = {WHITE: 0.0, BLACK: 0.0}
+    opening = RandomPlayer(seed)
+    adjudicated = None
+    while game.outcome is None and len(game.moveHistory) < maxPlies:
+        adjudicated = adjudicate(game, tables)
+        if adjudicated is not None:
+            break
+        turn = game.turn
+        moveStart = time.perf_counter()
+        if len(game.moveHistory) < openingPlies:
+            move = opening.choose(game)
+        else:
+            move = players[turn].choose(game)
+        thinking[turn] += time.perf_counter() - moveStart
+        playMove(game, move)
+
+    outcome, reason = game.outcome, game.outcomeReason
+    if adjudicated is not None:
+        outcome, reason = adjudicated, TABLEBASE
+    elif outcome is None:
+        outcome, reason = "draw", MAX_PLIES
+    return {
+        "white": white,
+        "black": black,
+        "seed": seed,
+        "outcome": outcome,
+        "reason": reason,
+        "plies": len(game.moveHistory),
+        "moves": game.moveHistory,
+        "seconds": time.perf_counter() - start,
+        "thinking": {WHITE: thinking[WHITE], BLACK: thinking[BLACK]},
+    }
+
+
+def _playGame(arguments):
+    return playGame(*arguments)
+
+
+# Elo difference for a score fraction, clamped so a perfect score stays finite
+def eloDifference(score, games):
+    limit = 0.5 / max(games, 1)
+    score = min(max(score, limit), 1 - limit)
+    return -400 * math.log10(1 / score - 1)
+
+
+# Elo difference and its 95% margin from a win/draw/loss record
+def eloInterval(wins, draws, losses):
+    games = wins + draws + losses
+    if not games:
+        return 0.0, 0.0
+    score = (wins + 0.5 * draws) / games
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+    spread = 1.96 * math.sqrt(variance / games)
+    low = eloDifference(score - spread, games)
+    high = eloDifference(score + spread, games)
+    return eloDifference(score, games), (high - low) / 2
+
+
+# Ratings for every player from the game records, each player is rated at the average rating of its
+# opponents plus its performance against them, repeated until the ratings settle, centred on zero
+def eloRatings(records, iterations=100):
+    points, played, opponents = Counter(), Counter(), {}
+    for record in records:
+        white, black = record["white"], record["black"]
+        score = 1.0 if record["outcome"] == WHITE else 0.0 if record["outcome"] == BLACK else 0.5
+        points[white] += score
+        points[black] += 1 - score
+        played[white] += 1
+        played[black] += 1
+        opponents.setdefault(white, []).append(black)
+        opponents.setdefault(black, []).append(white)
+
+    ratings = dict.fromkeys(played, 0.0)
+    for _ in range(iterations):
+        ratings = {
+            player: sum(ratings[opponent] for opponent in opponents[player]) / played[player]
+            + eloDifference(points[player] / played[player], played[player])
+            for player in ratings
+        }
+        mean = sum(ratings.values()) / len(ratings)
+        ratings = {player: rating - mean for player, rating in ratings.items()}
+    return ratings
+
+
+# Win/draw/loss, points and Elo for every player, outcome counts by reason and timing
+def summarize(records, seconds):
+    standings = {}
+    for record in records:
+        for color, player in ((WHITE, record["white"]), (BLACK, record["black"])):
+            row = standings.setdefault(player, {"games": 0, "wins": 0, "draws": 0, "losses": 0})
+            row["games"] += 1
+            if record["outcome"] == "draw":
+                row["draws"] += 1
+            elif record["outcome"] == color:
+                row["wins"] += 1
+            else:
+                row["losses"] += 1
+    ratings = eloRatings(records)
+    for player, row in standings.items():
+        row["points"] = row["wins"] + 0.5 * row["draws"]
+        row["elo"] = ratings[player]
+        row["margin"] = eloInterval(row["wins"], row["draws"], row["losses"])[1]
+
+    plies = sum(record["plies"] for record in records)
+    gameSeconds = [record["seconds"] for record in records]
+    return {
+        "games": len(records),
+        "standings": standings,
+        "outcomes": dict(Counter(record["outcome"] for record in records)),
+        "reasons": dict(Counter(record["reason"] for record in records)),
+        "plies": plies,
+        "seconds": seconds,
+        "gamesPerSecond": len(records) / seconds if seconds else 0.0,
+        "pliesPerSecond": plies / seconds if seconds else 0.0,
+        "averageGameSeconds": sum(gameSeconds) / len(records) if records else 0.0,
+        "longestGameSeconds": max(gameSeconds, default=0.0),
+    }
+
+
+# Every pair of players meets in the given number of games, colors alternate and each seed is played
+# from both sides, games are spread over worker processes (processes=1 plays them in this process)
+def runTournament(players, games, processes=None, seed=0, openingPlies=0, maxPlies=DEFAULT_MAX_PLIES,
+                  tablebases=None):
+    if len(players) < 2:
+        raise ValueError("a tournament needs at least two players")
+    schedule = []
+    for first, second in itertools.combinations(players, 2):
+        for index in range(games):
+            gameSeed = seed + 2 * (index // 2)
+            white, black = (first, second) if index % 2 == 0 else (second, first)
+            schedule.append((white, black, gameSeed, openingPlies, maxPlies, STARTING_FEN, tablebases))
+
+    start = time.perf_counter()
+    processes = processes or os.cpu_count() or 1
+    if processes == 1:
+        records = [_playGame(arguments) for arguments in schedule]
+    else:
+        with ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context("spawn")) as executor:
+            records = list(executor.map(_playGame, schedule))
+    return records, summarize(records, time.perf_counter() - start)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Self play tournament between engine configurations")
+    parser.add_argument(
+        "--player", action="append", required=True,
+        help='player spec, e.g. "random", "engine:depth=2", "script:e4,e5:random" (at least two)',
+    )
+    parser.add_argument("--games", type=int, default=10, help="games per pairing")
+    parser.add_argument("--processes", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--opening-plies", type=int, default=0, help="random plies played before the players")
+    parser.add_argument("--max-plies", type=int, default=DEFAULT_MAX_PLIES)
+    parser.add_argument("--tablebases", help="directory of endgame tables used to search and adjudicate")
+    args = parser.parse_args(args)
+
+    records, summary = runTournament(
+        args.player, args.games, args.processes, args.seed, args.opening_plies, args.max_plies, args.tablebases
+    )
+    for player, row in sorted(summary["standings"].items(), key=lambda item: -item[1]["elo"]):
+        print(
+            f"{player:<24} elo {row['elo']:>+7.1f} ± {row['margin']:<6.1f} "
+            f"+{row['wins']} ={row['draws']} -{row['losses']}  points {row['points']}/{row['games']}"
+        )
+    print("outcomes", summary["outcomes"])
+    print("reasons ", summary["reasons"])
+    print(
+        f"games {summary['games']}  plies {summary['plies']}  time {summary['seconds']:.2f}s  "
+        f"games/s {summary['gamesPerSecond']:.2f}  plies/s {summary['pliesPerSecond']:.0f}  "
+        f"average game {summary['averageGameSeconds']:.2f}s  longest {summary['longestGameSeconds']:.2f}s"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
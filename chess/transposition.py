@@ -0,0 +1,128 @@
+from array import array
+
+EXACT = 1
+LOWER = 2
+UPPER = 3
+
+# Every bucket holds two entries of (key, data), each a 64 bit word
+# Slot 0 keeps the deepest search seen for the bucket, slot 1 is always replaced
+ENTRY_WORDS = 2
+BUCKET_WORDS = 2 * ENTRY_WORDS
+BUCKET_BYTES = BUCKET_WORDS * 8
+DEFAULT_MEGABYTES = 16
+
+# data = move (16 bits) | depth (8 bits) << 16 | bound (2 bits) << 24 | score + SCORE_OFFSET << 26
+SCORE_OFFSET = 1 << 20
+MAX_STORED_DEPTH = 255
+
+
+# Fixed size hash table of search results keyed by the Zobrist key of a position
+# Memory is allocated once from a megabyte budget and never grows
+class TranspositionTable:
+    def __init__(self, megabytes=DEFAULT_MEGABYTES) -> None:
+        if megabytes <= 0:
+            raise ValueError("transposition table size must be positive")
+        # Largest power of two number of buckets that fits the budget, so the index is a mask
+        buckets = max(1, int(megabytes * 1024 * 1024) // BUCKET_BYTES)
+        self.buckets = 1 << (buckets.bit_length() - 1)
+        self.mask = self.buckets - 1
+        self.table = array("Q", bytes(self.buckets * BUCKET_BYTES))
+        self.resetStats()
+
+    @property
+    def megabytes(self):
+        return self.buckets * BUCKET_BYTES / (1024 * 1024)
+
+    def resetStats(self):
+        self.probes = 0
+        self.hits = 0
+        self.misses = 0
+        # Probes that found the bucket filled by other positions
+        self.collisions = 0
+        self.stores = 0
+        # Stores that evicted a different position
+        self.overwrites = 0
+
+    def clear(self):
+        self.table = array("Q", bytes(self.buckets * BUCKET_BYTES))
+        self.resetStats()
+
+    # Returns (move, depth, bound, score) stored for the key, or None
+    def probe(self, key):
+        self.probes += 1
+        table = self.table
+        index = (key & self.mask) * BUCKET_WORDS
+        occupied = False
+        for slot in (index, index + ENTRY_WORDS):
+            data = table[slot + 1]
+            if not data:
+                continue
+            if table[slot] == key:
+                self.hits += 1
+                return data & 0xFFFF, (data >> 16) & 0xFF, (data >> 24) & 3, (data >> 26) - SCORE_OFFSET
+            occupied = True
+        self.misses += 1
+        if occupied:
+            self.collisions += 1
+        return None
+
+    # Returns only the best move stored for the key, or None, without touching the statistics
+    def bestMove(self, key):
+        table = self.table
+        index = (key & self.mask) * BUCKET_WORDS
+        for slot in (index, index + ENTRY_WORDS):
+            if table[slot] == key and table[slot + 1]:
+                return table[slot + 1] & 0xFFFF or None
+        return None
+
+    def store(self, key, depth, bound, score, move=None):
+        self.stores += 1
+        depth = max(0, min(depth, MAX_STORED_DEPTH))
+        data = (move or 0) | depth << 16 | bound << 24 | (score + SCORE_OFFSET) << 26
+
+        table = self.table
+        index = (key & self.mask) * BUCKET_WORDS
+        deepKey, deepData = table[index], table[index + 1]
+        if not deepData or deepKey == key or depth >= (deepData >> 16) & 0xFF:
+            slot = index
+            # The depth preferred entry moves down to the always replace slot instead of being lost
+            if deepData and deepKey != key:
+                self.evict(index + ENTRY_WORDS, key)
+                table[index + ENTRY_WORDS], table[index + ENTRY_WORDS + 1] = deepKey, deepData
+        else:
+            slot = index + ENTRY_WORDS
+            self.evict(slot, key)
+        # Keep the known best move if this search did not produce one
+        if not move and table[slot] == key:
+            data |= table[slot + 1] & 0xFFFF
+        table[slot], table[slot + 1] = key, data
+
+    def evict(self, slot, key=None):
+        if self.table[slot + 1] and self.table[slot] != key:
+            self.overwrites += 1
+
+    # Share of entries in use, sampled from the first buckets
+    def usage(self, sample=1000):
+        count = min(sample, self.buckets)
+        table = self.table
+        used = sum(
+            1
+            for bucket in range(count)
+            for slot in (0, ENTRY_WORDS)
+            if table[bucket * BUCKET_WORDS + slot + 1]
+        )
+        return used / (2 * count)
+
+    def stats(self):
+        return {
+            "megabytes": self.megabytes,
+            "entries": 2 * self.buckets,
+            "probes": self.probes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "collisions": self.collisions,
+            "stores": self.stores,
+            "overwrites": self.overwrites,
+            "hitRate": self.hits / self.probes if self.probes else 0.0,
+            "usage": self.usage(),
+        }
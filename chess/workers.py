@@ -0,0 +1,81 @@
+from chess.bitboard import Position
+from chess.engine import searchPosition, describeSearch, Limit
+from chess.transposition import TranspositionTable, DEFAULT_MEGABYTES
+from chess.ordering import MoveOrderer
+from chess.tablebase import Tablebases
+from chess.errors import GameOverError
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+
+# Search state of a worker process, kept between the searches it runs
+workerTable = None
+workerOrderer = None
+workerTablebases = None
+
+
+# Runs once in every worker process, the tablebase files are memory mapped so workers share them
+def startWorker(megabytes, tablebaseDirectory=None):
+    global workerTable, workerOrderer, workerTablebases
+    workerTable = TranspositionTable(megabytes)
+    workerOrderer = MoveOrderer()
+    workerTablebases = Tablebases(tablebaseDirectory) if tablebaseDirectory else None
+
+
+# Runs in a worker process, positions are sent as FEN with the keys of earlier positions for repetitions
+def searchWorker(fen, seenKeys, limit):
+    return searchPosition(Position.fromFen(fen), seenKeys, limit, workerTable, workerOrderer, workerTablebases)
+
+
+# Engine searches in a pool of processes, so a search never holds the web server's interpreter
+# Workers are spawned rather than forked because the server has threads running, every worker
+# keeps its own transposition table and move history of megabytes each
+# tablebaseDirectory is an optional directory of endgame tables (python -m chess.tablebase generate)
+class EnginePool:
+    def __init__(self, processes=None, megabytes=DEFAULT_MEGABYTES, tablebaseDirectory=None) -> None:
+        self.processes = processes or os.cpu_count() or 1
+        self.megabytes = megabytes
+        self.tablebaseDirectory = tablebaseDirectory
+        self.executor = ProcessPoolExecutor(
+            self.processes,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=startWorker,
+            initargs=(megabytes, tablebaseDirectory),
+        )
+        self.submitted = 0
+        # Results dropped because the game moved on while the search ran
+        self.stale = 0
+
+    # Starts a search of the game's current position, returns a concurrent.futures.Future of the raw result
+    def submit(self, game, limit=None):
+        if game.outcome is not None:
+            raise GameOverError(game.outcome)
+        self.submitted += 1
+        return self.executor.submit(
+            searchWorker, game.position.toFen(), list(game.positionHistory), Limit.parse(limit)
+        )
+
+    # Best move for the game like engine.best_move, blocking until the worker is done
+    def bestMove(self, game, limit=None):
+        key = game.position.key
+        result = self.submit(game, limit).result()
+        return self.describe(game, key, result)
+
+    # Returns None when the searched position is no longer the game's position
+    def describe(self, game, key, result):
+        if game.position.key != key or game.outcome is not None:
+            self.stale += 1
+            return None
+        return describeSearch(game, result)
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait, cancel_futures=True)
+
+    def stats(self):
+        return {
+            "processes": self.processes,
+            "megabytes": self.megabytes,
+            "tablebases": self.tablebaseDirectory,
+            "submitted": self.submitted,
+            "stale": self.stale,
+        }